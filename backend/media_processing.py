@@ -0,0 +1,76 @@
+"""Image derivatives for the media store.
+
+Runs inside worker processes, so it only depends on Pillow and the standard
+library and never touches the database or the event loop.
+"""
+import base64
+import hashlib
+import io
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+from PIL import Image, ImageFilter, ImageOps, features
+
+# Common display widths, from low-end Android sticks up to 4K TVs
+VARIANT_WIDTHS = (640, 1280, 1920, 3840)
+VARIANT_QUALITY = {"webp": 80, "avif": 60}
+PLACEHOLDER_WIDTH = 24
+
+def available_formats() -> List[str]:
+    return [fmt for fmt in ("avif", "webp") if features.check(fmt)]
+
+def _store(media_dir: Path, contents: bytes) -> str:
+    digest = hashlib.sha256(contents).hexdigest()
+    path = media_dir / digest[:2] / digest
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{digest}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(contents)
+        os.replace(tmp_path, path)
+    return digest
+
+def _placeholder(image: Image.Image) -> str:
+    """A few hundred bytes of blurred preview, inlined as a data URL"""
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    small = image.convert("RGB").resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR)
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    small.save(buffer, "WEBP", quality=40)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+def render_derivatives(media_dir: str, source_digest: str) -> Dict:
+    """Resize and re-encode one stored image; returns the placeholder and variant list"""
+    media_dir = Path(media_dir)
+    with Image.open(media_dir / source_digest[:2] / source_digest) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        image.load()
+
+    # Never upscale; the original width stands in for the larger steps
+    widths = sorted({min(width, image.width) for width in VARIANT_WIDTHS})
+    variants = []
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt in available_formats():
+            buffer = io.BytesIO()
+            resized.save(buffer, fmt.upper(), quality=VARIANT_QUALITY[fmt])
+            contents = buffer.getvalue()
+            variants.append({
+                "hash": _store(media_dir, contents),
+                "width": width,
+                "height": height,
+                "format": fmt,
+                "content_type": f"image/{fmt}",
+                "size": len(contents)
+            })
+
+    return {
+        "width": image.width,
+        "height": image.height,
+        "placeholder": _placeholder(image),
+        "variants": variants
+    }
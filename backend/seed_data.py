@@ -2,12 +2,14 @@
 Seed initial data for mosque display system
 """
 import asyncio
+import bcrypt
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import sys
 from datetime import datetime, timezone
 import uuid
 
-async def seed_database():
+async def seed_database(mosque_id: str):
     # Connect to MongoDB
     mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
     db_name = os.environ.get('DB_NAME', 'test_database')
@@ -15,34 +17,37 @@ async def seed_database():
     client = AsyncIOMotorClient(mongo_url)
     db = client[db_name]
     
-    print("🌱 Seeding database...")
+    print(f"🌱 Seeding database for mosque {mosque_id}...")
     
     # Seed Announcements
     announcements = [
         {
             "id": str(uuid.uuid4()),
+            "mosque_id": mosque_id,
             "text": "Juma'ah Prayer starts at 1:00 PM this Friday. Please arrive early.",
             "priority": 3,
             "active": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         {
             "id": str(uuid.uuid4()),
+            "mosque_id": mosque_id,
             "text": "Ramadan Night: Special Taraweeh prayers will be held every night at 8:30 PM",
             "priority": 2,
             "active": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         {
             "id": str(uuid.uuid4()),
+            "mosque_id": mosque_id,
             "text": "Islamic Studies Class for children every Saturday at 9:00 AM",
             "priority": 1,
             "active": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
     ]
     
-    await db.announcements.delete_many({})
+    await db.announcements.delete_many({"mosque_id": mosque_id})
     await db.announcements.insert_many(announcements)
     print(f"✓ Added {len(announcements)} announcements")
     
@@ -50,77 +55,79 @@ async def seed_database():
     quran_verses = [
         {
             "id": str(uuid.uuid4()),
+            "mosque_id": mosque_id,
             "arabic": "اللَّهُ لَا إِلَٰهَ إِلَّا هُوَ الْحَيُّ الْقَيُّومُ",
             "translation": "Allah - there is no deity except Him, the Ever-Living, the Sustainer of existence.",
             "reference": "Surah Al-Baqarah 2:255 (Ayat al-Kursi)",
             "active": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         {
             "id": str(uuid.uuid4()),
+            "mosque_id": mosque_id,
             "arabic": "رَبَّنَا آتِنَا فِي الدُّنْيَا حَسَنَةً وَفِي الْآخِرَةِ حَسَنَةً وَقِنَا عَذَابَ النَّارِ",
             "translation": "Our Lord, give us in this world good and in the Hereafter good and protect us from the punishment of the Fire.",
             "reference": "Surah Al-Baqarah 2:201",
             "active": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         {
             "id": str(uuid.uuid4()),
+            "mosque_id": mosque_id,
             "arabic": "إِنَّ مَعَ الْعُسْرِ يُسْرًا",
             "translation": "Indeed, with hardship comes ease.",
             "reference": "Surah Ash-Sharh 94:6",
             "active": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         {
             "id": str(uuid.uuid4()),
+            "mosque_id": mosque_id,
             "arabic": "فَاذْكُرُونِي أَذْكُرْكُمْ وَاشْكُرُوا لِي وَلَا تَكْفُرُونِ",
             "translation": "So remember Me; I will remember you. And be grateful to Me and do not deny Me.",
             "reference": "Surah Al-Baqarah 2:152",
             "active": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
     ]
     
-    await db.quran_verses.delete_many({})
+    await db.quran_verses.delete_many({"mosque_id": mosque_id})
     await db.quran_verses.insert_many(quran_verses)
     print(f"✓ Added {len(quran_verses)} Quran verses")
     
-    # Seed Financial Reports
-    financial_reports = [
-        {
-            "id": str(uuid.uuid4()),
-            "title": "Monthly Donations",
-            "amount": 25450.00,
-            "period": "November 2025",
-            "description": "Total donations received from congregation",
-            "created_at": datetime.now(timezone.utc).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "title": "Utility Expenses",
-            "amount": 3200.00,
-            "period": "November 2025",
-            "description": "Electricity, water, and maintenance",
-            "created_at": datetime.now(timezone.utc).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "title": "Zakat Collection",
-            "amount": 18750.00,
-            "period": "November 2025",
-            "description": "Zakat funds collected and distributed",
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
+    # Seed Financial Reports: a ledger where each week opens with the previous week's balance
+    weeks = [
+        ("Pekan 1 November 2025", "2025-11-07", 25450.00, 3200.00),
+        ("Pekan 2 November 2025", "2025-11-14", 18750.00, 4100.00),
+        ("Pekan 3 November 2025", "2025-11-21", 21300.00, 2750.00)
     ]
+    financial_reports = []
+    balance = 0.0
+    for seq, (period, entry_date, infaq, pengeluaran) in enumerate(weeks, start=1):
+        financial_reports.append({
+            "id": str(uuid.uuid4()),
+            "mosque_id": mosque_id,
+            "saldo_pekan_lalu": balance,
+            "infaq_pekan_ini": infaq,
+            "pengeluaran": pengeluaran,
+            "saldo_pekan_ini": balance + infaq - pengeluaran,
+            "period": period,
+            "seq": seq,
+            "entry_date": entry_date,
+            "created_at": datetime.now(timezone.utc)
+        })
+        balance += infaq - pengeluaran
     
-    await db.financial_reports.delete_many({})
+    await db.financial_reports.delete_many({"mosque_id": mosque_id})
     await db.financial_reports.insert_many(financial_reports)
+    # The server rebuilds a mosque's rollups at startup when it has none
+    await db.financial_rollups.delete_many({"mosque_id": mosque_id})
     print(f"✓ Added {len(financial_reports)} financial reports")
     
     # Seed default mosque settings
     default_settings = {
         "id": str(uuid.uuid4()),
+        "mosque_id": mosque_id,
         "mosque_name": "Masjid Al-Noor",
         "latitude": 3.139,
         "longitude": 101.6869,
@@ -135,15 +142,32 @@ async def seed_database():
         },
         "theme": "midnight",
         "background_image": "",
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "admin_password": bcrypt.hashpw(
+            os.environ.get("ADMIN_PASSWORD", "admin123").encode("utf-8"), bcrypt.gensalt()
+        ).decode("ascii"),
+        "updated_at": datetime.now(timezone.utc)
     }
     
-    await db.mosque_settings.delete_many({})
+    await db.mosque_settings.delete_many({"mosque_id": mosque_id})
     await db.mosque_settings.insert_one(default_settings)
-    print("✓ Added default mosque settings")
+    print("✓ Added mosque settings")
+    
+    # Bump the shared content versions so running servers drop cached settings and ETags
+    await db.content_versions.update_one(
+        {"_id": "content"},
+        {
+            "$inc": {f"tenants.{mosque_id}.{name}": 1
+                     for name in ("settings", "announcements", "quran_verses", "financial_reports")},
+            "$setOnInsert": {"epoch": uuid.uuid4().hex[:8]}
+        },
+        upsert=True
+    )
+    print("✓ Bumped content versions")
     
     print("\\n✅ Database seeded successfully!")
     client.close()
 
 if __name__ == "__main__":
-    asyncio.run(seed_database())
+    # A mosque other than the default can only be read or administered once it
+    # has settings, so seeding is also how a new mosque is provisioned
+    asyncio.run(seed_database(sys.argv[1] if len(sys.argv) > 1 else os.environ.get("DEFAULT_MOSQUE_ID", "default")))
@@ -1,17 +1,47 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, Request, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+import bson
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
 from typing import List, Optional, Dict
 import uuid
-from datetime import datetime, timezone, timedelta
+import asyncio
+import base64
+import codecs
+import gzip
+import csv
+import io
+import hashlib
+import hmac
+import json
+import orjson
+import re
+import secrets
+from urllib.parse import unquote
+import time
+import numpy as np
+from datetime import date, datetime, timezone, timedelta
 from hijri_converter import Hijri, Gregorian
 import pytz
 import httpx
+import bcrypt
+import jwt
+from bisect import bisect_right
+from collections import OrderedDict
+from pymongo import ASCENDING, DESCENDING, DeleteOne, IndexModel, ReplaceOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from concurrent.futures import ProcessPoolExecutor
+from media_processing import render_derivatives
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -26,24 +56,41 @@ settings_collection = db.get_collection("mosque_settings")
 announcements_collection = db.get_collection("announcements")
 quran_verses_collection = db.get_collection("quran_verses")
 financial_reports_collection = db.get_collection("financial_reports")
+financial_rollups_collection = db.get_collection("financial_rollups")
+prayer_schedules_collection = db.get_collection("prayer_schedules")
+content_versions_collection = db.get_collection("content_versions")
+media_collection = db.get_collection("media")
+
+# Every settings, announcement, verse and report document belongs to one mosque;
+# requests that name no mosque use this one
+DEFAULT_MOSQUE_ID = os.environ.get("DEFAULT_MOSQUE_ID", "default")
+
+# Naive datetimes read from MongoDB are UTC; all are written with a Z suffix like pydantic's
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+class FastJSONResponse(JSONResponse):
+    """JSON rendered by orjson, which handles datetimes and numpy values natively"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # ============== MODELS ==============
 
-class MosqueSettings(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    mosque_name: str = "Masjid Al-Noor"
-    mosque_address: str = "Jl. Contoh No. 123, Kota Malang"
-    mosque_logo: str = ""
-    city_name: str = "Malang"
+# Settings views: each hot path loads only the fields its view declares, so
+# coordinates or a password never come with the display content
+class LocationSettings(BaseModel):
+    """Prayer times, schedules and weather"""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+    mosque_id: str = DEFAULT_MOSQUE_ID
     latitude: float = 3.139
     longitude: float = 101.6869
     timezone: str = "Asia/Kuala_Lumpur"
     calculation_method: str = "ISNA"
+    asr_school: str = "SHAFI"
     use_manual_times: bool = False
     manual_prayer_times: Optional[Dict[str, str]] = None
     imsya_offset: int = 10
@@ -54,10 +101,25 @@ class MosqueSettings(BaseModel):
         "maghrib": 5,
         "isha": 10
     })
+
+class AuthSettings(BaseModel):
+    """Admin password check"""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+    mosque_id: str = DEFAULT_MOSQUE_ID
+    admin_password: str = "admin123"
+
+class DisplaySettings(LocationSettings):
+    """Everything the display renders; never the password"""
+    mosque_name: str = "Masjid Al-Noor"
+    mosque_address: str = "Jl. Contoh No. 123, Kota Malang"
+    mosque_logo: str = ""
+    city_name: str = "Malang"
     theme: str = "midnight"
     background_image: str = ""
     makkah_embed_url: str = ""
-    admin_password: str = "admin123"
+
+class MosqueSettings(DisplaySettings, AuthSettings):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class MosqueSettingsUpdate(BaseModel):
@@ -69,6 +131,7 @@ class MosqueSettingsUpdate(BaseModel):
     longitude: Optional[float] = None
     timezone: Optional[str] = None
     calculation_method: Optional[str] = None
+    asr_school: Optional[str] = None
     use_manual_times: Optional[bool] = None
     manual_prayer_times: Optional[Dict[str, str]] = None
     imsya_offset: Optional[int] = None
@@ -96,9 +159,40 @@ class PrayerTimesResponse(BaseModel):
     is_iqomah_countdown: bool
     iqomah_times: Dict[str, str]
 
+class PrayerEvent(BaseModel):
+    prayer: str
+    phase: str  # adhan, iqomah, imsya or syuruq
+    at: int  # UTC epoch seconds
+    local_time: str
+
+class PrayerTimelineResponse(BaseModel):
+    generated_at: int
+    timezone: str
+    events: List[PrayerEvent]
+
+class PrayerScheduleDay(BaseModel):
+    date: str
+    hijri_date: str
+    fajr: str
+    imsya: str
+    syuruq: str
+    dhuhr: str
+    asr: str
+    maghrib: str
+    isha: str
+
+class PrayerTimesRangeResponse(BaseModel):
+    latitude: float
+    longitude: float
+    timezone: str
+    calculation_method: str
+    asr_school: str
+    days: List[PrayerScheduleDay]
+
 class Announcement(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    mosque_id: str = DEFAULT_MOSQUE_ID
     text: str
     priority: int = 1
     active: bool = True
@@ -112,6 +206,7 @@ class AnnouncementCreate(BaseModel):
 class QuranVerse(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    mosque_id: str = DEFAULT_MOSQUE_ID
     arabic: str
     translation: str
     reference: str
@@ -127,408 +222,2475 @@ class QuranVerseCreate(BaseModel):
 class FinancialReport(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    mosque_id: str = DEFAULT_MOSQUE_ID
     saldo_pekan_lalu: float = 0.0
     infaq_pekan_ini: float = 0.0
     pengeluaran: float = 0.0
     saldo_pekan_ini: float = 0.0
     period: str = ""
+    seq: int = 0
+    entry_date: str = ""
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class FinancialReportCreate(BaseModel):
-    saldo_pekan_lalu: float
+    # Carried over from the previous entry when omitted; set it for the opening balance
+    saldo_pekan_lalu: Optional[float] = None
     infaq_pekan_ini: float
     pengeluaran: float
     period: str = ""
+    entry_date: Optional[date] = None
+
+class FinancialRollup(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    period: str
+    key: str
+    infaq_total: float = 0.0
+    pengeluaran_total: float = 0.0
+    entries: int = 0
+    opening_balance: float = 0.0
+    closing_balance: float = 0.0
+
+class FinancialSummary(BaseModel):
+    balance: float
+    latest: Optional[FinancialReport] = None
+    month: Optional[FinancialRollup] = None
+    year: Optional[FinancialRollup] = None
+
+class DisplayBundle(BaseModel):
+    version: str
+    prayer_times: PrayerTimesResponse
+    timeline: List[PrayerEvent]
+    settings: Dict
+    announcements: List[Dict]
+    quran_verses: List[Dict]
+    financial_reports: List[Dict]
+    weather: Optional[Dict] = None
+    media_placeholders: Dict[str, str] = {}
+
+# ============== UPSTREAM HTTP CLIENT ==============
+
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "3.0"))
+UPSTREAM_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS_PER_HOST", "10"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30"))
+
+ALADHAN_API_URL = os.environ.get("ALADHAN_API_URL", "http://api.aladhan.com")
+OPENWEATHER_API_URL = os.environ.get("OPENWEATHER_API_URL", "http://api.openweathermap.org")
+OPENWEATHER_API_KEY = os.environ.get("OPENWEATHER_API_KEY", "895284fb2d2c50a520ea537456963d9c")  # Free demo key
+
+# App-lifetime client shared by all upstream calls (created on startup)
+http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared pooled HTTP client, creating it on first use"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=min(UPSTREAM_TIMEOUT, 2.0)),
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS_PER_HOST * 2,
+                max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS_PER_HOST * 2
+            )
+        )
+    return http_client
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream errors, probing again after a cool-down"""
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing):
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        if state == "half_open":
+            # Let exactly one request through to probe the upstream
+            self._probing = True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logging.info(f"{self.name} circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                logging.warning(f"{self.name} circuit opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key onto one in-flight task"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[tuple, asyncio.Task] = {}
+
+    async def run(self, key: tuple, func, *args):
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(func(*args))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shield so one cancelled caller does not cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+class UpstreamService:
+    """One upstream host: shared client, per-host concurrency limit, circuit breaker and request coalescing"""
+
+    def __init__(self, name: str, base_url: str):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.breaker = CircuitBreaker(name)
+        self.flights = SingleFlight(name)
+        self._slots = asyncio.Semaphore(UPSTREAM_MAX_CONNECTIONS_PER_HOST)
+
+    async def get_json(self, path: str, params: Dict) -> Dict:
+        self.breaker.before_call()
+        try:
+            async with self._slots:
+                response = await get_http_client().get(f"{self.base_url}{path}", params=params)
+            response.raise_for_status()
+            data = response.json()
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return data
+
+aladhan_service = UpstreamService("aladhan", ALADHAN_API_URL)
+openweather_service = UpstreamService("openweather", OPENWEATHER_API_URL)
 
 # ============== PRAYER TIMES SERVICE ==============
 
-async def calculate_prayer_times_aladhan(latitude: float, longitude: float, tz_str: str, method: str = "ISNA", imsya_offset: int = 10) -> Dict:
-    """Calculate prayer times using Aladhan API"""
-    try:
-        tz = pytz.timezone(tz_str)
-        now = datetime.now(tz)
-        
-        # Method mapping
-        method_map = {
-            "ISNA": 2,  # Islamic Society of North America
-            "MWL": 3,   # Muslim World League
-            "EGYPTIAN": 5,  # Egyptian General Authority
-            "KARACHI": 1,   # University of Islamic Sciences, Karachi
-            "MAKKAH": 4,    # Umm Al-Qura University, Makkah
-            "TEHRAN": 7     # Institute of Geophysics, University of Tehran
-        }
-        
-        method_num = method_map.get(method, 2)
-        
-        # Call Aladhan API
-        url = f"http://api.aladhan.com/v1/timings/{int(now.timestamp())}"
-        params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "method": method_num,
-            "school": 0  # Shafi (for Indonesia)
+# Twilight angles in degrees below the horizon for each calculation method.
+# "isha_minutes" replaces the Isha angle with a fixed interval after Maghrib,
+# and "maghrib" replaces sunset with a twilight angle.
+CALCULATION_METHODS = {
+    "ISNA": {"fajr": 15.0, "isha": 15.0},
+    "MWL": {"fajr": 18.0, "isha": 17.0},
+    "EGYPTIAN": {"fajr": 19.5, "isha": 17.5},
+    "KARACHI": {"fajr": 18.0, "isha": 18.0},
+    "MAKKAH": {"fajr": 18.5, "isha_minutes": 90},
+    "TEHRAN": {"fajr": 17.7, "isha": 14.0, "maghrib": 4.5}
+}
+
+# Shadow length factor for Asr (Shafi = 1x object length, Hanafi = 2x)
+ASR_SHADOW_FACTORS = {
+    "SHAFI": 1,
+    "HANAFI": 2
+}
+
+# Sun's apparent radius plus atmospheric refraction at the horizon
+SUNRISE_ANGLE = 0.833
+
+PRAYER_NAMES = ["fajr", "dhuhr", "asr", "maghrib", "isha"]
+
+def _dsin(d):
+    return np.sin(np.radians(d))
+
+def _dcos(d):
+    return np.cos(np.radians(d))
+
+def _fix_hour(h):
+    return np.mod(h, 24.0)
+
+def _sun_position(jd):
+    """Return (declination in degrees, equation of time in hours)"""
+    d = jd - 2451545.0
+    g = np.mod(357.529 + 0.98560028 * d, 360.0)
+    q = np.mod(280.459 + 0.98564736 * d, 360.0)
+    lon = np.mod(q + 1.915 * _dsin(g) + 0.020 * _dsin(2 * g), 360.0)
+    obliquity = 23.439 - 0.00000036 * d
+    ra = np.degrees(np.arctan2(_dcos(obliquity) * _dsin(lon), _dcos(lon))) / 15.0
+    equation_of_time = q / 15.0 - _fix_hour(ra)
+    declination = np.degrees(np.arcsin(_dsin(obliquity) * _dsin(lon)))
+    return declination, equation_of_time
+
+def _method_parameters(methods) -> Dict[str, np.ndarray]:
+    """Expand an array of method names into per-element angle arrays (NaN = unused)"""
+    methods = np.asarray(methods)
+    if methods.ndim == 0:
+        names, inverse = [methods.item()], np.zeros(1, dtype=np.int64)
+    else:
+        names, inverse = np.unique(methods, return_inverse=True)
+    columns = {"fajr": [], "isha": [], "isha_minutes": [], "maghrib": []}
+    for name in names:
+        params = CALCULATION_METHODS.get(str(name), CALCULATION_METHODS["ISNA"])
+        columns["fajr"].append(params["fajr"])
+        columns["isha"].append(params.get("isha", np.nan))
+        columns["isha_minutes"].append(params.get("isha_minutes", np.nan))
+        columns["maghrib"].append(params.get("maghrib", SUNRISE_ANGLE))
+    shape = np.shape(methods)
+    return {key: np.asarray(values, dtype=float)[inverse].reshape(shape) for key, values in columns.items()}
+
+def compute_prayer_times_batch(days, latitudes, longitudes, utc_offsets, methods="ISNA", asr_schools="SHAFI") -> Dict[str, np.ndarray]:
+    """Compute prayer times for arrays of dates and locations as fractional local hours.
+
+    All arguments are broadcast against each other, so a column of dates and
+    a row of locations yields a full dates x locations table. Solar position
+    follows the US Naval Observatory approximation used by praytimes.org,
+    evaluated once at each prayer's approximate time. Fajr and Isha fall back
+    to the angle-based rule when twilight never ends (high latitudes).
+    """
+    days = np.asarray(days, dtype="datetime64[D]")
+    days, latitudes, longitudes, utc_offsets, methods, asr_schools = np.broadcast_arrays(
+        days, np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float),
+        np.asarray(utc_offsets, dtype=float), np.asarray(methods), np.asarray(asr_schools)
+    )
+    params = _method_parameters(methods)
+    shadow_factors = np.where(asr_schools == "HANAFI", ASR_SHADOW_FACTORS["HANAFI"], ASR_SHADOW_FACTORS["SHAFI"])
+
+    # Julian day at 00:00 UTC, shifted to local solar midnight
+    jd = days.astype(np.int64) + 2440587.5 - longitudes / (15.0 * 24.0)
+
+    def mid_day(hour):
+        _, equation_of_time = _sun_position(jd + hour / 24.0)
+        return _fix_hour(12.0 - equation_of_time)
+
+    def sun_angle_time(angle, hour, before_noon=False):
+        declination, _ = _sun_position(jd + hour / 24.0)
+        noon = mid_day(hour)
+        cos_t = (-_dsin(angle) - _dsin(declination) * _dsin(latitudes)) / (_dcos(declination) * _dcos(latitudes))
+        cos_t = np.where(np.abs(cos_t) <= 1.0, cos_t, np.nan)
+        t = np.degrees(np.arccos(cos_t)) / 15.0
+        return noon - t if before_noon else noon + t
+
+    def asr_time(hour):
+        declination, _ = _sun_position(jd + hour / 24.0)
+        angle = -np.degrees(np.arctan(1.0 / (shadow_factors + np.tan(np.radians(np.abs(latitudes - declination))))))
+        return sun_angle_time(angle, hour)
+
+    with np.errstate(invalid="ignore"):
+        times = {
+            "fajr": sun_angle_time(params["fajr"], 5.0, before_noon=True),
+            "sunrise": sun_angle_time(SUNRISE_ANGLE, 6.0, before_noon=True),
+            "dhuhr": mid_day(12.0),
+            "asr": asr_time(13.0),
+            "sunset": sun_angle_time(SUNRISE_ANGLE, 18.0),
+            "maghrib": sun_angle_time(params["maghrib"], 18.0),
+            "isha": sun_angle_time(params["isha"], 18.0)
         }
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, params=params)
-            data = response.json()
-        
-        if data.get("code") == 200:
-            timings = data["data"]["timings"]
-            
-            # Extract prayer times
-            fajr_time = timings["Fajr"][:5]  # Get HH:MM only
-            sunrise_time = timings["Sunrise"][:5]
-            dhuhr_time = timings["Dhuhr"][:5]
-            asr_time = timings["Asr"][:5]
-            maghrib_time = timings["Maghrib"][:5]
-            isha_time = timings["Isha"][:5]
-            
-            # Calculate Imsya
-            fajr_dt = datetime.strptime(fajr_time, "%H:%M")
-            imsya_dt = fajr_dt - timedelta(minutes=imsya_offset)
-            imsya_time = imsya_dt.strftime("%H:%M")
-            
-            # Convert Gregorian to Hijri
-            hijri_date = Gregorian(now.year, now.month, now.day).to_hijri()
-            hijri_str = f"{hijri_date.day} {hijri_date.month_name()} {hijri_date.year}"
-            
-            logging.info(f"Aladhan API: Fajr {fajr_time}, Dhuhr {dhuhr_time}, Maghrib {maghrib_time}")
-            
-            return {
-                "fajr": fajr_time,
-                "imsya": imsya_time,
-                "sunrise": sunrise_time,
-                "dhuhr": dhuhr_time,
-                "asr": asr_time,
-                "maghrib": maghrib_time,
-                "isha": isha_time,
-                "gregorian_date": now.strftime("%A, %d %B %Y"),
-                "hijri_date": hijri_str,
-                "current_time": now.strftime("%H:%M:%S")
-            }
-        else:
-            raise Exception("Aladhan API returned error")
-            
-    except Exception as e:
-        logging.error(f"Error fetching prayer times from Aladhan API: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        # Fallback to default times
-        tz = pytz.timezone(tz_str)
-        now = datetime.now(tz)
-        hijri_date = Gregorian(now.year, now.month, now.day).to_hijri()
-        
-        fajr_dt = datetime.strptime("04:30", "%H:%M")
-        imsya_dt = fajr_dt - timedelta(minutes=imsya_offset)
-        imsya_time = imsya_dt.strftime("%H:%M")
-        
-        return {
-            "fajr": "04:30",
-            "imsya": imsya_time,
-            "sunrise": "05:45",
-            "dhuhr": "11:45",
-            "asr": "15:15",
-            "maghrib": "17:45",
-            "isha": "19:00",
-            "gregorian_date": now.strftime("%A, %d %B %Y"),
+
+        # Shift from local solar time to the requested UTC offset
+        adjustment = utc_offsets - longitudes / 15.0
+        times = {name: value + adjustment for name, value in times.items()}
+
+        uses_isha_minutes = ~np.isnan(params["isha_minutes"])
+        times["isha"] = np.where(uses_isha_minutes, times["maghrib"] + params["isha_minutes"] / 60.0, times["isha"])
+
+        # High-latitude adjustment: cap Fajr/Isha at a night portion of angle / 60
+        night = _fix_hour(times["sunrise"] - times["sunset"])
+        portion = params["fajr"] / 60.0 * night
+        too_long = np.isnan(times["fajr"]) | (_fix_hour(times["sunrise"] - times["fajr"]) > portion)
+        times["fajr"] = np.where(too_long, times["sunrise"] - portion, times["fajr"])
+        portion = params["isha"] / 60.0 * night
+        too_long = ~uses_isha_minutes & (np.isnan(times["isha"]) | (_fix_hour(times["isha"] - times["sunset"]) > portion))
+        times["isha"] = np.where(too_long, times["sunset"] + portion, times["isha"])
+
+    return times
+
+# "HH:MM" label for every minute of the day, indexed by minute number
+MINUTE_LABELS = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(1440)])
+
+def format_prayer_times(hours) -> np.ndarray:
+    """Format an array of fractional hours as HH:MM, rounded to the nearest minute"""
+    minutes = (_fix_hour(np.asarray(hours) + 0.5 / 60.0) * 60).astype(np.int64) % 1440
+    return MINUTE_LABELS[minutes]
+
+def utc_offsets_for_days(days, tz_str: str) -> np.ndarray:
+    """UTC offset in hours at local noon of each day, honouring DST transitions"""
+    tz = pytz.timezone(tz_str)
+    offsets = [
+        tz.localize(datetime.combine(day, datetime.min.time()) + timedelta(hours=12)).utcoffset().total_seconds() / 3600.0
+        for day in np.asarray(days, dtype="datetime64[D]").astype(date).ravel()
+    ]
+    return np.asarray(offsets).reshape(np.shape(days))
+
+def calculate_prayer_times_range(start: date, end: date, latitude: float, longitude: float, tz_str: str, method: str = "ISNA", imsya_offset: int = 10, asr_school: str = "SHAFI") -> List[Dict[str, str]]:
+    """Calculate one row of prayer times per day from start to end inclusive"""
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+    offsets = utc_offsets_for_days(days, tz_str)
+    hours = compute_prayer_times_batch(days, latitude, longitude, offsets, method, asr_school)
+    hours["imsya"] = hours["fajr"] - imsya_offset / 60.0
+    labels = {name: format_prayer_times(value).tolist() for name, value in hours.items()}
+
+    rows = []
+    for i, day in enumerate(days.astype(date).tolist()):
+        hijri_date = Gregorian(day.year, day.month, day.day).to_hijri()
+        rows.append({
+            "date": day.isoformat(),
             "hijri_date": f"{hijri_date.day} {hijri_date.month_name()} {hijri_date.year}",
-            "current_time": now.strftime("%H:%M:%S")
-        }
+            "fajr": labels["fajr"][i],
+            "imsya": labels["imsya"][i],
+            "syuruq": labels["sunrise"][i],
+            "dhuhr": labels["dhuhr"][i],
+            "asr": labels["asr"][i],
+            "maghrib": labels["maghrib"][i],
+            "isha": labels["isha"][i]
+        })
+    return rows
 
-def get_next_prayer_info(prayer_times: Dict, iqomah_delays: Dict[str, int]) -> Dict:
-    """Calculate next prayer and time remaining, or iqomah countdown if within prayer time"""
-    prayer_names = ["fajr", "dhuhr", "asr", "maghrib", "isha"]
-    
-    # Parse current time with full datetime
-    current_str = prayer_times["current_time"]  # Format: HH:MM:SS
-    now_dt = datetime.strptime(current_str, "%H:%M:%S")
-    today = datetime.today().date()
-    now_full = datetime.combine(today, now_dt.time())
-    
-    # Check if we're in iqomah period (between adhan and iqomah)
-    for prayer in prayer_names:
-        try:
-            adhan_str = prayer_times[prayer]  # Format: HH:MM
-            adhan_time = datetime.strptime(adhan_str, "%H:%M").time()
-            adhan_dt = datetime.combine(today, adhan_time)
-            
-            delay = iqomah_delays.get(prayer, 10)
-            iqomah_dt = adhan_dt + timedelta(minutes=delay)
-            
-            # If current time is between adhan and iqomah
-            if adhan_dt <= now_full < iqomah_dt:
-                diff_seconds = (iqomah_dt - now_full).total_seconds()
-                return {
-                    "prayer": prayer,
-                    "minutes_until": max(0, int(diff_seconds / 60)),
-                    "seconds_until": max(0, int(diff_seconds)),
-                    "is_iqomah_countdown": True
-                }
-        except Exception as e:
-            logging.error(f"Error checking iqomah for {prayer}: {e}")
-            continue
-    
-    # Otherwise find next prayer (adhan countdown)
-    for prayer in prayer_names:
-        try:
-            prayer_str = prayer_times[prayer]
-            prayer_time = datetime.strptime(prayer_str, "%H:%M").time()
-            prayer_dt = datetime.combine(today, prayer_time)
-            
-            if prayer_dt > now_full:
-                diff_seconds = (prayer_dt - now_full).total_seconds()
-                return {
-                    "prayer": prayer,
-                    "minutes_until": max(0, int(diff_seconds / 60)),
-                    "seconds_until": max(0, int(diff_seconds)),
-                    "is_iqomah_countdown": False
-                }
-        except Exception as e:
-            logging.error(f"Error checking prayer {prayer}: {e}")
-            continue
-    
-    # If no prayer found today, next is Fajr tomorrow
+# Aladhan method ids for each calculation method
+ALADHAN_METHOD_IDS = {
+    "ISNA": 2,  # Islamic Society of North America
+    "MWL": 3,   # Muslim World League
+    "EGYPTIAN": 5,  # Egyptian General Authority
+    "KARACHI": 1,   # University of Islamic Sciences, Karachi
+    "MAKKAH": 4,    # Umm Al-Qura University, Makkah
+    "TEHRAN": 7     # Institute of Geophysics, University of Tehran
+}
+
+# Aladhan "school" parameter for the Asr shadow factor
+ALADHAN_SCHOOL_IDS = {
+    "SHAFI": 0,
+    "HANAFI": 1
+}
+
+async def fetch_aladhan_timings(latitude: float, longitude: float, when: datetime, method: str = "ISNA", asr_school: str = "SHAFI") -> Dict[str, str]:
+    """Fetch raw HH:MM timings from the Aladhan API, raising on any failure.
+
+    Concurrent requests for the same location, method and date share one upstream call.
+    """
+    key = (latitude, longitude, method, asr_school, when.date().isoformat())
+    return await aladhan_service.flights.run(key, _fetch_aladhan_timings, latitude, longitude, when, method, asr_school)
+
+async def _fetch_aladhan_timings(latitude: float, longitude: float, when: datetime, method: str, asr_school: str) -> Dict[str, str]:
+    params = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "method": ALADHAN_METHOD_IDS.get(method, 2),
+        "school": ALADHAN_SCHOOL_IDS.get(asr_school, 0)
+    }
+    data = await aladhan_service.get_json(f"/v1/timings/{int(when.timestamp())}", params)
+
+    if data.get("code") != 200:
+        raise Exception("Aladhan API returned error")
+
+    timings = data["data"]["timings"]
+    return {
+        "fajr": timings["Fajr"][:5],  # Get HH:MM only
+        "sunrise": timings["Sunrise"][:5],
+        "dhuhr": timings["Dhuhr"][:5],
+        "asr": timings["Asr"][:5],
+        "maghrib": timings["Maghrib"][:5],
+        "isha": timings["Isha"][:5]
+    }
+
+# Optional background comparison of the local engine against Aladhan
+ALADHAN_CROSSCHECK = os.environ.get("ALADHAN_CROSSCHECK", "false").lower() == "true"
+ALADHAN_CROSSCHECK_TOLERANCE = int(os.environ.get("ALADHAN_CROSSCHECK_TOLERANCE", "2"))
+_crosschecked_days = set()
+_background_tasks = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    """Start a fire-and-forget task, keeping a reference until it finishes"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def _minutes_of_day(hhmm: str) -> int:
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+async def crosscheck_prayer_times_aladhan(local_times: Dict, latitude: float, longitude: float, tz_str: str, method: str, asr_school: str):
+    """Log any prayer whose local time differs from Aladhan beyond the tolerance"""
     try:
-        fajr_str = prayer_times["fajr"]
-        fajr_time = datetime.strptime(fajr_str, "%H:%M").time()
-        tomorrow = today + timedelta(days=1)
-        fajr_tomorrow = datetime.combine(tomorrow, fajr_time)
-        diff_seconds = (fajr_tomorrow - now_full).total_seconds()
-        
-        return {
-            "prayer": "fajr",
-            "minutes_until": max(0, int(diff_seconds / 60)),
-            "seconds_until": max(0, int(diff_seconds)),
-            "is_iqomah_countdown": False
-        }
-    except Exception:
+        now = datetime.now(pytz.timezone(tz_str))
+        remote_times = await fetch_aladhan_timings(latitude, longitude, now, method, asr_school)
+    except Exception as e:
+        logging.warning(f"Aladhan cross-check skipped: {e}")
+        return
+
+    for name in ["fajr", "sunrise", "dhuhr", "asr", "maghrib", "isha"]:
+        diff = abs(_minutes_of_day(local_times[name]) - _minutes_of_day(remote_times[name]))
+        diff = min(diff, 1440 - diff)
+        if diff > ALADHAN_CROSSCHECK_TOLERANCE:
+            logging.warning(
+                f"Prayer time mismatch for {name} at ({latitude}, {longitude}) {method}: "
+                f"local {local_times[name]}, Aladhan {remote_times[name]}"
+            )
+
+def schedule_aladhan_crosscheck(local_times: Dict, latitude: float, longitude: float, tz_str: str, method: str, asr_school: str):
+    """Run the Aladhan cross-check in the background at most once per location per day"""
+    if not ALADHAN_CROSSCHECK:
+        return
+    key = (latitude, longitude, method, asr_school, local_times["gregorian_date"])
+    if key in _crosschecked_days:
+        return
+    _crosschecked_days.add(key)
+    run_in_background(crosscheck_prayer_times_aladhan(local_times, latitude, longitude, tz_str, method, asr_school))
+
+# ============== DAILY TIMELINE ==============
+
+def _seconds_of_day(clock: str) -> int:
+    """Seconds since local midnight for "HH:MM" or "HH:MM:SS" """
+    parts = clock.split(":")
+    seconds = int(parts[0]) * 3600 + int(parts[1]) * 60
+    return seconds + int(parts[2]) if len(parts) > 2 else seconds
+
+class DailyTimeline:
+    """One local day's adhan and iqomah boundaries as sorted seconds since midnight.
+
+    Working in wall-clock seconds of the mosque's own timezone keeps lookups
+    independent of the server's local date.
+    """
+    __slots__ = ("prayers", "adhan", "iqomah", "boundaries", "boundary_seconds")
+
+    def __init__(self, prayer_times: Dict, iqomah_delays: Dict[str, int]):
+        entries = sorted((_seconds_of_day(prayer_times[prayer]), prayer) for prayer in PRAYER_NAMES)
+        self.prayers = [prayer for _, prayer in entries]
+        self.adhan = [seconds for seconds, _ in entries]
+        self.iqomah = [seconds + iqomah_delays.get(prayer, 10) * 60 for seconds, prayer in entries]
+        self.boundaries = sorted(
+            [(seconds, prayer, "adhan") for seconds, prayer in zip(self.adhan, self.prayers)] +
+            [(seconds, prayer, "iqomah") for seconds, prayer in zip(self.iqomah, self.prayers)]
+        )
+        self.boundary_seconds = [seconds for seconds, _, _ in self.boundaries]
+
+    def iqomah_labels(self) -> Dict[str, str]:
+        return {prayer: str(MINUTE_LABELS[(seconds // 60) % 1440]) for prayer, seconds in zip(self.prayers, self.iqomah)}
+
+    def next_prayer(self, now_seconds: int) -> Dict:
+        """Iqomah countdown if between adhan and iqomah, else countdown to the next adhan"""
+        i = bisect_right(self.adhan, now_seconds) - 1
+        if i >= 0 and now_seconds < self.iqomah[i]:
+            prayer, target, is_iqomah = self.prayers[i], self.iqomah[i], True
+        elif i + 1 < len(self.adhan):
+            prayer, target, is_iqomah = self.prayers[i + 1], self.adhan[i + 1], False
+        else:
+            # After the last prayer, next is the first one tomorrow
+            prayer, target, is_iqomah = self.prayers[0], self.adhan[0] + 86400, False
+
+        diff_seconds = max(0, target - now_seconds)
         return {
-            "prayer": "fajr",
-            "minutes_until": 0,
-            "seconds_until": 0,
-            "is_iqomah_countdown": False
+            "prayer": prayer,
+            "minutes_until": diff_seconds // 60,
+            "seconds_until": diff_seconds,
+            "is_iqomah_countdown": is_iqomah
         }
 
-# ============== API ENDPOINTS ==============
+    def next_boundary(self, now_seconds: int) -> Optional[tuple]:
+        """(seconds, prayer, phase) of the first boundary after now, or None for the rest of the day"""
+        i = bisect_right(self.boundary_seconds, now_seconds)
+        return self.boundaries[i] if i < len(self.boundaries) else None
 
-# Settings endpoints
-@api_router.get("/settings", response_model=MosqueSettings)
-async def get_settings():
-    """Get mosque settings"""
-    settings = await settings_collection.find_one({}, {"_id": 0})
-    if not settings:
-        # Return default settings
-        default_settings = MosqueSettings()
-        return default_settings
-    return MosqueSettings(**settings)
+# ============== PRAYER SCHEDULE CACHE ==============
 
-@api_router.put("/settings")
-async def update_settings(settings_update: MosqueSettingsUpdate):
-    """Update mosque settings"""
-    # Get current settings
-    current = await settings_collection.find_one({}, {"_id": 0})
-    
-    if current:
-        # Update existing
-        update_data = settings_update.model_dump(exclude_none=True)
-        update_data["updated_at"] = datetime.now(timezone.utc)
-        await settings_collection.update_one({}, {"$set": update_data})
-    else:
-        # Create new
-        new_settings = MosqueSettings(**settings_update.model_dump(exclude_none=True))
-        settings_dict = new_settings.model_dump()
-        settings_dict["updated_at"] = settings_dict["updated_at"].isoformat()
-        await settings_collection.insert_one(settings_dict)
-    
-    return {"success": True, "message": "Settings updated"}
+# Days computed ahead whenever the mosque location or method changes
+PRAYER_SCHEDULE_DAYS = int(os.environ.get("PRAYER_SCHEDULE_DAYS", "400"))
+PRAYER_SCHEDULE_CACHE_SIZE = int(os.environ.get("PRAYER_SCHEDULE_CACHE_SIZE", "1024"))
 
-# Prayer times endpoint
-@api_router.get("/prayer-times", response_model=PrayerTimesResponse)
-async def get_prayer_times():
-    """Get current prayer times"""
-    # Get settings
-    settings = await settings_collection.find_one({}, {"_id": 0})
-    if not settings:
-        settings = MosqueSettings().model_dump()
-    
-    # Check if using manual times
+# Settings fields that determine the computed schedule
+SCHEDULE_SETTINGS_FIELDS = ["latitude", "longitude", "timezone", "calculation_method", "asr_school"]
+
+class ScheduleLRU:
+    """Small in-memory LRU of precomputed schedule rows keyed by (location_key, date)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._rows: "OrderedDict[tuple, Dict]" = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[Dict]:
+        row = self._rows.get(key)
+        if row is not None:
+            self._rows.move_to_end(key)
+        return row
+
+    def put(self, key: tuple, row: Dict):
+        self._rows[key] = row
+        self._rows.move_to_end(key)
+        while len(self._rows) > self.maxsize:
+            self._rows.popitem(last=False)
+
+schedule_cache = ScheduleLRU(PRAYER_SCHEDULE_CACHE_SIZE)
+schedule_flights = SingleFlight("prayer_schedule")
+_precomputing_locations = set()
+
+def schedule_location_key(settings: Dict) -> str:
+    """Stable key for the inputs that determine a computed schedule"""
+    return "|".join([
+        f"{settings['latitude']:.4f}",
+        f"{settings['longitude']:.4f}",
+        settings["timezone"],
+        settings["calculation_method"],
+        settings.get("asr_school", "SHAFI")
+    ])
+
+def build_schedule_rows(settings: Dict, start: date, days: int) -> List[Dict]:
+    """Compute schedule documents for `days` consecutive days from start"""
+    location_key = schedule_location_key(settings)
+    rows = calculate_prayer_times_range(
+        start,
+        start + timedelta(days=days - 1),
+        settings["latitude"],
+        settings["longitude"],
+        settings["timezone"],
+        settings["calculation_method"],
+        asr_school=settings.get("asr_school", "SHAFI")
+    )
+    for row in rows:
+        # Imsya depends on imsya_offset, so it is derived from fajr on read
+        row.pop("imsya")
+        row["location_key"] = location_key
+    return rows
+
+def build_location_day_rows(locations: List[Dict], days: List[date]) -> List[Dict]:
+    """Schedule documents for many locations, each on its own local day, in one vectorized pass"""
+    offsets = [utc_offsets_for_days(np.datetime64(day, "D"), settings["timezone"]) for settings, day in zip(locations, days)]
+    hours = compute_prayer_times_batch(
+        np.array(days, dtype="datetime64[D]"),
+        [settings["latitude"] for settings in locations],
+        [settings["longitude"] for settings in locations],
+        offsets,
+        [settings["calculation_method"] for settings in locations],
+        [settings.get("asr_school", "SHAFI") for settings in locations]
+    )
+    labels = {name: format_prayer_times(value).tolist() for name, value in hours.items()}
+
+    hijri_dates = {}
+    rows = []
+    for i, (settings, day) in enumerate(zip(locations, days)):
+        if day not in hijri_dates:
+            hijri_date = Gregorian(day.year, day.month, day.day).to_hijri()
+            hijri_dates[day] = f"{hijri_date.day} {hijri_date.month_name()} {hijri_date.year}"
+        rows.append({
+            "date": day.isoformat(),
+            "hijri_date": hijri_dates[day],
+            "fajr": labels["fajr"][i],
+            "syuruq": labels["sunrise"][i],
+            "dhuhr": labels["dhuhr"][i],
+            "asr": labels["asr"][i],
+            "maghrib": labels["maghrib"][i],
+            "isha": labels["isha"][i],
+            "location_key": schedule_location_key(settings)
+        })
+    return rows
+
+async def precompute_prayer_schedule(settings: Dict, days: int = PRAYER_SCHEDULE_DAYS):
+    """Fill prayer_schedules for the given settings from yesterday onwards"""
+    location_key = schedule_location_key(settings)
+    if location_key in _precomputing_locations:
+        return
+    _precomputing_locations.add(location_key)
+    try:
+        # Start a day early so requests just after local midnight never miss
+        start = datetime.now(pytz.timezone(settings["timezone"])).date() - timedelta(days=1)
+        rows = await asyncio.to_thread(build_schedule_rows, settings, start, days + 1)
+        await prayer_schedules_collection.bulk_write([
+            UpdateOne({"location_key": location_key, "date": row["date"]}, {"$set": row}, upsert=True)
+            for row in rows
+        ], ordered=False)
+        logging.info(f"Precomputed {len(rows)} days of prayer times for {location_key}")
+    except Exception as e:
+        logging.error(f"Error precomputing prayer schedule for {location_key}: {e}")
+    finally:
+        _precomputing_locations.discard(location_key)
+
+async def get_schedule_row(settings: Dict, day: date) -> Dict:
+    """Read one day's precomputed schedule, computing and storing it on a miss"""
+    location_key = schedule_location_key(settings)
+    day_str = day.isoformat()
+    cache_key = (location_key, day_str)
+
+    row = schedule_cache.get(cache_key)
+    if row is not None:
+        return row
+
+    # Displays refreshing together after a restart share one load
+    return await schedule_flights.run(cache_key, _load_schedule_row, settings, day)
+
+async def _load_schedule_row(settings: Dict, day: date) -> Dict:
+    location_key = schedule_location_key(settings)
+    day_str = day.isoformat()
+
+    row = await prayer_schedules_collection.find_one({"location_key": location_key, "date": day_str}, {"_id": 0})
+    if row is None:
+        row = build_schedule_rows(settings, day, 1)[0]
+        await prayer_schedules_collection.update_one(
+            {"location_key": location_key, "date": day_str}, {"$set": row}, upsert=True
+        )
+        run_in_background(precompute_prayer_schedule(settings))
+
+    schedule_cache.put((location_key, day_str), row)
+    return row
+
+# ============== DAILY RECORDS ==============
+
+async def get_day_clock_times(settings: Dict, day: date) -> Dict[str, str]:
+    """HH:MM times of one local day, from manual settings or the precomputed schedule"""
     if settings.get("use_manual_times") and settings.get("manual_prayer_times"):
-        # Use manual prayer times
         manual_times = settings["manual_prayer_times"]
-        tz = pytz.timezone(settings["timezone"])
-        now = datetime.now(tz)
-        
-        # Calculate Imsya from Fajr
-        fajr_time = manual_times.get("fajr", "04:30")
-        fajr_dt = datetime.strptime(fajr_time, "%H:%M")
-        imsya_offset = settings.get("imsya_offset", 10)
-        imsya_dt = fajr_dt - timedelta(minutes=imsya_offset)
-        imsya_time = imsya_dt.strftime("%H:%M")
-        
-        # Convert Gregorian to Hijri
-        hijri_date = Gregorian(now.year, now.month, now.day).to_hijri()
-        hijri_str = f"{hijri_date.day} {hijri_date.month_name()} {hijri_date.year}"
-        
         times = {
             "fajr": manual_times.get("fajr", "04:30"),
-            "imsya": imsya_time,
             "sunrise": manual_times.get("sunrise", "05:45"),
             "dhuhr": manual_times.get("dhuhr", "11:45"),
             "asr": manual_times.get("asr", "15:15"),
             "maghrib": manual_times.get("maghrib", "17:45"),
-            "isha": manual_times.get("isha", "19:00"),
-            "gregorian_date": now.strftime("%A, %d %B %Y"),
-            "hijri_date": hijri_str,
-            "current_time": now.strftime("%H:%M:%S")
+            "isha": manual_times.get("isha", "19:00")
         }
-        logging.info("Using manual prayer times")
     else:
-        # Calculate prayer times using Aladhan API
-        times = await calculate_prayer_times_aladhan(
+        row = await get_schedule_row(settings, day)
+        times = {name: row[name] for name in PRAYER_NAMES}
+        times["sunrise"] = row["syuruq"]
+
+    fajr_dt = datetime.strptime(times["fajr"], "%H:%M")
+    times["imsya"] = (fajr_dt - timedelta(minutes=settings.get("imsya_offset", 10))).strftime("%H:%M")
+    return times
+
+class DailyRecord:
+    """Everything derived for one mosque-local day, built once and then only read"""
+    __slots__ = ("day", "gregorian_date", "hijri_date", "times", "iqomah_times", "timeline")
+
+    def __init__(self, day: date, times: Dict[str, str], iqomah_delays: Dict[str, int]):
+        hijri_date = Gregorian(day.year, day.month, day.day).to_hijri()
+        self.day = day
+        self.gregorian_date = day.strftime("%A, %d %B %Y")
+        self.hijri_date = f"{hijri_date.day} {hijri_date.month_name()} {hijri_date.year}"
+        self.times = times
+        self.timeline = DailyTimeline(times, iqomah_delays)
+        self.iqomah_times = self.timeline.iqomah_labels()
+
+# Today's record per settings combination, replaced wholesale at local midnight
+_daily_records: Dict[tuple, DailyRecord] = {}
+daily_record_flights = SingleFlight("daily_record")
+
+def daily_record_key(settings: Dict) -> tuple:
+    manual_times = settings.get("manual_prayer_times") if settings.get("use_manual_times") else None
+    return (
+        schedule_location_key(settings),
+        tuple(sorted(manual_times.items())) if manual_times else None,
+        settings.get("imsya_offset", 10),
+        tuple(settings["iqomah_delays"].get(prayer, 10) for prayer in PRAYER_NAMES)
+    )
+
+async def build_daily_record(settings: Dict, day: date) -> DailyRecord:
+    times = await get_day_clock_times(settings, day)
+    record = DailyRecord(day, times, settings["iqomah_delays"])
+    if not (settings.get("use_manual_times") and settings.get("manual_prayer_times")):
+        schedule_aladhan_crosscheck(
+            {**times, "gregorian_date": record.gregorian_date},
             settings["latitude"],
             settings["longitude"],
             settings["timezone"],
             settings["calculation_method"],
-            settings.get("imsya_offset", 10)
+            settings.get("asr_school", "SHAFI")
         )
-    
-    # Get next prayer info
-    prayer_info = get_next_prayer_info(times, settings["iqomah_delays"])
-    
-    # Calculate iqomah times
-    iqomah_times = {}
-    for prayer in ["fajr", "dhuhr", "asr", "maghrib", "isha"]:
-        adhan_time = datetime.strptime(times[prayer], "%H:%M")
-        delay = settings["iqomah_delays"].get(prayer, 10)
-        iqomah_time = adhan_time + timedelta(minutes=delay)
-        iqomah_times[prayer] = iqomah_time.strftime("%H:%M")
-    
-    return PrayerTimesResponse(
-        fajr=times["fajr"],
-        imsya=times["imsya"],
-        syuruq=times["sunrise"],
-        dhuhr=times["dhuhr"],
-        asr=times["asr"],
-        maghrib=times["maghrib"],
-        isha=times["isha"],
-        gregorian_date=times["gregorian_date"],
-        hijri_date=times["hijri_date"],
-        next_prayer=prayer_info["prayer"],
-        time_until_next=prayer_info["minutes_until"],
-        is_iqomah_countdown=prayer_info["is_iqomah_countdown"],
-        iqomah_times=iqomah_times
-    )
+    return record
 
-# Announcements endpoints
-@api_router.get("/announcements", response_model=List[Announcement])
-async def get_announcements(active_only: bool = True):
-    """Get all announcements"""
-    query = {"active": True} if active_only else {}
-    announcements = await announcements_collection.find(query, {"_id": 0}).sort("priority", -1).to_list(100)
-    return [Announcement(**ann) for ann in announcements]
+async def _install_daily_record(key: tuple, settings: Dict, day: date) -> DailyRecord:
+    record = await build_daily_record(settings, day)
+    _daily_records[key] = record
+    return record
 
-@api_router.post("/announcements", response_model=Announcement)
-async def create_announcement(announcement: AnnouncementCreate):
-    """Create new announcement"""
-    new_ann = Announcement(**announcement.model_dump())
-    ann_dict = new_ann.model_dump()
-    ann_dict["created_at"] = ann_dict["created_at"].isoformat()
-    await announcements_collection.insert_one(ann_dict)
-    return new_ann
+async def get_daily_record(settings: Dict) -> DailyRecord:
+    """Today's derived record; normally already built by the rollover loop"""
+    key = daily_record_key(settings)
+    today = datetime.now(pytz.timezone(settings["timezone"])).date()
+    record = _daily_records.get(key)
+    if record is None or record.day != today:
+        record = await daily_record_flights.run((key, today), _install_daily_record, key, settings, today)
+    return record
 
-@api_router.delete("/announcements/{announcement_id}")
-async def delete_announcement(announcement_id: str):
-    """Delete announcement"""
-    result = await announcements_collection.delete_one({"id": announcement_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Announcement not found")
-    return {"success": True}
+async def refresh_daily_records() -> List[Dict]:
+    """One batched pass over every mosque: today's schedule and derived record.
 
-# Quran verses endpoints
-@api_router.get("/quran-verses", response_model=List[QuranVerse])
-async def get_quran_verses(active_only: bool = True):
-    """Get all Quran verses"""
-    query = {"active": True} if active_only else {}
-    verses = await quran_verses_collection.find(query, {"_id": 0}).to_list(100)
-    return [QuranVerse(**v) for v in verses]
+    Mosques sharing a location and method share one schedule row, and all
+    missing rows are computed in a single vectorized call.
+    """
+    global _daily_records
+    tenants = [
+        LocationSettings(**doc).model_dump()
+        async for doc in settings_collection.find({}, settings_projection(LocationSettings))
+    ]
+    if not any(t["mosque_id"] == DEFAULT_MOSQUE_ID for t in tenants):
+        tenants.append((await load_settings_view(DEFAULT_MOSQUE_ID, LocationSettings)).model_dump())
 
-@api_router.post("/quran-verses", response_model=QuranVerse)
-async def create_quran_verse(verse: QuranVerseCreate):
-    """Create new Quran verse"""
-    new_verse = QuranVerse(**verse.model_dump())
-    verse_dict = new_verse.model_dump()
-    verse_dict["created_at"] = verse_dict["created_at"].isoformat()
-    await quran_verses_collection.insert_one(verse_dict)
-    return new_verse
+    # A mosque with broken settings is logged and skipped; the others still roll over
+    groups: Dict[str, Dict] = {}
+    todays: Dict[str, date] = {}
+    for settings in tenants:
+        key = schedule_location_key(settings)
+        if key in groups:
+            continue
+        try:
+            todays[key] = datetime.now(pytz.timezone(settings["timezone"])).date()
+        except Exception as e:
+            logging.error(f"Skipping daily record of {settings['mosque_id']}: {e}")
+            continue
+        groups[key] = settings
+    tenants = [settings for settings in tenants if schedule_location_key(settings) in groups]
 
-@api_router.delete("/quran-verses/{verse_id}")
-async def delete_quran_verse(verse_id: str):
-    """Delete Quran verse"""
-    result = await quran_verses_collection.delete_one({"id": verse_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Verse not found")
-    return {"success": True}
+    # Stored rows for today go straight into the in-memory cache
+    if todays:
+        cursor = prayer_schedules_collection.find(
+            {"$or": [{"location_key": key, "date": day.isoformat()} for key, day in todays.items()]},
+            {"_id": 0}
+        )
+        async for row in cursor:
+            schedule_cache.put((row["location_key"], row["date"]), row)
+    missing = [key for key, day in todays.items() if schedule_cache.get((key, day.isoformat())) is None]
 
-# Financial reports endpoints
-@api_router.get("/financial-reports", response_model=List[FinancialReport])
-async def get_financial_reports():
-    """Get all financial reports"""
-    reports = await financial_reports_collection.find({}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return [FinancialReport(**r) for r in reports]
+    if missing:
+        rows = await asyncio.to_thread(build_location_day_rows, [groups[key] for key in missing], [todays[key] for key in missing])
+        await prayer_schedules_collection.bulk_write([
+            UpdateOne({"location_key": row["location_key"], "date": row["date"]}, {"$set": row}, upsert=True)
+            for row in rows
+        ], ordered=False)
+        for row in rows:
+            schedule_cache.put((row["location_key"], row["date"]), row)
+        # New locations also get their schedule filled ahead
+        for key in missing:
+            run_in_background(precompute_prayer_schedule(groups[key]))
 
-@api_router.post("/financial-reports", response_model=FinancialReport)
-async def create_financial_report(report: FinancialReportCreate):
-    """Create new financial report with automatic calculation"""
-    # Calculate Saldo Pekan Ini automatically
-    saldo_pekan_ini = report.saldo_pekan_lalu + report.infaq_pekan_ini - report.pengeluaran
-    
-    new_report = FinancialReport(
-        **report.model_dump(),
-        saldo_pekan_ini=saldo_pekan_ini
-    )
-    report_dict = new_report.model_dump()
-    report_dict["created_at"] = report_dict["created_at"].isoformat()
-    
-    # Delete old report and insert new one (keep only latest)
-    await financial_reports_collection.delete_many({})
-    await financial_reports_collection.insert_one(report_dict)
-    return new_report
+    records = {}
+    built = []
+    for settings in tenants:
+        key = daily_record_key(settings)
+        try:
+            if key not in records:
+                records[key] = await build_daily_record(settings, todays[schedule_location_key(settings)])
+        except Exception as e:
+            logging.error(f"Skipping daily record of {settings['mosque_id']}: {e}")
+            continue
+        built.append(settings)
+    # Swap the whole mapping so records for outdated settings are dropped too
+    _daily_records = records
+    logging.info(f"Built daily records for {len(built)} mosques across {len(groups)} locations ({len(missing)} computed)")
+    return built
 
-@api_router.delete("/financial-reports/{report_id}")
-async def delete_financial_report(report_id: str):
-    """Delete financial report"""
-    result = await financial_reports_collection.delete_one({"id": report_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Report not found")
-    return {"success": True}
+def seconds_until_next_midnight(timezones: set) -> float:
+    """Seconds until the earliest upcoming local midnight among the given timezones"""
+    delays = []
+    for tz_str in timezones:
+        tz = pytz.timezone(tz_str)
+        now = datetime.now(tz)
+        next_midnight = tz.localize(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+        delays.append((next_midnight - now).total_seconds())
+    return min(delays)
 
-# Password verification endpoint
-@api_router.post("/verify-password")
-async def verify_password(data: PasswordVerify):
-    """Verify admin password"""
-    settings = await settings_collection.find_one({}, {"_id": 0})
-    if not settings:
-        settings = MosqueSettings().model_dump()
-    
-    stored_password = settings.get("admin_password", "admin123")
-    
-    if data.password == stored_password:
-        return {"success": True, "message": "Password verified"}
-    else:
-        raise HTTPException(status_code=401, detail="Invalid password")
+async def daily_rollover_loop():
+    """Rebuild every mosque's daily record at each local midnight among their timezones"""
+    while True:
+        try:
+            tenants = await refresh_daily_records()
+            delay = max(1.0, seconds_until_next_midnight({settings["timezone"] for settings in tenants}))
+        except Exception as e:
+            logging.error(f"Error building daily prayer records: {e}")
+            delay = 60
+        await asyncio.sleep(delay)
 
-# City coordinates endpoint
-@api_router.get("/cities")
-async def get_cities():
-    """Get list of cities with coordinates"""
-    cities = {
-        "Jakarta": {"lat": -6.2088, "lon": 106.8456, "tz": "Asia/Jakarta"},
-        "Bandung": {"lat": -6.9175, "lon": 107.6191, "tz": "Asia/Jakarta"},
-        "Yogyakarta": {"lat": -7.7956, "lon": 110.3695, "tz": "Asia/Jakarta"},
-        "Solo": {"lat": -7.5505, "lon": 110.8283, "tz": "Asia/Jakarta"},
-        "Semarang": {"lat": -6.9932, "lon": 110.4203, "tz": "Asia/Jakarta"},
+# ============== WEATHER SERVICE ==============
+
+async def fetch_weather(latitude: float, longitude: float) -> Dict:
+    """Fetch current conditions from OpenWeatherMap, raising on any failure.
+
+    Concurrent requests for the same coordinates share one upstream call.
+    """
+    return await openweather_service.flights.run((latitude, longitude), _fetch_weather, latitude, longitude)
+
+async def _fetch_weather(latitude: float, longitude: float) -> Dict:
+    params = {
+        "lat": latitude,
+        "lon": longitude,
+        "appid": OPENWEATHER_API_KEY,
+        "units": "metric",
+        "lang": "id"
+    }
+    data = await openweather_service.get_json("/data/2.5/weather", params)
+    return {
+        "temperature": round(data["main"]["temp"]),
+        "feels_like": round(data["main"]["feels_like"]),
+        "humidity": data["main"]["humidity"],
+        "description": data["weather"][0]["description"],
+        "icon": data["weather"][0]["icon"],
+        "wind_speed": data["wind"]["speed"]
+    }
+
+# Seconds a weather reading is served before it is refreshed in the background
+WEATHER_CACHE_TTL = float(os.environ.get("WEATHER_CACHE_TTL", "600"))
+
+# (lat, lon) -> {"weather": payload, "fetched_at": monotonic time, "refreshing": bool}
+_weather_cache: Dict[tuple, Dict] = {}
+
+async def refresh_weather(latitude: float, longitude: float) -> Dict:
+    """Fetch fresh weather and store it in the cache"""
+    key = (latitude, longitude)
+    try:
+        weather = await fetch_weather(latitude, longitude)
+        _weather_cache[key] = {"weather": weather, "fetched_at": time.monotonic(), "refreshing": False}
+        return weather
+    finally:
+        if key in _weather_cache:
+            _weather_cache[key]["refreshing"] = False
+
+async def _revalidate_weather(latitude: float, longitude: float):
+    try:
+        await refresh_weather(latitude, longitude)
+    except Exception as e:
+        logging.error(f"Error refreshing weather: {e}")
+
+async def get_cached_weather(latitude: float, longitude: float) -> Optional[Dict]:
+    """Serve cached weather immediately, refreshing expired entries in the background.
+
+    Only the very first request for a location waits on the upstream call; a
+    stale reading keeps being served while the upstream is failing.
+    """
+    entry = _weather_cache.get((latitude, longitude))
+    if entry is None:
+        try:
+            return await refresh_weather(latitude, longitude)
+        except Exception as e:
+            logging.error(f"Error fetching weather: {e}")
+            return None
+
+    if time.monotonic() - entry["fetched_at"] >= WEATHER_CACHE_TTL and not entry["refreshing"]:
+        entry["refreshing"] = True
+        run_in_background(_revalidate_weather(latitude, longitude))
+    return entry["weather"]
+
+# ============== EVENT STREAM ==============
+
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "25"))
+SSE_QUEUE_SIZE = 64
+
+class EventBroadcaster:
+    """Fan-out of server-sent events to every connected display.
+
+    Each subscriber is just a bounded queue that its response generator
+    awaits; heartbeats come from one shared task, so idle connections cost
+    no timers or polling.
+    """
+
+    def __init__(self):
+        # queue -> mosque id whose events it receives
+        self._subscribers: Dict[asyncio.Queue, str] = {}
+
+    def subscribe(self, mosque_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        is_new_mosque = mosque_id not in self.mosque_ids()
+        self._subscribers[queue] = mosque_id
+        if is_new_mosque:
+            boundaries_changed.set()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.pop(queue, None)
+
+    def mosque_ids(self) -> set:
+        return set(self._subscribers.values())
+
+    def _broadcast(self, message: str, mosque_id: Optional[str] = None):
+        for queue, subscribed_to in list(self._subscribers.items()):
+            if mosque_id is not None and subscribed_to != mosque_id:
+                continue
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Drop clients that stopped reading; they reconnect and refetch
+                self._subscribers.pop(queue, None)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def publish(self, event: str, data: Dict, mosque_id: Optional[str] = None):
+        """Send to the displays of one mosque, or to all when mosque_id is None"""
+        self._broadcast(f"event: {event}\ndata: {json.dumps(data)}\n\n", mosque_id)
+
+    def heartbeat(self):
+        self._broadcast(": keep-alive\n\n")
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+event_broadcaster = EventBroadcaster()
+
+# Wakes the prayer boundary loop when settings change or a new mosque's display connects
+boundaries_changed = asyncio.Event()
+
+async def sse_heartbeat_loop():
+    while True:
+        await asyncio.sleep(SSE_HEARTBEAT_SECONDS)
+        event_broadcaster.heartbeat()
+
+def next_boundary_delay(settings: Dict, timeline: "DailyTimeline") -> tuple:
+    """Seconds until the mosque's next adhan/iqomah boundary, with its prayer and phase"""
+    now = datetime.now(pytz.timezone(settings["timezone"]))
+    now_seconds = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+    upcoming = timeline.next_boundary(int(now_seconds))
+    if upcoming is None:
+        # Nothing left today: re-plan just after local midnight
+        return 86400 - now_seconds, None, None
+    boundary_seconds, prayer, phase = upcoming
+    return boundary_seconds - now_seconds, prayer, phase
+
+async def prayer_boundary_loop():
+    """Publish a "prayer" event at each adhan and iqomah boundary of every watched mosque"""
+    while True:
+        boundaries_changed.clear()
+        # Mosques whose boundary is the soonest, all published together
+        due, delay = [], 60.0
+        upcoming = []
+        for mosque_id in event_broadcaster.mosque_ids():
+            # One mosque's broken settings must not silence the others
+            try:
+                settings = (await load_settings_view(mosque_id, LocationSettings)).model_dump()
+                timeline = (await get_daily_record(settings)).timeline
+                upcoming.append((mosque_id, *next_boundary_delay(settings, timeline)))
+            except Exception as e:
+                logging.error(f"Error planning prayer events for {mosque_id}: {e}")
+        if upcoming:
+            delay = min(seconds for _, seconds, _, _ in upcoming)
+            due = [(m, prayer, phase) for m, seconds, prayer, phase in upcoming if seconds - delay < 0.5 and prayer]
+
+        try:
+            await asyncio.wait_for(boundaries_changed.wait(), timeout=delay)
+            continue
+        except asyncio.TimeoutError:
+            pass
+        for mosque_id, prayer, phase in due:
+            event_broadcaster.publish("prayer", {"prayer": prayer, "phase": phase}, mosque_id)
+
+# ============== CONTENT VERSIONS ==============
+
+CONTENT_VERSION_SYNC_SECONDS = float(os.environ.get("CONTENT_VERSION_SYNC_SECONDS", "2"))
+
+# Counters live in one MongoDB document so every worker agrees on them; the
+# epoch is fixed when that document is first created.
+CONTENT_VERSIONS_ID = "content"
+CONTENT_NAMES = ("settings", "announcements", "quran_verses", "financial_reports")
+_content_epoch = "0"
+
+# mosque id -> collection name -> counter, bumped by every write handler
+content_versions: Dict[str, Dict[str, int]] = {}
+
+def content_version(mosque_id: str, name: str) -> int:
+    return content_versions.get(mosque_id, {}).get(name, 0)
+
+def apply_content_versions(doc: Optional[Dict]):
+    """Adopt versions from the shared document, notifying each mosque's displays of changes"""
+    global _content_epoch
+    if not doc:
+        return
+    _content_epoch = doc.get("epoch", _content_epoch)
+    changed = []
+    for mosque_id, counters in doc.get("tenants", {}).items():
+        known = content_versions.setdefault(mosque_id, {})
+        for name in CONTENT_NAMES:
+            if counters.get(name, 0) != known.get(name, 0):
+                known[name] = counters.get(name, 0)
+                changed.append((mosque_id, name))
+    for mosque_id, name in changed:
+        response_cache.invalidate(mosque_id, name)
+        event_broadcaster.publish(name, {"version": current_content_version(mosque_id)}, mosque_id)
+        if name == "settings":
+            boundaries_changed.set()
+
+async def bump_content_version(name: str, mosque_id: str):
+    doc = await content_versions_collection.find_one_and_update(
+        {"_id": CONTENT_VERSIONS_ID},
+        {"$inc": {f"tenants.{mosque_id}.{name}": 1}, "$setOnInsert": {"epoch": uuid.uuid4().hex[:8]}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    apply_content_versions(doc)
+
+async def content_version_sync_loop():
+    """Pick up writes made by other workers with one tiny read per interval"""
+    while True:
+        try:
+            apply_content_versions(await content_versions_collection.find_one({"_id": CONTENT_VERSIONS_ID}))
+        except Exception as e:
+            logging.error(f"Error syncing content versions: {e}")
+        await asyncio.sleep(CONTENT_VERSION_SYNC_SECONDS)
+
+def current_content_version(mosque_id: str) -> str:
+    return ".".join([_content_epoch] + [str(content_version(mosque_id, name)) for name in sorted(CONTENT_NAMES)])
+
+def content_etag(name: str, mosque_id: str, *variant) -> str:
+    """Strong ETag for a mosque's collection version and query variant.
+
+    The variant is hashed, since raw query values such as `fields=text,id` may
+    hold commas or quotes that would split the tag inside If-None-Match.
+    """
+    parts = [_content_epoch, mosque_id, name, str(content_version(mosque_id, name))]
+    if variant:
+        parts.append(hashlib.blake2b(repr(variant).encode("utf-8"), digest_size=8).hexdigest())
+    return '"' + "-".join(parts) + '"'
+
+# Content codings a body may be sent in; each gets its own strong validator
+CODING_ETAG_SUFFIXES = ("-gzip", "-br")
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """ETag of one content coding of a representation, e.g. "...-gzip" """
+    return etag if encoding == "identity" else f'{etag[:-1]}-{encoding}"'
+
+def base_etag(tag: str) -> str:
+    """A validator without W/ or a content-coding suffix, so every coding of a version matches"""
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in CODING_ETAG_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+def not_modified_response(request: Request, etag: str, headers: Optional[Dict[str, str]] = None) -> Optional[Response]:
+    """304 response when the client already holds some coding of this ETag, else None"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        for candidate in (tag.strip() for tag in if_none_match.split(",")):
+            if candidate == "*" or base_etag(candidate) == etag:
+                # Echo the validator of the coding the client holds
+                held = etag if candidate == "*" else candidate.removeprefix("W/")
+                return Response(status_code=304, headers={"ETag": held, "Cache-Control": "no-cache", **(headers or {})})
+    return None
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    # Let browsers keep the body but revalidate on every poll
+    response.headers["Cache-Control"] = "no-cache"
+
+# ============== RESPONSE CACHE ==============
+
+# Read endpoints keep their serialized body, plus gzip and brotli copies, per
+# content version; compression runs once per change instead of once per poll
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 512))
+COMPRESS_MIN_BYTES = 512
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+ANY_CONTENT = "*"
+
+def compress_body(body: bytes) -> Dict[str, bytes]:
+    """The body under every encoding worth sending"""
+    encoded = {"identity": body}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoded["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            encoded["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return encoded
+
+def negotiate_encoding(accept_encoding: str, available) -> str:
+    """Smallest available encoding the client accepts; identity when none"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    for coding in ("br", "gzip"):
+        if coding in available and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
+
+class ResponseCache:
+    """LRU of encoded bodies keyed by ETag, tagged with the (mosque, content) they depend on"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, tag: tuple, encoded: Dict[str, bytes], headers: Dict[str, str]):
+        self._entries[key] = (tag, encoded, headers)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, mosque_id: str, name: str):
+        """Drop bodies built from a mosque's content that just changed"""
+        stale = [key for key, (tag, _, _) in self._entries.items()
+                 if tag[0] == mosque_id and tag[1] in (name, ANY_CONTENT)]
+        for key in stale:
+            del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+response_flights = SingleFlight("response_cache")
+
+async def _build_cached_body(etag: str, tag: tuple, build) -> tuple:
+    body, headers = await build()
+    encoded = await asyncio.to_thread(compress_body, body)
+    response_cache.put(etag, tag, encoded, headers)
+    return tag, encoded, headers
+
+async def cached_response(request: Request, etag: str, tag: tuple, build) -> Response:
+    """304, or the cached body for this ETag in the best encoding the client accepts.
+
+    Each encoding is sent under its own strong ETag, the base tag plus a coding
+    suffix. `build` is awaited on a miss and returns the JSON body and extra headers;
+    `tag` is (mosque id, content name) so writes to that content drop the entry.
+    """
+    cached = not_modified_response(request, etag, {"Vary": "Accept-Encoding"})
+    if cached:
+        return cached
+    entry = response_cache.get(etag)
+    if entry is None:
+        entry = await response_flights.run((etag,), _build_cached_body, etag, tag, build)
+    _, encoded, headers = entry
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), encoded)
+    response = Response(content=encoded[encoding], media_type="application/json", headers=headers)
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    set_etag(response, encoded_etag(etag, encoding))
+    return response
+
+# ============== SETTINGS CACHE ==============
+
+# (mosque id, settings view) -> (settings version it was read at, immutable snapshot)
+_settings_snapshots: Dict[tuple, tuple] = {}
+# view name -> reads from MongoDB and the BSON bytes they returned
+settings_read_stats: Dict[str, Dict[str, int]] = {}
+
+def settings_projection(view) -> Dict:
+    return {"_id": 0, **{field: 1 for field in view.model_fields}}
+
+def _record_settings_read(view, doc: Optional[Dict]):
+    size = len(bson.encode(doc)) if doc else 0
+    stats = settings_read_stats.setdefault(view.__name__, {"reads": 0, "bytes": 0, "max_bytes": 0})
+    stats["reads"] += 1
+    stats["bytes"] += size
+    stats["max_bytes"] = max(stats["max_bytes"], size)
+
+async def load_settings_view(mosque_id: str, view):
+    """One view of a mosque's settings, read with a projection of just its fields.
+
+    Reads happen only after the settings version changes; while the full
+    snapshot is current, views are cut from it instead.
+    """
+    version = content_version(mosque_id, "settings")
+    cached = _settings_snapshots.get((mosque_id, view))
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    full = _settings_snapshots.get((mosque_id, MosqueSettings))
+    if full is not None and full[0] == version:
+        snapshot = view(**full[1].model_dump(include=set(view.model_fields)))
+    else:
+        doc = await settings_collection.find_one({"mosque_id": mosque_id}, settings_projection(view))
+        _record_settings_read(view, doc)
+        snapshot = view(**doc) if doc else view(mosque_id=mosque_id)
+        if doc is None and mosque_id != DEFAULT_MOSQUE_ID:
+            # Defaults stand in only for the default mosque; never remember them for others
+            return snapshot
+    _settings_snapshots[(mosque_id, view)] = (version, snapshot)
+    return snapshot
+
+async def load_settings(mosque_id: str = DEFAULT_MOSQUE_ID) -> MosqueSettings:
+    """A mosque's full settings, for the admin panel and writes"""
+    return await load_settings_view(mosque_id, MosqueSettings)
+
+# Mosques known to have a settings document; provisioning is never undone
+_provisioned_mosques: set = set()
+
+async def mosque_provisioned(mosque_id: str) -> bool:
+    """Whether a mosque may be read or administered.
+
+    Other mosques exist once a settings document has been created for them;
+    the default mosque is also allowed before it has one, for first-run setup.
+    """
+    if mosque_id == DEFAULT_MOSQUE_ID or mosque_id in _provisioned_mosques:
+        return True
+    if await settings_collection.find_one({"mosque_id": mosque_id}, {"_id": 1}) is None:
+        return False
+    _provisioned_mosques.add(mosque_id)
+    return True
+
+def store_settings_snapshot(snapshot: MosqueSettings):
+    """Write-through: install settings just saved by this worker"""
+    version = content_version(snapshot.mosque_id, "settings")
+    _settings_snapshots[(snapshot.mosque_id, MosqueSettings)] = (version, snapshot)
+
+# ============== MEDIA STORE ==============
+
+# Uploaded files live on disk under their SHA-256; settings keep only the hash
+MEDIA_DIR = Path(os.environ.get("MEDIA_DIR", ROOT_DIR / "media"))
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MEDIA_FIELDS = ("mosque_logo", "background_image")
+MEDIA_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+DATA_URL_RE = re.compile(r"^data:([\w.+/-]+)?(;[^,]*)?,")
+
+def media_path(digest: str) -> Path:
+    return MEDIA_DIR / digest[:2] / digest
+
+def _write_media_file(digest: str, contents: bytes):
+    path = media_path(digest)
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write beside the target and rename so readers never see a partial file
+    tmp_path = path.with_name(f"{digest}.{uuid.uuid4().hex}.tmp")
+    tmp_path.write_bytes(contents)
+    os.replace(tmp_path, path)
+
+async def register_media(digest: str, size: int, content_type: str, filename: Optional[str] = None):
+    """Record metadata for a stored file and queue derivatives the first time it is seen"""
+    result = await media_collection.update_one(
+        {"_id": digest},
+        {"$setOnInsert": {
+            "content_type": content_type,
+            "size": size,
+            "filename": filename,
+            "created_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+    if result.upserted_id is not None and content_type in DERIVATIVE_CONTENT_TYPES:
+        run_in_background(process_media(digest))
+
+async def store_media(contents: bytes, content_type: str, filename: Optional[str] = None) -> str:
+    """Store bytes under their SHA-256 and return the hash; identical uploads share one file"""
+    digest = hashlib.sha256(contents).hexdigest()
+    await asyncio.to_thread(_write_media_file, digest, contents)
+    await register_media(digest, len(contents), content_type, filename)
+    return digest
+
+async def media_reference(value: Optional[str]) -> Optional[str]:
+    """Replace an inline base64 data URL with the hash of the stored file.
+
+    Held to the same type and size limits as uploads, checked before decoding.
+    """
+    if not value or not value.startswith("data:"):
+        return value
+    match = DATA_URL_RE.match(value)
+    if not match or not (match.group(2) or "").endswith("base64"):
+        return value
+    encoded = value[match.end():]
+    content_type = match.group(1) or "application/octet-stream"
+    check_upload_headers(content_type, str(len(encoded) * 3 // 4))
+    contents = base64.b64decode(encoded)
+    return await store_media(contents, content_type)
+
+def parse_byte_range(header: str, size: int) -> Optional[tuple]:
+    """(start, end) inclusive for a single 'bytes=' range, None when unsatisfiable"""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_str, _, end_str = spec.strip().partition("-")
+    try:
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(0, size - int(end_str))
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        return None
+    return start, end
+
+def _read_media_range(path: Path, start: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+# ============== STREAMING UPLOADS ==============
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+ALLOWED_UPLOAD_TYPES = set(os.environ.get(
+    "ALLOWED_UPLOAD_TYPES",
+    "image/png,image/jpeg,image/webp,image/gif,image/avif,image/bmp,video/mp4,video/webm"
+).split(","))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_PROGRESS_SIZE = 256
+
+# upload id -> {"received", "total", "done", "hash"}, most recent uploads only
+_upload_progress: "OrderedDict[str, Dict]" = OrderedDict()
+
+def track_upload(upload_id: Optional[str], total: Optional[int]) -> Dict:
+    progress = {"received": 0, "total": total, "done": False, "hash": None}
+    if upload_id:
+        _upload_progress[upload_id] = progress
+        _upload_progress.move_to_end(upload_id)
+        while len(_upload_progress) > UPLOAD_PROGRESS_SIZE:
+            _upload_progress.popitem(last=False)
+    return progress
+
+def check_upload_headers(content_type: Optional[str], content_length: Optional[str]):
+    """Reject disallowed types and declared oversize bodies before reading anything"""
+    if content_type not in ALLOWED_UPLOAD_TYPES:
+        raise HTTPException(status_code=415, detail=f"File type not allowed: {content_type}")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+
+class MediaWriter:
+    """Hash and write an upload chunk by chunk, so memory stays at one buffer per upload"""
+
+    def __init__(self, progress: Dict):
+        self.progress = progress
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._buffer = bytearray()
+        self._tmp_path = MEDIA_DIR / "incoming" / f"{uuid.uuid4().hex}.part"
+        self._file = None
+
+    async def __aenter__(self):
+        self._tmp_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = await asyncio.to_thread(open, self._tmp_path, "wb")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+        # Only reached with the part file still present when the upload failed
+        await asyncio.to_thread(self._tmp_path.unlink, missing_ok=True)
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+        self._hasher.update(chunk)
+        self._buffer += chunk
+        self.progress["received"] = self.size
+        if len(self._buffer) >= UPLOAD_CHUNK_SIZE:
+            await self._flush()
+
+    async def _flush(self):
+        data, self._buffer = bytes(self._buffer), bytearray()
+        await asyncio.to_thread(self._file.write, data)
+
+    async def commit(self) -> str:
+        """Move the finished file to its content address and return the hash"""
+        await self._flush()
+        await asyncio.to_thread(self._file.close)
+        self._file = None
+        digest = self._hasher.hexdigest()
+        path = media_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(os.replace, self._tmp_path, path)
+        self.progress.update(done=True, hash=digest)
+        return digest
+
+# ============== MEDIA DERIVATIVES ==============
+
+MEDIA_PROCESS_WORKERS = int(os.environ.get("MEDIA_PROCESS_WORKERS", "2"))
+DERIVATIVE_CONTENT_TYPES = {"image/png", "image/jpeg", "image/webp", "image/bmp", "image/tiff"}
+VARIANT_CACHE_CONTROL = "public, max-age=86400"
+
+# Pillow work is CPU-bound and would stall every request, so it runs in worker processes
+_media_pool: Optional[ProcessPoolExecutor] = None
+
+def get_media_pool() -> ProcessPoolExecutor:
+    global _media_pool
+    if _media_pool is None:
+        _media_pool = ProcessPoolExecutor(max_workers=MEDIA_PROCESS_WORKERS)
+    return _media_pool
+
+async def process_media(digest: str):
+    """Build resized WebP/AVIF variants and a blur placeholder for an uploaded image"""
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(get_media_pool(), render_derivatives, str(MEDIA_DIR), digest)
+    except Exception as e:
+        logging.error(f"Error processing media {digest}: {e}")
+        return
+
+    now = datetime.now(timezone.utc)
+    await media_collection.bulk_write([
+        UpdateOne(
+            {"_id": variant["hash"]},
+            {"$setOnInsert": {
+                "content_type": variant["content_type"],
+                "size": variant["size"],
+                "derived_from": digest,
+                "created_at": now
+            }},
+            upsert=True
+        )
+        for variant in result["variants"]
+    ], ordered=False)
+    await media_collection.update_one({"_id": digest}, {"$set": result})
+    # Displays of every mosque using this image refetch and pick up the placeholder and variants
+    referencing = await settings_collection.distinct(
+        "mosque_id", {"$or": [{field: digest} for field in MEDIA_FIELDS]}
+    )
+    for mosque_id in referencing:
+        await bump_content_version("settings", mosque_id)
+    logging.info(f"Built {len(result['variants'])} variants for media {digest}")
+
+def select_variant(meta: Dict, width: int, accept: str) -> Optional[Dict]:
+    """Smallest variant at least `width` wide in the best format the client accepts"""
+    formats = [fmt for fmt in ("avif", "webp") if f"image/{fmt}" in accept]
+    candidates = [v for v in meta.get("variants", []) if v["format"] in formats]
+    if not candidates:
+        return None
+    wide_enough = [v for v in candidates if v["width"] >= width]
+    if wide_enough:
+        best_width = min(v["width"] for v in wide_enough)
+    else:
+        best_width = max(v["width"] for v in candidates)
+    at_width = [v for v in candidates if v["width"] == best_width]
+    return min(at_width, key=lambda v: formats.index(v["format"]))
+
+async def load_media_placeholders(settings: Dict) -> Dict[str, str]:
+    digests = [settings.get(field) for field in MEDIA_FIELDS]
+    digests = [d for d in digests if d and MEDIA_HASH_RE.match(d)]
+    if not digests:
+        return {}
+    cursor = media_collection.find({"_id": {"$in": digests}, "placeholder": {"$exists": True}}, {"placeholder": 1})
+    return {doc["_id"]: doc["placeholder"] async for doc in cursor}
+
+# ============== INDEXES ==============
+
+# Every index the queries below rely on; names are stable so startup can reconcile them
+INDEX_SPECS = {
+    settings_collection: [
+        IndexModel([("mosque_id", ASCENDING)], name="mosque_id_unique", unique=True),
+    ],
+    announcements_collection: [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("mosque_id", ASCENDING), ("active", ASCENDING), ("priority", DESCENDING), ("id", ASCENDING)],
+                   name="active_priority"),
+        IndexModel([("mosque_id", ASCENDING), ("priority", DESCENDING), ("id", ASCENDING)], name="priority"),
+    ],
+    quran_verses_collection: [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("mosque_id", ASCENDING), ("active", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+                   name="active_created_at"),
+        IndexModel([("mosque_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="created_at"),
+    ],
+    financial_reports_collection: [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("mosque_id", ASCENDING), ("seq", DESCENDING)], name="seq_unique", unique=True),
+        IndexModel([("mosque_id", ASCENDING), ("entry_date", ASCENDING)], name="entry_date"),
+    ],
+    financial_rollups_collection: [
+        IndexModel([("mosque_id", ASCENDING), ("period", ASCENDING), ("key", DESCENDING)], name="period_key"),
+    ],
+    prayer_schedules_collection: [
+        IndexModel([("location_key", ASCENDING), ("date", ASCENDING)], name="location_date_unique", unique=True),
+    ],
+}
+
+# Hot queries whose plans are checked at startup: (collection, filter, sort)
+INDEXED_QUERIES = [
+    (settings_collection, {"mosque_id": ""}, None),
+    (announcements_collection, {"mosque_id": "", "active": True}, [("priority", DESCENDING), ("id", ASCENDING)]),
+    (announcements_collection, {"mosque_id": ""}, [("priority", DESCENDING), ("id", ASCENDING)]),
+    (announcements_collection, {"id": ""}, None),
+    (quran_verses_collection, {"mosque_id": "", "active": True}, [("created_at", ASCENDING), ("id", ASCENDING)]),
+    (quran_verses_collection, {"mosque_id": ""}, [("created_at", ASCENDING), ("id", ASCENDING)]),
+    (quran_verses_collection, {"id": ""}, None),
+    (financial_reports_collection, {"mosque_id": ""}, [("seq", DESCENDING)]),
+    (financial_rollups_collection, {"mosque_id": "", "period": "month"}, [("key", DESCENDING)]),
+    (financial_reports_collection, {"id": ""}, None),
+    (prayer_schedules_collection, {"location_key": "", "date": ""}, None),
+]
+
+def _index_matches(existing: Dict, spec: IndexModel) -> bool:
+    wanted = spec.document
+    return (
+        list(existing["key"].items()) == list(wanted["key"].items())
+        and bool(existing.get("unique")) == bool(wanted.get("unique"))
+    )
+
+async def reconcile_indexes(collection, specs: List[IndexModel]):
+    """Create missing indexes and rebuild ones whose definition changed"""
+    existing = {index["name"]: index async for index in collection.list_indexes()}
+    missing = []
+    for spec in specs:
+        name = spec.document["name"]
+        current = existing.get(name)
+        if current is not None and not _index_matches(current, spec):
+            logging.info(f"Rebuilding index {collection.name}.{name}")
+            await collection.drop_index(name)
+            current = None
+        if current is None:
+            missing.append(spec)
+    if missing:
+        await collection.create_indexes(missing)
+        logging.info(f"Created indexes on {collection.name}: {', '.join(s.document['name'] for s in missing)}")
+
+    declared = {spec.document["name"] for spec in specs} | {"_id_"}
+    for name in existing.keys() - declared:
+        logging.info(f"Index {collection.name}.{name} is not declared; leaving it in place")
+
+def _plan_stages(plan) -> List[str]:
+    """All stage names in an explain plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+async def log_scanning_queries():
+    """Warn about hot queries whose winning plan still scans the collection"""
+    for collection, query, sort in INDEXED_QUERIES:
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = (await cursor.explain()).get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(plan):
+            logging.warning(f"Query on {collection.name} {query} sort={sort} uses a collection scan")
+
+# ============== PAGINATION ==============
+
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 500
+
+# List orders; "id" breaks ties so every position in a list is unique
+ANNOUNCEMENT_SORT = [("priority", DESCENDING), ("id", ASCENDING)]
+VERSE_SORT = [("created_at", ASCENDING), ("id", ASCENDING)]
+REPORT_SORT = [("seq", DESCENDING)]
+
+def _cursor_value(value):
+    # Dates are tagged so they compare as BSON dates, not strings, when decoded
+    return {"$date": value.isoformat()} if isinstance(value, datetime) else value
+
+def _from_cursor_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+def encode_page_cursor(doc: Dict, sort: List[tuple]) -> str:
+    """Opaque cursor holding the sort key of the last document on a page"""
+    values = json.dumps([_cursor_value(doc.get(field)) for field, _ in sort], separators=(",", ":"))
+    return base64.urlsafe_b64encode(values.encode()).decode().rstrip("=")
+
+def decode_page_cursor(after: str, sort: List[tuple]) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(after + "=" * (-len(after) % 4)))
+        if not isinstance(values, list) or len(values) != len(sort):
+            raise ValueError("wrong length")
+        return [_from_cursor_value(value) for value in values]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(sort: List[tuple], values: list) -> Dict:
+    """Documents strictly after `values` in `sort` order"""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev_field: value for (prev_field, _), value in zip(sort[:i], values[:i])}
+        clause[field] = {"$gt" if direction == ASCENDING else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+def parse_fields(fields: Optional[str], model) -> Optional[List[str]]:
+    """Validated field names from a comma-separated `fields=` parameter"""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+async def load_page(
+    collection,
+    query: Dict,
+    sort: List[tuple],
+    after: Optional[str] = None,
+    limit: int = PAGE_SIZE_DEFAULT,
+    fields: List[str] = ()
+) -> tuple:
+    """One page of documents in index order and the cursor for the next page.
+
+    Documents are projected to `fields` and returned as stored; they were
+    validated when written, so they go to the response without models.
+    """
+    if after:
+        page_filter = keyset_filter(sort, decode_page_cursor(after, sort))
+        query = {"$and": [query, page_filter]} if query else page_filter
+    # The sort keys are read too, to build the next cursor
+    projection = {"_id": 0, **{field: 1 for field in fields}, **{field: 1 for field, _ in sort}}
+
+    # One extra document tells whether another page exists
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_page_cursor(docs[limit - 1], sort) if len(docs) > limit else None
+    docs = docs[:limit]
+    unrequested = [field for field, _ in sort if field not in fields]
+    for doc in docs:
+        for field in unrequested:
+            doc.pop(field, None)
+    return docs, next_cursor
+
+def page_body(items: List[Dict], next_cursor: Optional[str]) -> tuple:
+    """List body serialized straight from the documents, and the X-Next-Cursor header"""
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return orjson.dumps(items, option=ORJSON_OPTIONS), headers
+
+# ============== FINANCIAL LEDGER ==============
+
+# Entries are append-only and ordered by seq; monthly and yearly rollups are kept
+# current on every append so summaries never scan the ledger
+LEDGER_APPEND_RETRIES = 5
+LEDGER_AMOUNT_FIELDS = ("saldo_pekan_lalu", "infaq_pekan_ini", "pengeluaran", "saldo_pekan_ini")
+ROLLUP_PERIODS = (("month", 7), ("year", 4))
+
+def rollup_keys(entry_date: str) -> List[tuple]:
+    """(period, key) pairs an entry counts towards, e.g. ("month", "2026-10")"""
+    return [(period, entry_date[:length]) for period, length in ROLLUP_PERIODS]
+
+def rollup_id(mosque_id: str, period: str, key: str) -> str:
+    return f"{mosque_id}:{period}:{key}"
+
+async def latest_ledger_entry(mosque_id: str) -> Optional[FinancialReport]:
+    """The mosque's last entry; amounts missing from reports saved before the ledger read as zero"""
+    doc = await financial_reports_collection.find_one(
+        {"mosque_id": mosque_id}, {"_id": 0}, sort=[("seq", DESCENDING)]
+    )
+    return FinancialReport(**doc) if doc else None
+
+async def append_ledger_entry(mosque_id: str, report: FinancialReportCreate, entry_date: str) -> FinancialReport:
+    """Append after the mosque's last entry; the unique (mosque_id, seq) index serializes concurrent writers"""
+    for _ in range(LEDGER_APPEND_RETRIES):
+        previous = await latest_ledger_entry(mosque_id)
+        if report.saldo_pekan_lalu is not None:
+            opening = report.saldo_pekan_lalu
+        else:
+            opening = previous.saldo_pekan_ini if previous else 0.0
+
+        entry = FinancialReport(
+            saldo_pekan_lalu=opening,
+            infaq_pekan_ini=report.infaq_pekan_ini,
+            pengeluaran=report.pengeluaran,
+            saldo_pekan_ini=opening + report.infaq_pekan_ini - report.pengeluaran,
+            period=report.period,
+            seq=(previous.seq if previous else 0) + 1,
+            entry_date=entry_date,
+            mosque_id=mosque_id
+        )
+        entry_dict = entry.model_dump()
+        try:
+            await financial_reports_collection.insert_one(entry_dict)
+        except DuplicateKeyError:
+            # Another entry took this seq first; derive the balance from it instead
+            continue
+        await apply_rollups(entry_dict)
+        return entry
+    raise HTTPException(status_code=409, detail="Ledger is busy, please retry")
+
+async def apply_rollups(entry: Dict):
+    """Fold one new entry into its month and year rollups"""
+    seq = entry["seq"]
+    ops = []
+    for period, key in rollup_keys(entry["entry_date"]):
+        _id = rollup_id(entry["mosque_id"], period, key)
+        ops.append(UpdateOne(
+            {"_id": _id},
+            {
+                "$inc": {"infaq_total": entry["infaq_pekan_ini"], "pengeluaran_total": entry["pengeluaran"], "entries": 1},
+                "$setOnInsert": {"mosque_id": entry["mosque_id"], "period": period, "key": key}
+            },
+            upsert=True
+        ))
+        # Opening and closing balances follow the lowest and highest seq, whatever order appends land in
+        ops.append(UpdateOne(
+            {"_id": _id, "$or": [{"first_seq": {"$gt": seq}}, {"first_seq": {"$exists": False}}]},
+            {"$set": {"opening_balance": entry["saldo_pekan_lalu"], "first_seq": seq}}
+        ))
+        ops.append(UpdateOne(
+            {"_id": _id, "$or": [{"last_seq": {"$lt": seq}}, {"last_seq": {"$exists": False}}]},
+            {"$set": {"closing_balance": entry["saldo_pekan_ini"], "last_seq": seq}}
+        ))
+    await financial_rollups_collection.bulk_write(ops)
+
+async def rebuild_rollups(mosque_id: str, keys: List[tuple]):
+    """Recompute rollups from their entries; only used after removals and migrations"""
+    ops = []
+    for period, key in keys:
+        _id = rollup_id(mosque_id, period, key)
+        entries = [
+            FinancialReport(**doc) async for doc in financial_reports_collection.find(
+                {"mosque_id": mosque_id, "entry_date": {"$regex": f"^{re.escape(key)}"}},
+                {"_id": 0, "seq": 1, "saldo_pekan_lalu": 1, "saldo_pekan_ini": 1, "infaq_pekan_ini": 1, "pengeluaran": 1}
+            ).sort("seq", ASCENDING)
+        ]
+        if not entries:
+            ops.append(DeleteOne({"_id": _id}))
+            continue
+        ops.append(ReplaceOne({"_id": _id}, {
+            "mosque_id": mosque_id,
+            "period": period,
+            "key": key,
+            "infaq_total": sum(e.infaq_pekan_ini for e in entries),
+            "pengeluaran_total": sum(e.pengeluaran for e in entries),
+            "entries": len(entries),
+            "opening_balance": entries[0].saldo_pekan_lalu,
+            "first_seq": entries[0].seq,
+            "closing_balance": entries[-1].saldo_pekan_ini,
+            "last_seq": entries[-1].seq
+        }, upsert=True))
+    if ops:
+        await financial_rollups_collection.bulk_write(ops)
+
+async def remove_latest_ledger_entry(mosque_id: str, report_id: str):
+    """Undo the most recent entry; earlier ones are history and stay"""
+    latest = await latest_ledger_entry(mosque_id)
+    if latest is None or latest.id != report_id:
+        exists = await financial_reports_collection.find_one({"id": report_id, "mosque_id": mosque_id}, {"_id": 1})
+        if not exists:
+            raise HTTPException(status_code=404, detail="Report not found")
+        raise HTTPException(status_code=409, detail="Only the latest ledger entry can be removed")
+    await financial_reports_collection.delete_one({"id": report_id, "mosque_id": mosque_id})
+    await rebuild_rollups(mosque_id, rollup_keys(latest.entry_date))
+
+# ============== BULK IMPORT / EXPORT ==============
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_ERRORS = 1000
+EXPORT_BATCH_SIZE = 500
+
+def import_format(request: Request, format: Optional[str]) -> str:
+    if format:
+        return format
+    content_type = request.headers.get("content-type", "")
+    return "csv" if "csv" in content_type else "jsonl"
+
+async def iter_lines(request: Request):
+    """Decoded lines of the request body, without holding more than one chunk"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+async def iter_import_rows(request: Request, fmt: str):
+    """(row number, dict or parse error) for each JSONL line or CSV record"""
+    header = None
+    record = ""
+    row_number = 0
+    async for line in iter_lines(request):
+        if fmt == "jsonl":
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                row = json.loads(line)
+                yield row_number, row if isinstance(row, dict) else ValueError("Expected a JSON object")
+            except ValueError as e:
+                yield row_number, e
+            continue
+
+        # A CSV record may span lines inside quotes; quotes are balanced once it is complete
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader([record]), [])
+        record = ""
+        if not any(v.strip() for v in values):
+            continue
+        if header is None:
+            header = [v.strip() for v in values]
+            continue
+        row_number += 1
+        # Empty cells fall back to model defaults
+        yield row_number, {key: value for key, value in zip(header, values) if value != ""}
+    if record:
+        yield row_number + 1, ValueError("Unterminated quoted field")
+
+def describe_import_error(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in error.errors())
+    return str(error)
+
+async def import_documents(request: Request, fmt: str, create_model, model, collection, mosque_id: str) -> Dict:
+    """Validate rows and upsert them by id in unordered batches, reporting failures per row"""
+    if fmt not in ("jsonl", "csv"):
+        raise HTTPException(status_code=400, detail="format must be jsonl or csv")
+    summary = {"inserted": 0, "updated": 0, "failed": 0, "errors": []}
+
+    def record_error(row_number: int, error: Exception):
+        summary["failed"] += 1
+        if len(summary["errors"]) < IMPORT_MAX_ERRORS:
+            summary["errors"].append({"row": row_number, "error": describe_import_error(error)})
+
+    async def flush(batch: List[tuple]):
+        if not batch:
+            return
+        ops = [ReplaceOne({"id": doc["id"], "mosque_id": mosque_id}, doc, upsert=True) for _, doc in batch]
+        try:
+            result = await collection.bulk_write(ops, ordered=False)
+            summary["inserted"] += result.upserted_count
+            summary["updated"] += result.matched_count
+        except BulkWriteError as e:
+            details = e.details
+            summary["inserted"] += details.get("nUpserted", 0)
+            summary["updated"] += details.get("nMatched", 0)
+            for write_error in details.get("writeErrors", []):
+                record_error(batch[write_error["index"]][0], RuntimeError(write_error.get("errmsg", "write failed")))
+
+    batch = []
+    async for row_number, row in iter_import_rows(request, fmt):
+        if isinstance(row, Exception):
+            record_error(row_number, row)
+            continue
+        try:
+            # Rows from an export keep their id and created_at, so re-importing is idempotent
+            fields = create_model(**row).model_dump()
+            extra = {key: row[key] for key in ("id", "created_at") if row.get(key)}
+            doc = model(**fields, **extra, mosque_id=mosque_id).model_dump()
+        except ValueError as e:
+            record_error(row_number, e)
+            continue
+        batch.append((row_number, doc))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush(batch)
+            batch = []
+    await flush(batch)
+    return summary
+
+def export_response(collection, query: Dict, sort: List[tuple], model, fmt: str, name: str) -> StreamingResponse:
+    """Stream a collection out of a cursor, one batch of documents in memory at a time"""
+    if fmt not in ("jsonl", "csv"):
+        raise HTTPException(status_code=400, detail="format must be jsonl or csv")
+    columns = list(model.model_fields)
+
+    async def rows():
+        cursor = collection.find(query, {"_id": 0}).sort(sort).batch_size(EXPORT_BATCH_SIZE)
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+            writer.writeheader()
+            yield buffer.getvalue()
+        async for doc in cursor:
+            if fmt == "jsonl":
+                yield orjson.dumps(doc, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+            else:
+                buffer.seek(0)
+                buffer.truncate()
+                # Same timestamp format as JSON, so exports import back unchanged
+                writer.writerow({key: orjson.dumps(value, option=ORJSON_OPTIONS).decode().strip('"')
+                                 if isinstance(value, datetime) else value for key, value in doc.items()})
+                yield buffer.getvalue()
+
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        rows(),
+        media_type=f"{media_type}; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    )
+
+# ============== ADMIN SESSIONS ==============
+
+# Admin passwords are stored as bcrypt hashes; a successful check returns a
+# short-lived signed token that write endpoints verify without a database read
+SESSION_SECRET = os.environ.get("SESSION_SECRET") or secrets.token_urlsafe(32)
+if "SESSION_SECRET" not in os.environ:
+    logging.warning("SESSION_SECRET is not set; admin sessions end on restart and are not shared between workers")
+SESSION_ALGORITHM = "HS256"
+ADMIN_SESSION_SECONDS = int(os.environ.get("ADMIN_SESSION_SECONDS", 3600))
+# Each client may try a few passwords at once, then one more every LOGIN_REFILL_SECONDS
+LOGIN_BURST = 5
+LOGIN_REFILL_SECONDS = 30.0
+LOGIN_TRACKED_CLIENTS = 10000
+# Proxies whose X-Forwarded-For is believed, as uvicorn's --forwarded-allow-ips; "*" trusts any
+FORWARDED_ALLOW_IPS = {ip.strip() for ip in os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1").split(",") if ip.strip()}
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("ascii")
+
+def check_password(password: str, stored: str) -> bool:
+    """bcrypt for stored hashes; constant-time comparison for the built-in default"""
+    if stored.startswith("$2"):
+        return bcrypt.checkpw(password.encode("utf-8"), stored.encode("ascii"))
+    return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+
+class TokenBucketLimiter:
+    """In-memory token buckets per client; the least recently seen clients are forgotten first"""
+
+    def __init__(self, capacity: int, refill_seconds: float, max_clients: int):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def acquire(self, client: str) -> float:
+        """Take a token; returns 0 when allowed, else seconds until the next token"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) / self.refill_seconds)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) * self.refill_seconds
+        self._buckets[client] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+def client_address(request: Request) -> str:
+    """The address a request came from, looking through X-Forwarded-For hops added by trusted proxies.
+
+    With uvicorn's --proxy-headers the peer is already the client and is returned as is.
+    """
+    def trusted(host: str) -> bool:
+        return "*" in FORWARDED_ALLOW_IPS or host in FORWARDED_ALLOW_IPS
+
+    host = request.client.host if request.client else "unknown"
+    if not trusted(host):
+        return host
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    # Walk back from the nearest hop; the first untrusted one is the client
+    for hop in reversed(hops):
+        host = hop
+        if not trusted(hop):
+            break
+    return host
+
+login_limiter = TokenBucketLimiter(LOGIN_BURST, LOGIN_REFILL_SECONDS, LOGIN_TRACKED_CLIENTS)
+
+def issue_admin_token(mosque_id: str) -> Dict:
+    now = int(time.time())
+    expires_at = now + ADMIN_SESSION_SECONDS
+    token = jwt.encode(
+        {"sub": mosque_id, "scope": "admin", "iat": now, "exp": expires_at},
+        SESSION_SECRET,
+        algorithm=SESSION_ALGORITHM
+    )
+    return {"token": token, "expires_at": expires_at}
+
+def read_admin_token(token: str) -> str:
+    """Mosque id a valid token was issued for"""
+    try:
+        claims = jwt.decode(token, SESSION_SECRET, algorithms=[SESSION_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Session expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid session")
+    if claims.get("scope") != "admin":
+        raise HTTPException(status_code=401, detail="Invalid session")
+    return claims["sub"]
+
+# ============== API ENDPOINTS ==============
+
+MOSQUE_ID_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+CLOCK_TIME_RE = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
+
+async def get_mosque_id(request: Request, mosque: Optional[str] = Query(None)) -> str:
+    """Mosque a request is for, from ?mosque= or the X-Mosque-Id header; 404 unless provisioned"""
+    mosque_id = mosque or request.headers.get("x-mosque-id") or DEFAULT_MOSQUE_ID
+    if not MOSQUE_ID_RE.match(mosque_id):
+        raise HTTPException(status_code=400, detail="Invalid mosque id")
+    if not await mosque_provisioned(mosque_id):
+        raise HTTPException(status_code=404, detail="Unknown mosque")
+    return mosque_id
+
+async def require_admin(request: Request, mosque_id: str = Depends(get_mosque_id)) -> str:
+    """Mosque id for write endpoints, once the bearer token proves an admin session for it"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Admin session required", headers={"WWW-Authenticate": "Bearer"})
+    if read_admin_token(token) != mosque_id:
+        raise HTTPException(status_code=403, detail="Session is for another mosque")
+    return mosque_id
+
+# Settings endpoints
+@api_router.get("/settings", response_model=MosqueSettings, response_model_exclude={"admin_password"})
+async def get_settings(request: Request, mosque_id: str = Depends(get_mosque_id)):
+    """Get mosque settings"""
+    async def build():
+        settings = await load_settings(mosque_id)
+        return settings.model_dump_json(exclude={"admin_password"}).encode(), {}
+
+    return await cached_response(request, content_etag("settings", mosque_id), (mosque_id, "settings"), build)
+
+@api_router.put("/settings")
+async def update_settings(settings_update: MosqueSettingsUpdate, mosque_id: str = Depends(require_admin)):
+    """Update mosque settings"""
+    current = (await load_settings(mosque_id)).model_dump()
+    update_data = settings_update.model_dump(exclude_none=True)
+    # Checked here, since every mosque's daily rollover reads them
+    if "timezone" in update_data and update_data["timezone"] not in pytz.all_timezones_set:
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {update_data['timezone']}")
+    bad_times = [name for name, clock in update_data.get("manual_prayer_times", {}).items() if not CLOCK_TIME_RE.match(clock)]
+    if bad_times:
+        raise HTTPException(status_code=400, detail=f"Manual times must be HH:MM: {', '.join(bad_times)}")
+    if update_data.get("admin_password"):
+        update_data["admin_password"] = await asyncio.to_thread(hash_password, update_data["admin_password"])
+    else:
+        update_data.pop("admin_password", None)
+    # Media arrives through the streaming upload endpoints; inline data URLs are
+    # only accepted from older versions' settings, by the startup migration
+    for field in MEDIA_FIELDS:
+        if update_data.get(field, "").startswith("data:"):
+            raise HTTPException(status_code=415, detail=f"Upload {field} through /api/media instead of a data URL")
+    update_data["updated_at"] = datetime.now(timezone.utc)
+
+    # One upsert: fields not being updated are only written when creating the document
+    # The built-in default password is never stored; without a saved hash it still applies
+    defaults = MosqueSettings(mosque_id=mosque_id).model_dump(exclude={"admin_password"})
+    insert_data = {k: v for k, v in defaults.items() if k not in update_data}
+    # The snapshot read above may predate another worker's write; install what was actually saved
+    saved = await settings_collection.find_one_and_update(
+        {"mosque_id": mosque_id},
+        {"$set": update_data, "$setOnInsert": insert_data},
+        projection=settings_projection(MosqueSettings),
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    new_settings = MosqueSettings(**saved)
+    await bump_content_version("settings", mosque_id)
+    store_settings_snapshot(new_settings)
+
+    # Recompute the stored schedule ahead of time for a new location/method
+    new_dict = new_settings.model_dump()
+    if any(new_dict[f] != current[f] for f in SCHEDULE_SETTINGS_FIELDS):
+        run_in_background(precompute_prayer_schedule(new_dict))
+    
+    return {"success": True, "message": "Settings updated"}
+
+# Prayer times endpoint
+@api_router.get("/prayer-times", response_model=PrayerTimesResponse)
+async def get_prayer_times(mosque_id: str = Depends(get_mosque_id)):
+    """Get current prayer times"""
+    # Get settings
+    settings = (await load_settings_view(mosque_id, LocationSettings)).model_dump()
+    return await build_prayer_times(settings)
+
+async def build_prayer_times(settings: Dict) -> PrayerTimesResponse:
+    """Current prayer times and countdown for already-loaded settings"""
+    record = await get_daily_record(settings)
+    now = datetime.now(pytz.timezone(settings["timezone"]))
+    prayer_info = record.timeline.next_prayer(now.hour * 3600 + now.minute * 60 + now.second)
+    times = record.times
+    
+    return PrayerTimesResponse(
+        fajr=times["fajr"],
+        imsya=times["imsya"],
+        syuruq=times["sunrise"],
+        dhuhr=times["dhuhr"],
+        asr=times["asr"],
+        maghrib=times["maghrib"],
+        isha=times["isha"],
+        gregorian_date=record.gregorian_date,
+        hijri_date=record.hijri_date,
+        next_prayer=prayer_info["prayer"],
+        time_until_next=prayer_info["minutes_until"],
+        is_iqomah_countdown=prayer_info["is_iqomah_countdown"],
+        iqomah_times=record.iqomah_times
+    )
+
+async def build_prayer_events(settings: Dict, count: int) -> List[PrayerEvent]:
+    """The next `count` adhan, iqomah, imsya and syuruq events, crossing midnight as needed"""
+    tz = pytz.timezone(settings["timezone"])
+    now = datetime.now(tz)
+    now_epoch = int(now.timestamp())
+    events = []
+
+    day = now.date()
+    last_day = day + timedelta(days=count // 9 + 2)
+    while len(events) < count and day <= last_day:
+        times = await get_day_clock_times(settings, day)
+        day_events = [("imsya", "imsya", times["imsya"], 0), ("syuruq", "syuruq", times["sunrise"], 0)]
+        for prayer in PRAYER_NAMES:
+            day_events.append((prayer, "adhan", times[prayer], 0))
+            day_events.append((prayer, "iqomah", times[prayer], settings["iqomah_delays"].get(prayer, 10)))
+
+        for prayer, phase, clock, delay in day_events:
+            local_dt = tz.localize(datetime.combine(day, datetime.strptime(clock, "%H:%M").time()))
+            local_dt = tz.normalize(local_dt + timedelta(minutes=delay))
+            at = int(local_dt.timestamp())
+            if at > now_epoch:
+                events.append(PrayerEvent(prayer=prayer, phase=phase, at=at, local_time=local_dt.strftime("%H:%M")))
+        day += timedelta(days=1)
+
+    events.sort(key=lambda event: event.at)
+    return events[:count]
+
+@api_router.get("/prayer-times/timeline", response_model=PrayerTimelineResponse)
+async def get_prayer_timeline(count: int = Query(12, ge=1, le=60), mosque_id: str = Depends(get_mosque_id)):
+    """Upcoming prayer events as UTC epochs, so displays can count down without polling"""
+    settings = (await load_settings_view(mosque_id, LocationSettings)).model_dump()
+    return PrayerTimelineResponse(
+        generated_at=int(time.time()),
+        timezone=settings["timezone"],
+        events=await build_prayer_events(settings, count)
+    )
+
+MAX_PRAYER_TIMES_RANGE_DAYS = 1100
+
+@api_router.get("/prayer-times/range", response_model=PrayerTimesRangeResponse)
+async def get_prayer_times_range(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    tz_str: Optional[str] = Query(None, alias="timezone"),
+    calculation_method: Optional[str] = None,
+    asr_school: Optional[str] = None,
+    mosque_id: str = Depends(get_mosque_id)
+):
+    """Get a table of daily prayer times, e.g. a month or a year for a printed calendar"""
+    settings = (await load_settings_view(mosque_id, LocationSettings)).model_dump()
+
+    location_override = any(v is not None for v in (latitude, longitude, tz_str, calculation_method, asr_school))
+    latitude = settings["latitude"] if latitude is None else latitude
+    longitude = settings["longitude"] if longitude is None else longitude
+    tz_str = tz_str or settings["timezone"]
+    calculation_method = calculation_method or settings["calculation_method"]
+    asr_school = asr_school or settings.get("asr_school", "SHAFI")
+
+    try:
+        tz = pytz.timezone(tz_str)
+    except pytz.UnknownTimeZoneError:
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz_str}")
+
+    start = start or datetime.now(tz).date()
+    end = end or start + timedelta(days=29)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days + 1 > MAX_PRAYER_TIMES_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_PRAYER_TIMES_RANGE_DAYS} days")
+
+    days = calculate_prayer_times_range(
+        start,
+        end,
+        latitude,
+        longitude,
+        tz_str,
+        calculation_method,
+        settings.get("imsya_offset", 10),
+        asr_school
+    )
+
+    # Manual times apply to the mosque's own schedule only
+    if not location_override and settings.get("use_manual_times") and settings.get("manual_prayer_times"):
+        manual_times = settings["manual_prayer_times"]
+        fajr_dt = datetime.strptime(manual_times.get("fajr", "04:30"), "%H:%M")
+        imsya_time = (fajr_dt - timedelta(minutes=settings.get("imsya_offset", 10))).strftime("%H:%M")
+        for day in days:
+            day.update({
+                "fajr": manual_times.get("fajr", "04:30"),
+                "imsya": imsya_time,
+                "syuruq": manual_times.get("sunrise", "05:45"),
+                "dhuhr": manual_times.get("dhuhr", "11:45"),
+                "asr": manual_times.get("asr", "15:15"),
+                "maghrib": manual_times.get("maghrib", "17:45"),
+                "isha": manual_times.get("isha", "19:00")
+            })
+
+    return PrayerTimesRangeResponse(
+        latitude=latitude,
+        longitude=longitude,
+        timezone=tz_str,
+        calculation_method=calculation_method,
+        asr_school=asr_school,
+        days=days
+    )
+
+# Announcements endpoints
+@api_router.get("/announcements", response_model=List[Announcement])
+async def get_announcements(
+    request: Request,
+    active_only: bool = True,
+    after: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    fields: Optional[str] = None,
+    mosque_id: str = Depends(get_mosque_id)
+):
+    """Get announcements by priority, one page at a time"""
+    etag = content_etag("announcements", mosque_id, active_only, after, limit, fields)
+    field_list = parse_fields(fields, Announcement)
+
+    async def build():
+        announcements, next_cursor = await load_announcements(mosque_id, active_only, after, limit, field_list)
+        return page_body(announcements, next_cursor)
+
+    return await cached_response(request, etag, (mosque_id, "announcements"), build)
+
+async def load_announcements(
+    mosque_id: str,
+    active_only: bool = True,
+    after: Optional[str] = None,
+    limit: int = PAGE_SIZE_DEFAULT,
+    fields: Optional[List[str]] = None
+) -> tuple:
+    query = {"mosque_id": mosque_id, "active": True} if active_only else {"mosque_id": mosque_id}
+    fields = fields or list(Announcement.model_fields)
+    return await load_page(announcements_collection, query, ANNOUNCEMENT_SORT, after, limit, fields)
+
+@api_router.post("/announcements", response_model=Announcement)
+async def create_announcement(announcement: AnnouncementCreate, mosque_id: str = Depends(require_admin)):
+    """Create new announcement"""
+    new_ann = Announcement(**announcement.model_dump(), mosque_id=mosque_id)
+    await announcements_collection.insert_one(new_ann.model_dump())
+    await bump_content_version("announcements", mosque_id)
+    return new_ann
+
+@api_router.delete("/announcements/{announcement_id}")
+async def delete_announcement(announcement_id: str, mosque_id: str = Depends(require_admin)):
+    """Delete announcement"""
+    result = await announcements_collection.delete_one({"id": announcement_id, "mosque_id": mosque_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Announcement not found")
+    await bump_content_version("announcements", mosque_id)
+    return {"success": True}
+
+@api_router.post("/announcements/import")
+async def import_announcements(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(jsonl|csv)$"),
+    mosque_id: str = Depends(require_admin)
+):
+    """Bulk import announcements from a JSONL or CSV body"""
+    summary = await import_documents(request, import_format(request, format), AnnouncementCreate, Announcement, announcements_collection, mosque_id)
+    if summary["inserted"] or summary["updated"]:
+        await bump_content_version("announcements", mosque_id)
+    return summary
+
+@api_router.get("/announcements/export")
+async def export_announcements(
+    active_only: bool = False,
+    format: str = Query("jsonl", pattern="^(jsonl|csv)$"),
+    mosque_id: str = Depends(get_mosque_id)
+):
+    """Stream all announcements as JSONL or CSV"""
+    query = {"mosque_id": mosque_id, "active": True} if active_only else {"mosque_id": mosque_id}
+    return export_response(announcements_collection, query, ANNOUNCEMENT_SORT, Announcement, format, "announcements")
+
+# Quran verses endpoints
+@api_router.get("/quran-verses", response_model=List[QuranVerse])
+async def get_quran_verses(
+    request: Request,
+    active_only: bool = True,
+    after: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    fields: Optional[str] = None,
+    mosque_id: str = Depends(get_mosque_id)
+):
+    """Get Quran verses in the order they were added, one page at a time"""
+    etag = content_etag("quran_verses", mosque_id, active_only, after, limit, fields)
+    field_list = parse_fields(fields, QuranVerse)
+
+    async def build():
+        verses, next_cursor = await load_quran_verses(mosque_id, active_only, after, limit, field_list)
+        return page_body(verses, next_cursor)
+
+    return await cached_response(request, etag, (mosque_id, "quran_verses"), build)
+
+async def load_quran_verses(
+    mosque_id: str,
+    active_only: bool = True,
+    after: Optional[str] = None,
+    limit: int = PAGE_SIZE_DEFAULT,
+    fields: Optional[List[str]] = None
+) -> tuple:
+    query = {"mosque_id": mosque_id, "active": True} if active_only else {"mosque_id": mosque_id}
+    fields = fields or list(QuranVerse.model_fields)
+    return await load_page(quran_verses_collection, query, VERSE_SORT, after, limit, fields)
+
+@api_router.post("/quran-verses", response_model=QuranVerse)
+async def create_quran_verse(verse: QuranVerseCreate, mosque_id: str = Depends(require_admin)):
+    """Create new Quran verse"""
+    new_verse = QuranVerse(**verse.model_dump(), mosque_id=mosque_id)
+    await quran_verses_collection.insert_one(new_verse.model_dump())
+    await bump_content_version("quran_verses", mosque_id)
+    return new_verse
+
+@api_router.delete("/quran-verses/{verse_id}")
+async def delete_quran_verse(verse_id: str, mosque_id: str = Depends(require_admin)):
+    """Delete Quran verse"""
+    result = await quran_verses_collection.delete_one({"id": verse_id, "mosque_id": mosque_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Verse not found")
+    await bump_content_version("quran_verses", mosque_id)
+    return {"success": True}
+
+@api_router.post("/quran-verses/import")
+async def import_quran_verses(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(jsonl|csv)$"),
+    mosque_id: str = Depends(require_admin)
+):
+    """Bulk import Quran verses from a JSONL or CSV body"""
+    summary = await import_documents(request, import_format(request, format), QuranVerseCreate, QuranVerse, quran_verses_collection, mosque_id)
+    if summary["inserted"] or summary["updated"]:
+        await bump_content_version("quran_verses", mosque_id)
+    return summary
+
+@api_router.get("/quran-verses/export")
+async def export_quran_verses(
+    active_only: bool = False,
+    format: str = Query("jsonl", pattern="^(jsonl|csv)$"),
+    mosque_id: str = Depends(get_mosque_id)
+):
+    """Stream all Quran verses as JSONL or CSV"""
+    query = {"mosque_id": mosque_id, "active": True} if active_only else {"mosque_id": mosque_id}
+    return export_response(quran_verses_collection, query, VERSE_SORT, QuranVerse, format, "quran_verses")
+
+# Financial reports endpoints
+@api_router.get("/financial-reports", response_model=List[FinancialReport])
+async def get_financial_reports(
+    request: Request,
+    after: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    fields: Optional[str] = None,
+    mosque_id: str = Depends(get_mosque_id)
+):
+    """Get financial reports, newest first, one page at a time"""
+    etag = content_etag("financial_reports", mosque_id, after, limit, fields)
+    field_list = parse_fields(fields, FinancialReport)
+
+    async def build():
+        reports, next_cursor = await load_financial_reports(mosque_id, after, limit, field_list)
+        return page_body(reports, next_cursor)
+
+    return await cached_response(request, etag, (mosque_id, "financial_reports"), build)
+
+async def load_financial_reports(
+    mosque_id: str,
+    after: Optional[str] = None,
+    limit: int = PAGE_SIZE_DEFAULT,
+    fields: Optional[List[str]] = None
+) -> tuple:
+    fields = fields or list(FinancialReport.model_fields)
+    return await load_page(financial_reports_collection, {"mosque_id": mosque_id}, REPORT_SORT, after, limit, fields)
+
+@api_router.post("/financial-reports", response_model=FinancialReport)
+async def create_financial_report(report: FinancialReportCreate, mosque_id: str = Depends(require_admin)):
+    """Append a weekly ledger entry; Saldo Pekan Lalu carries over from the previous entry"""
+    entry_date = report.entry_date
+    if entry_date is None:
+        settings = await load_settings_view(mosque_id, LocationSettings)
+        entry_date = datetime.now(pytz.timezone(settings.timezone)).date()
+
+    new_report = await append_ledger_entry(mosque_id, report, entry_date.isoformat())
+    await bump_content_version("financial_reports", mosque_id)
+    return new_report
+
+@api_router.get("/financial-reports/summary", response_model=FinancialSummary)
+async def get_financial_summary(request: Request, mosque_id: str = Depends(get_mosque_id)):
+    """Current balance with this month's and year's totals, read from the rollups"""
+    async def build():
+        summary = await load_financial_summary(mosque_id)
+        return summary.model_dump_json().encode(), {}
+
+    etag = content_etag("financial_reports", mosque_id, "summary")
+    return await cached_response(request, etag, (mosque_id, "financial_reports"), build)
+
+async def load_financial_summary(mosque_id: str) -> FinancialSummary:
+    latest = await latest_ledger_entry(mosque_id)
+    if latest is None:
+        return FinancialSummary(balance=0.0)
+    month_key, year_key = [rollup_id(mosque_id, period, key) for period, key in rollup_keys(latest.entry_date)]
+    rollups = {
+        doc["_id"]: FinancialRollup(**doc)
+        async for doc in financial_rollups_collection.find({"_id": {"$in": [month_key, year_key]}})
+    }
+    return FinancialSummary(
+        balance=latest.saldo_pekan_ini,
+        latest=latest,
+        month=rollups.get(month_key),
+        year=rollups.get(year_key)
+    )
+
+@api_router.get("/financial-reports/rollups", response_model=List[FinancialRollup])
+async def get_financial_rollups(
+    request: Request,
+    period: str = Query("month", pattern="^(month|year)$"),
+    limit: int = Query(12, ge=1, le=120),
+    mosque_id: str = Depends(get_mosque_id)
+):
+    """Most recent monthly or yearly totals, for charts"""
+    async def build():
+        rollups = await financial_rollups_collection.find(
+            {"mosque_id": mosque_id, "period": period}
+        ).sort("key", DESCENDING).to_list(limit)
+        return orjson.dumps([FinancialRollup(**r).model_dump() for r in rollups], option=ORJSON_OPTIONS), {}
+
+    etag = content_etag("financial_reports", mosque_id, "rollups", period, limit)
+    return await cached_response(request, etag, (mosque_id, "financial_reports"), build)
+
+@api_router.delete("/financial-reports/{report_id}")
+async def delete_financial_report(report_id: str, mosque_id: str = Depends(require_admin)):
+    """Remove the latest ledger entry, e.g. to correct a typo"""
+    await remove_latest_ledger_entry(mosque_id, report_id)
+    await bump_content_version("financial_reports", mosque_id)
+    return {"success": True}
+
+# Password verification endpoint
+@api_router.post("/verify-password")
+async def verify_password(data: PasswordVerify, request: Request, mosque_id: str = Depends(get_mosque_id)):
+    """Verify admin password and start a short admin session"""
+    # Throttle before reading the password, so guessing costs nothing but the attempt
+    # One bucket per client and mosque, so a client can only lock itself out of one mosque
+    wait = login_limiter.acquire(f"{client_address(request)} {mosque_id}")
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts, please wait",
+            headers={"Retry-After": str(int(wait) + 1)}
+        )
+
+    settings = await load_settings_view(mosque_id, AuthSettings)
+    # bcrypt is deliberately slow; keep it off the event loop
+    if await asyncio.to_thread(check_password, data.password, settings.admin_password):
+        return {"success": True, "message": "Password verified", **issue_admin_token(mosque_id)}
+    else:
+        raise HTTPException(status_code=401, detail="Invalid password")
+
+# City coordinates endpoint
+@api_router.get("/cities")
+async def get_cities():
+    """Get list of cities with coordinates"""
+    cities = {
+        "Jakarta": {"lat": -6.2088, "lon": 106.8456, "tz": "Asia/Jakarta"},
+        "Bandung": {"lat": -6.9175, "lon": 107.6191, "tz": "Asia/Jakarta"},
+        "Yogyakarta": {"lat": -7.7956, "lon": 110.3695, "tz": "Asia/Jakarta"},
+        "Solo": {"lat": -7.5505, "lon": 110.8283, "tz": "Asia/Jakarta"},
+        "Semarang": {"lat": -6.9932, "lon": 110.4203, "tz": "Asia/Jakarta"},
         "Surabaya": {"lat": -7.2575, "lon": 112.7521, "tz": "Asia/Jakarta"},
         "Malang": {"lat": -7.9666, "lon": 112.6326, "tz": "Asia/Jakarta"},
         "Kediri": {"lat": -7.8167, "lon": 112.0167, "tz": "Asia/Jakarta"},
@@ -545,81 +2707,210 @@ async def get_cities():
 
 # File upload endpoint
 from fastapi import UploadFile, File
-import base64
+from starlette.responses import FileResponse, RedirectResponse
 
 @api_router.post("/upload-file")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload file and return base64 data URL"""
+async def upload_file(
+    request: Request,
+    file: UploadFile = File(...),
+    upload_id: Optional[str] = Query(None),
+    mosque_id: str = Depends(require_admin)
+):
+    """Upload a multipart file into the media store and return its hash"""
+    content_type = file.content_type or "image/png"
+    check_upload_headers(content_type, request.headers.get("content-length"))
+    progress = track_upload(upload_id, file.size)
     try:
-        contents = await file.read()
-        base64_encoded = base64.b64encode(contents).decode('utf-8')
-        
-        # Determine mime type
-        mime_type = file.content_type or "image/png"
-        
-        # Return as data URL
-        data_url = f"data:{mime_type};base64,{base64_encoded}"
-        
-        return {
-            "success": True,
-            "data_url": data_url,
-            "filename": file.filename,
-            "size": len(contents)
-        }
+        async with MediaWriter(progress) as writer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await writer.write(chunk)
+            digest = await writer.commit()
+        await register_media(digest, writer.size, content_type, file.filename)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error uploading file: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Weather API endpoint
-@api_router.get("/weather")
-async def get_weather():
-    """Get current weather"""
+    return {
+        "success": True,
+        "hash": digest,
+        "url": f"/api/media/{digest}",
+        "filename": file.filename,
+        "size": writer.size
+    }
+
+@api_router.put("/media")
+async def upload_media_stream(
+    request: Request,
+    upload_id: Optional[str] = Query(None),
+    mosque_id: str = Depends(require_admin)
+):
+    """Stream a raw request body into the media store, hashing as it arrives"""
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip()
+    content_length = request.headers.get("content-length")
+    check_upload_headers(content_type, content_length)
+    filename = unquote(request.headers.get("x-filename", "")) or None
+    progress = track_upload(upload_id, int(content_length) if content_length and content_length.isdigit() else None)
     try:
-        settings = await settings_collection.find_one({}, {"_id": 0})
-        if not settings:
-            settings = MosqueSettings().model_dump()
-        
-        lat = settings["latitude"]
-        lon = settings["longitude"]
-        
-        # Using OpenWeatherMap free API
-        api_key = "895284fb2d2c50a520ea537456963d9c"  # Free demo key
-        url = f"http://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "appid": api_key,
-            "units": "metric",
-            "lang": "id"
-        }
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, params=params)
-            data = response.json()
-        
-        if response.status_code == 200:
-            return {
-                "temperature": round(data["main"]["temp"]),
-                "feels_like": round(data["main"]["feels_like"]),
-                "humidity": data["main"]["humidity"],
-                "description": data["weather"][0]["description"],
-                "icon": data["weather"][0]["icon"],
-                "wind_speed": data["wind"]["speed"]
-            }
-        else:
-            raise HTTPException(status_code=500, detail="Weather API error")
-            
+        async with MediaWriter(progress) as writer:
+            async for chunk in request.stream():
+                await writer.write(chunk)
+            digest = await writer.commit()
+        await register_media(digest, writer.size, content_type, filename)
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Error fetching weather: {e}")
-        # Return default weather data
-        return {
-            "temperature": 28,
-            "feels_like": 30,
-            "humidity": 75,
-            "description": "berawan",
-            "icon": "02d",
-            "wind_speed": 2.5
-        }
+        logging.error(f"Error uploading media stream: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "success": True,
+        "hash": digest,
+        "url": f"/api/media/{digest}",
+        "filename": filename,
+        "size": writer.size
+    }
+
+@api_router.get("/uploads/{upload_id}")
+async def get_upload_progress(upload_id: str):
+    """Bytes received so far for an upload started with ?upload_id="""
+    progress = _upload_progress.get(upload_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return progress
+
+@api_router.get("/media/{digest}")
+async def get_media(digest: str, request: Request, w: Optional[int] = Query(None, ge=1, le=7680)):
+    """Serve a stored file; its URL never changes content so it is cached forever.
+
+    With `w`, redirect to the derivative best matching that display width.
+    """
+    if not MEDIA_HASH_RE.match(digest):
+        raise HTTPException(status_code=404, detail="Media not found")
+    meta = await media_collection.find_one({"_id": digest})
+    path = media_path(digest)
+    if not meta or not path.exists():
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    if w is not None:
+        variant = select_variant(meta, w, request.headers.get("accept", ""))
+        if variant:
+            return RedirectResponse(
+                f"/api/media/{variant['hash']}",
+                status_code=307,
+                headers={"Cache-Control": VARIANT_CACHE_CONTROL, "Vary": "Accept"}
+            )
+
+    etag = f'"{digest}"'
+    # Until variants exist a width request falls back to the original, so it must revalidate
+    cache_control = MEDIA_CACHE_CONTROL if w is None else "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    size = meta["size"]
+    range_header = request.headers.get("range")
+    if range_header:
+        byte_range = parse_byte_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        body = await asyncio.to_thread(_read_media_range, path, start, end - start + 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(content=body, status_code=206, media_type=meta["content_type"], headers=headers)
+
+    return FileResponse(path, media_type=meta["content_type"], headers=headers)
+
+# Weather API endpoint
+@api_router.get("/weather")
+async def get_weather(mosque_id: str = Depends(get_mosque_id)):
+    """Get current weather from the per-location cache"""
+    settings = (await load_settings_view(mosque_id, LocationSettings)).model_dump()
+
+    # Display hides the weather panel when nothing has been fetched yet
+    return await get_cached_weather(settings["latitude"], settings["longitude"])
+
+# Display bundle endpoint
+DISPLAY_TIMELINE_EVENTS = 24
+# Only the fields the display renders
+DISPLAY_FIELDS = {
+    "announcements": ["text"],
+    "quran_verses": ["arabic", "translation", "reference"],
+    "financial_reports": ["saldo_pekan_lalu", "infaq_pekan_ini", "pengeluaran", "saldo_pekan_ini", "period"],
+}
+
+@api_router.get("/display-bundle", response_model=DisplayBundle)
+async def get_display_bundle(request: Request, mosque_id: str = Depends(get_mosque_id)):
+    """Everything the display shows, with settings loaded once and the rest read concurrently"""
+    version = current_content_version(mosque_id)
+    # Countdowns move every minute, so the body is kept per content version and minute
+    etag = '"' + "-".join([mosque_id, "bundle", version, str(int(time.time() // 60))]) + '"'
+
+    async def build():
+        settings = (await load_settings_view(mosque_id, DisplaySettings)).model_dump()
+        prayer_times, timeline, announcements, verses, reports, weather, placeholders = await asyncio.gather(
+            build_prayer_times(settings),
+            build_prayer_events(settings, DISPLAY_TIMELINE_EVENTS),
+            load_announcements(mosque_id, active_only=True, fields=DISPLAY_FIELDS["announcements"]),
+            load_quran_verses(mosque_id, active_only=True, limit=PAGE_SIZE_MAX, fields=DISPLAY_FIELDS["quran_verses"]),
+            load_financial_reports(mosque_id, limit=1, fields=DISPLAY_FIELDS["financial_reports"]),
+            get_cached_weather(settings["latitude"], settings["longitude"]),
+            load_media_placeholders(settings)
+        )
+
+        # Validated once here and serialized once by pydantic-core, not again by FastAPI
+        bundle = DisplayBundle(
+            version=version,
+            prayer_times=prayer_times,
+            timeline=timeline,
+            settings=settings,
+            announcements=announcements[0],
+            quran_verses=verses[0],
+            financial_reports=reports[0],
+            weather=weather,
+            media_placeholders=placeholders
+        )
+        return bundle.model_dump_json().encode(), {}
+
+    return await cached_response(request, etag, (mosque_id, ANY_CONTENT), build)
+
+# Server-sent events endpoint
+@api_router.get("/events")
+async def stream_events(mosque_id: str = Depends(get_mosque_id)):
+    """Push content changes and adhan/iqomah boundaries to displays as they happen"""
+    queue = event_broadcaster.subscribe(mosque_id)
+
+    async def event_stream():
+        try:
+            yield f"retry: 5000\nevent: hello\ndata: {json.dumps({'version': current_content_version(mosque_id)})}\n\n"
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                yield message
+        finally:
+            event_broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Upstream health endpoint
+@api_router.get("/upstream-status")
+async def get_upstream_status():
+    """Circuit breaker state, request coalescing counters and settings read sizes"""
+    status = {
+        service.name: {"circuit": service.breaker.state, **service.flights.stats()}
+        for service in (aladhan_service, openweather_service)
+    }
+    status[schedule_flights.name] = schedule_flights.stats()
+    status["settings_reads"] = settings_read_stats
+    status["response_cache"] = response_cache.stats()
+    return status
 
 # Include router
 app.include_router(api_router)
@@ -630,6 +2921,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 # Configure logging
@@ -639,6 +2931,155 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def open_http_client():
+    get_http_client()
+
+@app.on_event("startup")
+async def migrate_default_tenant():
+    """Assign data saved before multi-mosque support to the default mosque.
+
+    Runs before the ledger migration and the indexes, which are keyed by mosque.
+    """
+    try:
+        untagged = {"mosque_id": {"$exists": False}}
+        migrated = 0
+        for collection in (settings_collection, announcements_collection,
+                           quran_verses_collection, financial_reports_collection):
+            result = await collection.update_many(untagged, {"$set": {"mosque_id": DEFAULT_MOSQUE_ID}})
+            migrated += result.modified_count
+        # Old rollups were keyed by period alone; the ledger migration rebuilds them
+        await financial_rollups_collection.delete_many(untagged)
+        if migrated:
+            logging.info(f"Assigned {migrated} existing documents to mosque {DEFAULT_MOSQUE_ID}")
+    except Exception as e:
+        logging.error(f"Error migrating to the default mosque: {e}")
+
+@app.on_event("startup")
+async def migrate_timestamps():
+    """Store created_at saved as ISO strings by older versions as BSON dates.
+
+    Runs before the ledger migration, which numbers entries in created_at order.
+    """
+    try:
+        for collection in (announcements_collection, quran_verses_collection, financial_reports_collection):
+            ops = [
+                UpdateOne({"_id": doc["_id"]}, {"$set": {"created_at": datetime.fromisoformat(doc["created_at"])}})
+                async for doc in collection.find({"created_at": {"$type": "string"}}, {"created_at": 1})
+            ]
+            if ops:
+                await collection.bulk_write(ops, ordered=False)
+                logging.info(f"Converted {len(ops)} {collection.name} timestamps to dates")
+    except Exception as e:
+        logging.error(f"Error converting timestamps: {e}")
+
+@app.on_event("startup")
+async def migrate_financial_ledger():
+    """Number reports saved before the ledger existed and build their rollups.
+
+    Runs before the indexes are built, since (mosque_id, seq) is unique.
+    """
+    try:
+        for mosque_id in await financial_reports_collection.distinct("mosque_id"):
+            unnumbered = await financial_reports_collection.find(
+                {"mosque_id": mosque_id, "seq": {"$exists": False}},
+                {"_id": 1, "created_at": 1, **{field: 1 for field in LEDGER_AMOUNT_FIELDS}}
+            ).sort("created_at", ASCENDING).to_list(None)
+            latest = await financial_reports_collection.find_one(
+                {"mosque_id": mosque_id, "seq": {"$exists": True}}, {"seq": 1}, sort=[("seq", DESCENDING)]
+            )
+            next_seq = (latest["seq"] if latest else 0) + 1
+            for offset, doc in enumerate(unnumbered):
+                created_at = str(doc.get("created_at") or datetime.now(timezone.utc).isoformat())
+                await financial_reports_collection.update_one(
+                    {"_id": doc["_id"]},
+                    {"$set": {
+                        "seq": next_seq + offset,
+                        "entry_date": created_at[:10],
+                        # Reports from before the ledger, e.g. {title, amount}, count as zero
+                        **{field: doc.get(field, 0.0) for field in LEDGER_AMOUNT_FIELDS}
+                    }}
+                )
+
+            if unnumbered or not await financial_rollups_collection.find_one({"mosque_id": mosque_id}, {"_id": 1}):
+                entry_dates = await financial_reports_collection.distinct("entry_date", {"mosque_id": mosque_id})
+                keys = {key for entry_date in entry_dates for key in rollup_keys(entry_date)}
+                await rebuild_rollups(mosque_id, sorted(keys))
+                if unnumbered:
+                    logging.info(f"Added {len(unnumbered)} existing financial reports to the {mosque_id} ledger")
+    except Exception as e:
+        logging.error(f"Error migrating financial ledger: {e}")
+
+@app.on_event("startup")
+async def ensure_indexes():
+    """Declare the indexes every query needs, then check the plans actually use them"""
+    for collection, specs in INDEX_SPECS.items():
+        try:
+            await reconcile_indexes(collection, specs)
+        except Exception as e:
+            logging.error(f"Error reconciling indexes on {collection.name}: {e}")
+    try:
+        await log_scanning_queries()
+    except Exception as e:
+        logging.error(f"Error checking query plans: {e}")
+
+@app.on_event("startup")
+async def start_event_loops():
+    run_in_background(content_version_sync_loop())
+    run_in_background(daily_rollover_loop())
+    run_in_background(sse_heartbeat_loop())
+    run_in_background(prayer_boundary_loop())
+
+@app.on_event("startup")
+async def migrate_inline_media():
+    """Move base64 images saved in settings by older versions into the media store"""
+    try:
+        inline = {"$or": [{field: {"$regex": "^data:"}} for field in MEDIA_FIELDS]}
+        projection = {"mosque_id": 1, **{field: 1 for field in MEDIA_FIELDS}}
+        async for settings in settings_collection.find(inline, projection):
+            update_data = {}
+            for field in MEDIA_FIELDS:
+                try:
+                    reference = await media_reference(settings.get(field))
+                except HTTPException as e:
+                    # Never serve what an upload would have been refused for
+                    logging.warning(f"Dropping inline {field} of {settings['mosque_id']}: {e.detail}")
+                    reference = ""
+                if reference != settings.get(field):
+                    update_data[field] = reference
+            if update_data:
+                await settings_collection.update_one({"_id": settings["_id"]}, {"$set": update_data})
+                await bump_content_version("settings", settings["mosque_id"])
+                logging.info(f"Moved inline media out of {settings['mosque_id']} settings: {', '.join(update_data)}")
+    except Exception as e:
+        logging.error(f"Error migrating inline media: {e}")
+
+@app.on_event("startup")
+async def migrate_admin_passwords():
+    """Replace plaintext admin passwords saved by older versions with bcrypt hashes"""
+    try:
+        plaintext = {"admin_password": {"$exists": True, "$not": {"$regex": r"^\$2"}}}
+        async for settings in settings_collection.find(plaintext, {"mosque_id": 1, "admin_password": 1}):
+            hashed = await asyncio.to_thread(hash_password, settings["admin_password"])
+            await settings_collection.update_one({"_id": settings["_id"]}, {"$set": {"admin_password": hashed}})
+            await bump_content_version("settings", settings["mosque_id"])
+            logging.info(f"Hashed the admin password of {settings['mosque_id']}")
+    except Exception as e:
+        logging.error(f"Error hashing admin passwords: {e}")
+
+@app.on_event("startup")
+async def warm_prayer_schedule():
+    """Make sure today's schedule for the default mosque is stored"""
+    try:
+        settings = (await load_settings_view(DEFAULT_MOSQUE_ID, LocationSettings)).model_dump()
+        await get_schedule_row(settings, datetime.now(pytz.timezone(settings["timezone"])).date())
+    except Exception as e:
+        logging.error(f"Error warming prayer schedule: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+    if http_client is not None:
+        await http_client.aclose()
+    if _media_pool is not None:
+        _media_pool.shutdown(wait=False, cancel_futures=True)
\ No newline at end of file
@@ -6,9 +6,11 @@ import json
 from datetime import datetime
 
 class MosqueAPITester:
-    def __init__(self, base_url="https://ummah-display.preview.emergentagent.com"):
+    def __init__(self, base_url="https://ummah-display.preview.emergentagent.com", admin_password="admin123"):
         self.base_url = base_url
         self.api_url = f"{base_url}/api"
+        self.admin_password = admin_password
+        self.session_token = None
         self.tests_run = 0
         self.tests_passed = 0
         self.failed_tests = []
@@ -34,6 +36,8 @@ class MosqueAPITester:
         """Test a single API endpoint"""
         url = f"{self.api_url}/{endpoint}"
         headers = {'Content-Type': 'application/json'}
+        if self.session_token:
+            headers['Authorization'] = f"Bearer {self.session_token}"
         
         try:
             if method == 'GET':
@@ -62,6 +66,51 @@ class MosqueAPITester:
             self.log_test(name, False, f"Exception: {str(e)}")
             return False, {}
 
+    def test_admin_session_api(self):
+        """Test password check, session token and write protection"""
+        print("\n🔐 Testing Admin Session API...")
+
+        self.test_api_endpoint(
+            "Reject Wrong Password",
+            "POST",
+            "verify-password",
+            expected_status=401,
+            data={"password": "wrong-password"}
+        )
+        self.test_api_endpoint(
+            "Reject Write Without Session",
+            "PUT",
+            "settings",
+            expected_status=401,
+            data={"mosque_name": "No Session"}
+        )
+
+        success, session = self.test_api_endpoint(
+            "Verify Password",
+            "POST",
+            "verify-password",
+            data={"password": self.admin_password}
+        )
+        if success:
+            has_token = bool(session.get('token')) and session.get('expires_at', 0) > datetime.now().timestamp()
+            self.log_test("Session Token Issued", has_token, "" if has_token else f"Response: {session}")
+            self.session_token = session.get('token')
+
+            self.session_token, token = "not-a-token", self.session_token
+            self.test_api_endpoint(
+                "Reject Forged Session",
+                "PUT",
+                "settings",
+                expected_status=401,
+                data={"mosque_name": "Forged"}
+            )
+            self.session_token = token
+
+        success, settings = self.test_api_endpoint("Get Settings Without Password", "GET", "settings")
+        if success:
+            hidden = 'admin_password' not in settings
+            self.log_test("Settings Hide Password", hidden, "" if hidden else "Settings expose admin_password")
+
     def test_prayer_times_api(self):
         """Test prayer times calculation"""
         print("\n🕌 Testing Prayer Times API...")
@@ -91,6 +140,49 @@ class MosqueAPITester:
                     else:
                         self.log_test("Iqomah Times Structure", True, "All iqomah times present")
 
+    def test_prayer_times_range_api(self):
+        """Test multi-day prayer times table"""
+        print("\n📅 Testing Prayer Times Range API...")
+        success, data = self.test_api_endpoint(
+            "Get Prayer Times Range",
+            "GET",
+            "prayer-times/range?start=2025-01-01&end=2025-12-31"
+        )
+
+        if success:
+            days = data.get('days', [])
+            if len(days) == 365 and days[0].get('date') == '2025-01-01':
+                self.log_test("Prayer Times Range Length", True, "365 days returned")
+            else:
+                self.log_test("Prayer Times Range Length", False, f"Got {len(days)} days")
+
+        self.test_api_endpoint(
+            "Reject Inverted Prayer Times Range",
+            "GET",
+            "prayer-times/range?start=2025-02-01&end=2025-01-01",
+            expected_status=400
+        )
+
+    def test_display_bundle_api(self):
+        """Test aggregated display payload"""
+        print("\n🖥️ Testing Display Bundle API...")
+        success, data = self.test_api_endpoint(
+            "Get Display Bundle",
+            "GET",
+            "display-bundle"
+        )
+
+        if success:
+            required_fields = ['version', 'prayer_times', 'timeline', 'settings', 'announcements',
+                               'quran_verses', 'financial_reports', 'weather']
+            missing_fields = [field for field in required_fields if field not in data]
+            if missing_fields:
+                self.log_test("Display Bundle Structure", False, f"Missing fields: {missing_fields}")
+            elif 'admin_password' in data['settings']:
+                self.log_test("Display Bundle Structure", False, "Settings expose admin_password")
+            else:
+                self.log_test("Display Bundle Structure", True, "All required fields present")
+
     def test_settings_api(self):
         """Test settings CRUD operations"""
         print("\n⚙️ Testing Settings API...")
@@ -223,18 +315,101 @@ class MosqueAPITester:
                 f"financial-reports/{created_report['id']}"
             )
 
+    def test_financial_ledger_api(self):
+        """Test ledger balance carry-over and rollup summary"""
+        print("\n📒 Testing Financial Ledger API...")
+
+        success, first = self.test_api_endpoint(
+            "Create Opening Ledger Entry",
+            "POST",
+            "financial-reports",
+            data={"saldo_pekan_lalu": 1000, "infaq_pekan_ini": 500, "pengeluaran": 200, "period": "Test week 1"}
+        )
+        if not success:
+            return
+
+        success, second = self.test_api_endpoint(
+            "Create Carried-Over Ledger Entry",
+            "POST",
+            "financial-reports",
+            data={"infaq_pekan_ini": 100, "pengeluaran": 50, "period": "Test week 2"}
+        )
+        if success:
+            carried = second.get('saldo_pekan_lalu') == first.get('saldo_pekan_ini')
+            self.log_test("Ledger Balance Carry-Over", carried,
+                          "" if carried else f"Expected {first.get('saldo_pekan_ini')}, got {second.get('saldo_pekan_lalu')}")
+
+            success, summary = self.test_api_endpoint(
+                "Get Financial Summary",
+                "GET",
+                "financial-reports/summary"
+            )
+            if success:
+                matches = summary.get('balance') == second.get('saldo_pekan_ini')
+                self.log_test("Summary Balance", matches, "" if matches else f"Summary: {summary}")
+
+            # Only the latest entry can be removed, so clean up newest first
+            self.test_api_endpoint("Delete Latest Ledger Entry", "DELETE", f"financial-reports/{second['id']}")
+        self.test_api_endpoint("Delete Opening Ledger Entry", "DELETE", f"financial-reports/{first['id']}")
+
+    def test_settings_views_api(self):
+        """Test hot paths load lean settings views, not the whole document"""
+        print("\n🪶 Testing Settings Views...")
+
+        # A heavy field that only the admin panel and the display should ever read
+        success, _ = self.test_api_endpoint(
+            "Store Long Address",
+            "PUT",
+            "settings",
+            data={"mosque_address": "x" * 50000}
+        )
+        if not success:
+            return
+
+        # Bytes each endpoint sends back, however large the settings document grows
+        budgets = [("GET", "prayer-times", None, 2048),
+                   ("GET", "weather", None, 4096),
+                   ("POST", "verify-password", {"password": "wrong-password"}, 512)]
+        for method, endpoint, data, budget in budgets:
+            try:
+                response = requests.request(method, f"{self.api_url}/{endpoint}", json=data, timeout=10)
+                size = len(response.content)
+                self.log_test(f"{endpoint} Response Size", size <= budget, f"{size} bytes, budget {budget}")
+            except Exception as e:
+                self.log_test(f"{endpoint} Response Size", False, f"Exception: {str(e)}")
+
+        # Bytes read from MongoDB per settings load, by view
+        success, status = self.test_api_endpoint("Get Upstream Status", "GET", "upstream-status")
+        if success:
+            reads = status.get("settings_reads", {})
+            for view in ("LocationSettings", "AuthSettings"):
+                largest = reads.get(view, {}).get("max_bytes", 0)
+                self.log_test(f"{view} Read Size", largest < 1024, f"{largest} bytes per read")
+
+        self.test_api_endpoint(
+            "Restore Address",
+            "PUT",
+            "settings",
+            data={"mosque_address": "Jl. Contoh No. 123, Kota Malang"}
+        )
+
     def run_all_tests(self):
         """Run all API tests"""
         print(f"🚀 Starting Mosque Display API Tests")
         print(f"📍 Testing against: {self.base_url}")
         print("=" * 60)
         
-        # Test all API endpoints
+        # Test all API endpoints; the session test logs in for the writes that follow
+        self.test_admin_session_api()
         self.test_prayer_times_api()
+        self.test_prayer_times_range_api()
+        self.test_display_bundle_api()
         self.test_settings_api()
         self.test_announcements_api()
         self.test_quran_verses_api()
         self.test_financial_reports_api()
+        self.test_financial_ledger_api()
+        self.test_settings_views_api()
         
         # Print summary
         print("\n" + "=" * 60)
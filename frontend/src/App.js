@@ -2,6 +2,8 @@ import { BrowserRouter, Routes, Route } from "react-router-dom";
 import DisplayView from "./pages/DisplayView";
 import AdminPanel from "./pages/AdminPanel";
 import PreviewPage from "./pages/PreviewPage";
+import "@/lib/tenant";
+import "@/lib/session";
 import "@/App.css";
 
 function App() {
@@ -0,0 +1,16 @@
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+
+// Settings store uploaded images as the SHA-256 of the file; plain URLs pass through.
+// With a width, the server redirects to the closest resized WebP/AVIF variant.
+export function mediaUrl(value, width) {
+  if (value && /^[0-9a-f]{64}$/.test(value)) {
+    const query = width ? `?w=${Math.round(width)}` : "";
+    return `${BACKEND_URL}/api/media/${value}${query}`;
+  }
+  return value;
+}
+
+// Physical pixel width of this screen, so a 4K TV and a 720p stick get different files
+export function screenPixelWidth() {
+  return window.screen.width * (window.devicePixelRatio || 1);
+}
@@ -0,0 +1,52 @@
+import axios from "axios";
+import { MOSQUE_ID } from "@/lib/tenant";
+
+// Admin session token from /verify-password, kept for this browser tab only
+const STORAGE_KEY = `adminSession:${MOSQUE_ID || "default"}`;
+export const SESSION_EXPIRED_EVENT = "admin-session-expired";
+
+function readSession() {
+  try {
+    const session = JSON.parse(sessionStorage.getItem(STORAGE_KEY));
+    if (session && session.expires_at * 1000 > Date.now()) return session;
+  } catch (error) {
+    // Unreadable entries are treated as no session
+  }
+  sessionStorage.removeItem(STORAGE_KEY);
+  return null;
+}
+
+function applySession(session) {
+  if (session) {
+    axios.defaults.headers.common["Authorization"] = `Bearer ${session.token}`;
+  } else {
+    delete axios.defaults.headers.common["Authorization"];
+  }
+}
+
+export function hasSession() {
+  return readSession() !== null;
+}
+
+export function saveSession({ token, expires_at }) {
+  const session = { token, expires_at };
+  sessionStorage.setItem(STORAGE_KEY, JSON.stringify(session));
+  applySession(session);
+}
+
+export function clearSession() {
+  sessionStorage.removeItem(STORAGE_KEY);
+  applySession(null);
+}
+
+applySession(readSession());
+
+// A rejected token ends the session; the admin panel asks for the password again
+axios.interceptors.response.use(undefined, (error) => {
+  const url = error.config?.url || "";
+  if (error.response?.status === 401 && !url.endsWith("/verify-password")) {
+    clearSession();
+    window.dispatchEvent(new Event(SESSION_EXPIRED_EVENT));
+  }
+  return Promise.reject(error);
+});
@@ -0,0 +1,16 @@
+import axios from "axios";
+
+// The mosque this screen belongs to, from ?mosque= in the page URL; the backend
+// falls back to its default mosque when none is given
+export const MOSQUE_ID = new URLSearchParams(window.location.search).get("mosque");
+
+// Query string for URLs that cannot carry headers (EventSource, links, iframes)
+export function withMosque(url) {
+  if (!MOSQUE_ID) return url;
+  const separator = url.includes("?") ? "&" : "?";
+  return `${url}${separator}mosque=${encodeURIComponent(MOSQUE_ID)}`;
+}
+
+if (MOSQUE_ID) {
+  axios.defaults.headers.common["X-Mosque-Id"] = MOSQUE_ID;
+}
@@ -8,6 +8,9 @@ import { Textarea } from "@/components/ui/textarea";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import { toast } from "sonner";
 import { Toaster } from "@/components/ui/sonner";
+import { mediaUrl } from "@/lib/media";
+import { SESSION_EXPIRED_EVENT, hasSession, saveSession } from "@/lib/session";
+import { withMosque } from "@/lib/tenant";
 import "@/styles/AdminPanel.css";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
@@ -17,13 +20,40 @@ const AdminPanel = () => {
   const [settings, setSettings] = useState(null);
   const [announcements, setAnnouncements] = useState([]);
   const [quranVerses, setQuranVerses] = useState([]);
+  const [versesCursor, setVersesCursor] = useState(null);
   const [financialReports, setFinancialReports] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [authenticated, setAuthenticated] = useState(hasSession());
+  const [password, setPassword] = useState("");
 
   useEffect(() => {
-    fetchAllData();
+    if (authenticated) fetchAllData();
+  }, [authenticated]);
+
+  useEffect(() => {
+    const handleExpired = () => {
+      setAuthenticated(false);
+      toast.error("Sesi admin berakhir, silakan masuk kembali");
+    };
+    window.addEventListener(SESSION_EXPIRED_EVENT, handleExpired);
+    return () => window.removeEventListener(SESSION_EXPIRED_EVENT, handleExpired);
   }, []);
 
+  const login = async (e) => {
+    e.preventDefault();
+    try {
+      const response = await axios.post(`${API}/verify-password`, { password });
+      saveSession(response.data);
+      setPassword("");
+      setAuthenticated(true);
+    } catch (error) {
+      setPassword("");
+      toast.error(error.response?.status === 429
+        ? "Terlalu banyak percobaan. Silakan tunggu sebentar."
+        : "Password salah. Silakan coba lagi.");
+    }
+  };
+
   const fetchAllData = async () => {
     try {
       const [settingsRes, announcementsRes, versesRes, reportsRes] = await Promise.all([
@@ -36,6 +66,7 @@ const AdminPanel = () => {
       setSettings(settingsRes.data);
       setAnnouncements(announcementsRes.data);
       setQuranVerses(versesRes.data);
+      setVersesCursor(versesRes.headers["x-next-cursor"] || null);
       setFinancialReports(reportsRes.data);
       setLoading(false);
     } catch (error) {
@@ -57,6 +88,37 @@ const AdminPanel = () => {
     }
   };
 
+  // Upload handlers: the file is streamed to the media store and settings keep its hash
+  const uploadMedia = async (e, field) => {
+    const file = e.target.files?.[0];
+    if (!file) return;
+    const toastId = toast.loading("Mengunggah file... 0%");
+
+    try {
+      const response = await axios.put(`${API}/media`, file, {
+        headers: {
+          "Content-Type": file.type || "application/octet-stream",
+          "X-Filename": encodeURIComponent(file.name)
+        },
+        onUploadProgress: (event) => {
+          if (event.total) {
+            const percent = Math.round((event.loaded / event.total) * 100);
+            toast.loading(`Mengunggah file... ${percent}%`, { id: toastId });
+          }
+        }
+      });
+      setSettings((prev) => ({...prev, [field]: response.data.hash}));
+      toast.success("File berhasil diunggah!", { id: toastId });
+    } catch (error) {
+      console.error("Error uploading file:", error);
+      const detail = error.response?.data?.detail;
+      toast.error(detail ? `Gagal mengunggah file: ${detail}` : "Gagal mengunggah file", { id: toastId });
+    }
+  };
+
+  const handleLogoUpload = (e) => uploadMedia(e, "mosque_logo");
+  const handleBackgroundUpload = (e) => uploadMedia(e, "background_image");
+
   // Announcement handlers
   const addAnnouncement = async (e) => {
     e.preventDefault();
@@ -89,6 +151,32 @@ const AdminPanel = () => {
     }
   };
 
+  // Bulk import: the file is sent as-is and the server reports rows it rejected
+  const importItems = async (e, resource) => {
+    const file = e.target.files?.[0];
+    if (!file) return;
+    const format = file.name.toLowerCase().endsWith(".csv") ? "csv" : "jsonl";
+
+    try {
+      const { data } = await axios.post(`${API}/${resource}/import`, file, {
+        params: { format },
+        headers: { "Content-Type": format === "csv" ? "text/csv" : "application/x-ndjson" }
+      });
+      const message = `${data.inserted} ditambahkan, ${data.updated} diperbarui`;
+      if (data.failed > 0) {
+        console.warn("Rejected import rows:", data.errors);
+        toast.warning(`${message}, ${data.failed} baris gagal (baris ${data.errors.slice(0, 5).map((err) => err.row).join(", ")})`);
+      } else {
+        toast.success(message);
+      }
+      fetchAllData();
+    } catch (error) {
+      console.error("Error importing:", error);
+      toast.error("Gagal mengimpor file");
+    }
+    e.target.value = "";
+  };
+
   // Quran verse handlers
   const addQuranVerse = async (e) => {
     e.preventDefault();
@@ -111,6 +199,20 @@ const AdminPanel = () => {
     }
   };
 
+  // Verses are paged by cursor so large libraries load a page at a time
+  const loadMoreVerses = async () => {
+    try {
+      const response = await axios.get(`${API}/quran-verses`, {
+        params: { active_only: false, after: versesCursor }
+      });
+      setQuranVerses((prev) => [...prev, ...response.data]);
+      setVersesCursor(response.headers["x-next-cursor"] || null);
+    } catch (error) {
+      console.error("Error loading verses:", error);
+      toast.error("Gagal memuat ayat");
+    }
+  };
+
   const deleteQuranVerse = async (id) => {
     try {
       await axios.delete(`${API}/quran-verses/${id}`);
@@ -127,11 +229,14 @@ const AdminPanel = () => {
     e.preventDefault();
     const formData = new FormData(e.target);
     const newReport = {
-      saldo_pekan_lalu: parseFloat(formData.get("saldo_pekan_lalu")),
       infaq_pekan_ini: parseFloat(formData.get("infaq_pekan_ini")),
       pengeluaran: parseFloat(formData.get("pengeluaran")),
       period: formData.get("period") || ""
     };
+    // Left empty, the balance carries over from the previous entry
+    if (formData.get("saldo_pekan_lalu")) {
+      newReport.saldo_pekan_lalu = parseFloat(formData.get("saldo_pekan_lalu"));
+    }
 
     try {
       await axios.post(`${API}/financial-reports`, newReport);
@@ -151,10 +256,41 @@ const AdminPanel = () => {
       fetchAllData();
     } catch (error) {
       console.error("Error deleting report:", error);
-      toast.error("Gagal menghapus laporan");
+      toast.error(error.response?.status === 409
+        ? "Hanya laporan terakhir yang dapat dihapus"
+        : "Gagal menghapus laporan");
     }
   };
 
+  if (!authenticated) {
+    return (
+      <div className="admin-loading" data-testid="admin-login">
+        <Toaster />
+        <Card className="admin-login-card">
+          <CardHeader>
+            <CardTitle>Akses Panel Admin</CardTitle>
+            <CardDescription>Masukkan password admin untuk melanjutkan</CardDescription>
+          </CardHeader>
+          <CardContent>
+            <form onSubmit={login} className="login-form">
+              <Input
+                type="password"
+                value={password}
+                onChange={(e) => setPassword(e.target.value)}
+                placeholder="Masukkan password"
+                autoFocus
+                data-testid="admin-login-password"
+              />
+              <Button type="submit" className="submit-btn" data-testid="admin-login-btn">
+                Masuk
+              </Button>
+            </form>
+          </CardContent>
+        </Card>
+      </div>
+    );
+  }
+
   if (loading) {
     return (
       <div className="admin-loading" data-testid="admin-loading">
@@ -172,7 +308,7 @@ const AdminPanel = () => {
         <h1 className="admin-title" data-testid="admin-title">Admin Tampilan Masjid</h1>
         <div className="header-buttons">
           <Button 
-            onClick={() => window.location.href = '/preview'}
+            onClick={() => window.location.href = withMosque('/preview')}
             data-testid="preview-btn"
             variant="outline"
           >
@@ -275,7 +411,7 @@ const AdminPanel = () => {
                   </div>
                   {settings?.mosque_logo && (
                     <div className="logo-preview">
-                      <img src={settings.mosque_logo} alt="Preview Logo" />
+                      <img src={mediaUrl(settings.mosque_logo)} alt="Preview Logo" />
                     </div>
                   )}
                 </div>
@@ -334,6 +470,20 @@ const AdminPanel = () => {
                   </select>
                 </div>
 
+                <div className="form-group">
+                  <Label htmlFor="asr_school">Mazhab Ashar</Label>
+                  <select
+                    id="asr_school"
+                    data-testid="select-asr-school"
+                    value={settings?.asr_school || "SHAFI"}
+                    onChange={(e) => setSettings({...settings, asr_school: e.target.value})}
+                    className="flex h-10 w-full rounded-md border border-input bg-background px-3 py-2 text-sm"
+                  >
+                    <option value="SHAFI">Syafi'i</option>
+                    <option value="HANAFI">Hanafi</option>
+                  </select>
+                </div>
+
                 <div className="form-group">
                   <Label htmlFor="imsya_offset">Waktu Imsya (menit sebelum Subuh)</Label>
                   <Input
@@ -567,7 +717,7 @@ const AdminPanel = () => {
                     data-testid="input-admin-password"
                     value={settings?.admin_password || ""}
                     onChange={(e) => setSettings({...settings, admin_password: e.target.value})}
-                    placeholder="Password untuk akses pengaturan dari tampilan"
+                    placeholder="Kosongkan jika tidak ingin mengganti password"
                   />
                   <span className="text-xs text-gray-500">Tekan 'S' 3x pada layar tampilan untuk akses panel admin</span>
                 </div>
@@ -613,6 +763,20 @@ const AdminPanel = () => {
                 <Button type="submit" data-testid="add-announcement-btn">Tambah Pengumuman</Button>
               </form>
 
+              <div className="import-export">
+                <Label htmlFor="import_announcements">Impor (JSONL/CSV)</Label>
+                <Input
+                  type="file"
+                  id="import_announcements"
+                  accept=".jsonl,.ndjson,.csv"
+                  onChange={(e) => importItems(e, "announcements")}
+                  data-testid="import-announcements"
+                />
+                <a href={withMosque(`${API}/announcements/export?format=csv`)} data-testid="export-announcements">Ekspor CSV</a>
+                {" · "}
+                <a href={withMosque(`${API}/announcements/export?format=jsonl`)}>Ekspor JSONL</a>
+              </div>
+
               <div className="items-list">
                 {announcements.map((ann) => (
                   <div key={ann.id} className="item-card" data-testid={`announcement-item-${ann.id}`}>
@@ -674,6 +838,20 @@ const AdminPanel = () => {
                 <Button type="submit" data-testid="add-verse-btn">Tambah Ayat</Button>
               </form>
 
+              <div className="import-export">
+                <Label htmlFor="import_verses">Impor (JSONL/CSV)</Label>
+                <Input
+                  type="file"
+                  id="import_verses"
+                  accept=".jsonl,.ndjson,.csv"
+                  onChange={(e) => importItems(e, "quran-verses")}
+                  data-testid="import-verses"
+                />
+                <a href={withMosque(`${API}/quran-verses/export?format=csv`)} data-testid="export-verses">Ekspor CSV</a>
+                {" · "}
+                <a href={withMosque(`${API}/quran-verses/export?format=jsonl`)}>Ekspor JSONL</a>
+              </div>
+
               <div className="items-list">
                 {quranVerses.map((verse) => (
                   <div key={verse.id} className="item-card" data-testid={`verse-item-${verse.id}`}>
@@ -693,6 +871,11 @@ const AdminPanel = () => {
                   </div>
                 ))}
               </div>
+              {versesCursor && (
+                <Button variant="outline" onClick={loadMoreVerses} data-testid="load-more-verses-btn">
+                  Muat Lebih Banyak
+                </Button>
+              )}
             </CardContent>
           </Card>
         </TabsContent>
@@ -714,7 +897,7 @@ const AdminPanel = () => {
                     type="number"
                     step="0.01"
                     data-testid="input-saldo-pekan-lalu"
-                    required
+                    placeholder="Kosongkan untuk memakai saldo laporan sebelumnya"
                   />
                 </div>
                 <div className="form-group">
@@ -2,6 +2,9 @@ import { useEffect, useState } from "react";
 import axios from "axios";
 import Marquee from "react-fast-marquee";
 import moment from "moment-hijri";
+import { mediaUrl, screenPixelWidth } from "@/lib/media";
+import { saveSession } from "@/lib/session";
+import { withMosque } from "@/lib/tenant";
 import "@/styles/DisplayView.css";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
@@ -20,12 +23,25 @@ const DisplayView = () => {
   const [password, setPassword] = useState("");
   const [passwordError, setPasswordError] = useState("");
   const [weather, setWeather] = useState(null);
+  const [timeline, setTimeline] = useState([]);
+  const [mediaPlaceholders, setMediaPlaceholders] = useState({});
 
   // Fetch all data
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchData, 60000); // Refresh every minute
-    return () => clearInterval(interval);
+    // Slow heartbeat: the countdown runs locally from the timeline and changes are pushed
+    const interval = setInterval(fetchData, 600000);
+
+    // Refresh immediately when the admin edits content or a prayer boundary passes
+    const events = new EventSource(withMosque(`${API}/events`));
+    ["settings", "announcements", "quran_verses", "financial_reports", "prayer"].forEach((type) =>
+      events.addEventListener(type, fetchData)
+    );
+
+    return () => {
+      clearInterval(interval);
+      events.close();
+    };
   }, []);
 
   // Update current time
@@ -44,20 +60,24 @@ const DisplayView = () => {
     }
   }, [quranVerses]);
 
-  // Calculate countdown
+  // Calculate countdown to the next adhan/iqomah from the event timeline (UTC epochs)
   useEffect(() => {
-    if (prayerTimes && prayerTimes.time_until_next !== undefined) {
+    if (timeline.length > 0) {
       const interval = setInterval(() => {
-        const now = new Date();
-        const totalSeconds = prayerTimes.time_until_next * 60 - (now.getSeconds());
+        const nowSeconds = Date.now() / 1000;
+        const next = timeline.find((event) =>
+          (event.phase === "adhan" || event.phase === "iqomah") && event.at > nowSeconds
+        );
+        if (!next) return;
+        const totalSeconds = Math.floor(next.at - nowSeconds);
         const hours = Math.floor(totalSeconds / 3600);
         const minutes = Math.floor((totalSeconds % 3600) / 60);
         const seconds = totalSeconds % 60;
-        setCountdown({ hours, minutes, seconds });
+        setCountdown({ hours, minutes, seconds, prayer: next.prayer, isIqomah: next.phase === "iqomah" });
       }, 1000);
       return () => clearInterval(interval);
     }
-  }, [prayerTimes]);
+  }, [timeline]);
 
   // Handle settings icon click (3 clicks to show password modal)
   useEffect(() => {
@@ -94,31 +114,29 @@ const DisplayView = () => {
     try {
       const response = await axios.post(`${API}/verify-password`, { password });
       if (response.data.success) {
-        window.location.href = '/admin';
+        saveSession(response.data);
+        window.location.href = withMosque('/admin');
       }
     } catch (error) {
-      setPasswordError("Password salah. Silakan coba lagi.");
+      setPasswordError(error.response?.status === 429
+        ? "Terlalu banyak percobaan. Silakan tunggu sebentar."
+        : "Password salah. Silakan coba lagi.");
       setPassword("");
     }
   };
 
   const fetchData = async () => {
     try {
-      const [timesRes, announcementsRes, versesRes, reportsRes, settingsRes, weatherRes] = await Promise.all([
-        axios.get(`${API}/prayer-times`),
-        axios.get(`${API}/announcements`),
-        axios.get(`${API}/quran-verses`),
-        axios.get(`${API}/financial-reports`),
-        axios.get(`${API}/settings`),
-        axios.get(`${API}/weather`)
-      ]);
+      const { data } = await axios.get(`${API}/display-bundle`);
 
-      setPrayerTimes(timesRes.data);
-      setAnnouncements(announcementsRes.data);
-      setQuranVerses(versesRes.data);
-      setFinancialReports(reportsRes.data);
-      setSettings(settingsRes.data);
-      setWeather(weatherRes.data);
+      setPrayerTimes(data.prayer_times);
+      setTimeline(data.timeline);
+      setAnnouncements(data.announcements);
+      setQuranVerses(data.quran_verses);
+      setFinancialReports(data.financial_reports);
+      setSettings(data.settings);
+      setWeather(data.weather);
+      setMediaPlaceholders(data.media_placeholders || {});
     } catch (error) {
       console.error("Error fetching data:", error);
     }
@@ -134,6 +152,9 @@ const DisplayView = () => {
     { name: "Isya", time: prayerTimes?.isha, iqomah: prayerTimes?.iqomah_times?.isha }
   ];
 
+  const isIqomahCountdown = countdown.isIqomah ?? prayerTimes?.is_iqomah_countdown;
+  const nextPrayer = countdown.prayer ?? prayerTimes?.next_prayer;
+
   if (!prayerTimes) {
     return (
       <div className="loading-screen" data-testid="loading-screen">
@@ -144,6 +165,12 @@ const DisplayView = () => {
   }
 
   const theme = settings?.theme || "midnight";
+
+  // The blurred placeholder sits under the full image until it has loaded
+  const backgroundLayers = settings?.background_image && [
+    `url(${mediaUrl(settings.background_image, screenPixelWidth())})`,
+    mediaPlaceholders[settings.background_image] && `url(${mediaPlaceholders[settings.background_image]})`
+  ].filter(Boolean).join(", ");
   
   return (
     <div className={`display-container theme-${theme}`} data-testid="display-container">
@@ -151,7 +178,7 @@ const DisplayView = () => {
       {settings?.background_image && (
         <div 
           className="background-overlay"
-          style={{ backgroundImage: `url(${settings.background_image})` }}
+          style={{ backgroundImage: backgroundLayers }}
         />
       )}
 
@@ -160,7 +187,7 @@ const DisplayView = () => {
         {/* Mosque Info Header */}
         <div className="mosque-info-header" data-testid="mosque-info-header">
           {settings?.mosque_logo && (
-            <img src={settings.mosque_logo} alt="Logo Masjid" className="mosque-logo" />
+            <img src={mediaUrl(settings.mosque_logo, 640)} alt="Logo Masjid" className="mosque-logo" />
           )}
           <div className="mosque-details">
             <h1 className="mosque-name">{settings?.mosque_name || "Masjid Al-Noor"}</h1>
@@ -201,10 +228,10 @@ const DisplayView = () => {
         <div className="countdown-section" data-testid="countdown-section">
           <div className="countdown-card">
             <div className="countdown-label">
-              {prayerTimes.is_iqomah_countdown ? "WAKTU IQOMAH" : "SHOLAT BERIKUTNYA"}
+              {isIqomahCountdown ? "WAKTU IQOMAH" : "SHOLAT BERIKUTNYA"}
             </div>
             <div className="next-prayer-name" data-testid="next-prayer-name">
-              {prayerTimes.next_prayer?.toUpperCase()}
+              {nextPrayer?.toUpperCase()}
             </div>
             <div className="countdown-timer" data-testid="countdown-timer">
               <span className="countdown-number">{String(countdown.hours).padStart(2, '0')}</span>
@@ -214,7 +241,7 @@ const DisplayView = () => {
               <span className="countdown-number">{String(countdown.seconds).padStart(2, '0')}</span>
             </div>
             <div className="countdown-sublabel">
-              {prayerTimes.is_iqomah_countdown ? "hingga Iqomah" : "hingga Adzan"}
+              {isIqomahCountdown ? "hingga Iqomah" : "hingga Adzan"}
             </div>
           </div>
         </div>
@@ -225,7 +252,7 @@ const DisplayView = () => {
             <div 
               key={idx}
               className={`prayer-card ${
-                prayer.name.toLowerCase() === prayerTimes.next_prayer ? 'active' : ''
+                prayer.name.toLowerCase() === nextPrayer ? 'active' : ''
               }`}
               data-testid={`prayer-card-${prayer.name.toLowerCase()}`}
             >
@@ -1,4 +1,5 @@
 import { useState, useEffect } from "react";
+import { withMosque } from "@/lib/tenant";
 import "@/styles/PreviewPage.css";
 
 const PreviewPage = () => {
@@ -31,7 +32,7 @@ const PreviewPage = () => {
         <div className="preview-admin">
           <div className="panel-label">Panel Admin</div>
           <iframe 
-            src="/admin"
+            src={withMosque("/admin")}
             title="Admin Panel"
             className="admin-iframe"
           />
@@ -42,7 +43,7 @@ const PreviewPage = () => {
           <div className="panel-label">Display Preview (4K TV)</div>
           <iframe 
             key={refreshKey}
-            src="/display"
+            src={withMosque("/display")}
             title="Display Preview"
             className="display-iframe"
           />
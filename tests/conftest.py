@@ -0,0 +1,34 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# server.py reads these at import; the client connects lazily, so unit tests need no database
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+os.environ.setdefault("SESSION_SECRET", "test-secret")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+@pytest.fixture
+def server_state(monkeypatch):
+    """server with in-memory collections and empty per-worker caches"""
+    import server
+    from tests.memory_db import MemoryCollection
+
+    collections = {
+        "settings_collection": MemoryCollection("mosque_settings"),
+        "financial_reports_collection": MemoryCollection("financial_reports", unique=[("mosque_id", "seq")]),
+        "financial_rollups_collection": MemoryCollection("financial_rollups"),
+        "content_versions_collection": MemoryCollection("content_versions"),
+        "prayer_schedules_collection": MemoryCollection("prayer_schedules"),
+    }
+    for name, collection in collections.items():
+        monkeypatch.setattr(server, name, collection)
+    monkeypatch.setattr(server, "_settings_snapshots", {})
+    monkeypatch.setattr(server, "_provisioned_mosques", set())
+    monkeypatch.setattr(server, "content_versions", {})
+    monkeypatch.setattr(server, "schedule_cache", server.ScheduleLRU(server.PRAYER_SCHEDULE_CACHE_SIZE))
+    monkeypatch.setattr(server, "_daily_records", {})
+    return server
@@ -0,0 +1,244 @@
+"""In-memory stand-ins for the motor collection calls the server makes.
+
+Only the query and update operators the server actually uses are supported.
+"""
+import copy
+import re
+
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+def _matches_value(value, condition) -> bool:
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        for op, arg in condition.items():
+            if op == "$exists":
+                if (value is not _MISSING) != arg:
+                    return False
+            elif op == "$gt":
+                if value is _MISSING or not value > arg:
+                    return False
+            elif op == "$lt":
+                if value is _MISSING or not value < arg:
+                    return False
+            elif op == "$in":
+                if value not in arg:
+                    return False
+            elif op == "$regex":
+                if not isinstance(value, str) or not re.search(arg, value):
+                    return False
+            elif op == "$not":
+                if _matches_value(value, arg):
+                    return False
+            elif op == "$type":
+                if arg == "string" and not isinstance(value, str):
+                    return False
+            else:
+                raise NotImplementedError(op)
+        return True
+    return value == condition
+
+_MISSING = object()
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif not _matches_value(doc.get(key, _MISSING), condition):
+            return False
+    return True
+
+def _equality_fields(query: dict) -> dict:
+    """Fields an upsert copies from its filter"""
+    return {key: value for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)}
+
+def _set_path(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+def _get_path(doc: dict, path: str, default=None):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return default
+        doc = doc[part]
+    return doc
+
+def project(doc: dict, projection) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    included = [key for key, value in projection.items() if value and key != "_id"]
+    if included:
+        result = {key: doc[key] for key in included if key in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {key: value for key, value in doc.items() if projection.get(key, 1)}
+
+class MemoryCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, keys, direction=None):
+        if isinstance(keys, str):
+            keys = [(keys, direction or 1)]
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda doc: doc.get(field), reverse=order < 0)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def limit(self, count):
+        self._docs = self._docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return self._docs if length is None else self._docs[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class Result:
+    def __init__(self, **counts):
+        self.__dict__.update(counts)
+
+class MemoryCollection:
+    def __init__(self, name: str = "memory", unique=()):
+        self.name = name
+        self.docs = []
+        # Each entry is a tuple of fields that must be unique together
+        self.unique = [tuple(fields) for fields in unique]
+        self._next_id = 0
+
+    def _check_unique(self, doc: dict, ignore=None):
+        for fields in self.unique:
+            key = tuple(doc.get(f) for f in fields)
+            for other in self.docs:
+                if other is not ignore and tuple(other.get(f) for f in fields) == key:
+                    raise DuplicateKeyError(f"duplicate key {key}")
+
+    def _insert(self, doc: dict):
+        doc = copy.deepcopy(doc)
+        if "_id" not in doc:
+            self._next_id += 1
+            doc["_id"] = self._next_id
+        self._check_unique(doc)
+        self.docs.append(doc)
+        return doc
+
+    def _apply_update(self, doc: dict, update: dict, inserting: bool):
+        for path, value in update.get("$set", {}).items():
+            _set_path(doc, path, copy.deepcopy(value))
+        for path, value in update.get("$inc", {}).items():
+            _set_path(doc, path, _get_path(doc, path, 0) + value)
+        if inserting:
+            for path, value in update.get("$setOnInsert", {}).items():
+                _set_path(doc, path, copy.deepcopy(value))
+
+    def _update(self, query: dict, update: dict, upsert: bool):
+        found = self._find(query)
+        if found:
+            before = copy.deepcopy(found[0])
+            self._apply_update(found[0], update, inserting=False)
+            try:
+                self._check_unique(found[0], ignore=found[0])
+            except DuplicateKeyError:
+                found[0].clear()
+                found[0].update(before)
+                raise
+            return found[0], None
+        if not upsert:
+            return None, None
+        doc = _equality_fields(query)
+        self._apply_update(doc, update, inserting=True)
+        doc = self._insert(doc)
+        return doc, doc["_id"]
+
+    def _find(self, query: dict):
+        return [doc for doc in self.docs if matches(doc, query or {})]
+
+    def find(self, query=None, projection=None, sort=None):
+        cursor = MemoryCursor([project(doc, projection) for doc in self._find(query)])
+        return cursor.sort(sort) if sort else cursor
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        docs = await self.find(query, projection, sort).to_list(None)
+        return docs[0] if docs else None
+
+    async def insert_one(self, doc: dict):
+        inserted = self._insert(doc)
+        # Like pymongo, the caller's document gains the generated _id
+        doc.setdefault("_id", inserted["_id"])
+        return Result(inserted_id=inserted["_id"])
+
+    async def insert_many(self, docs):
+        for doc in docs:
+            await self.insert_one(doc)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        doc, upserted_id = self._update(query, update, upsert)
+        return Result(matched_count=int(doc is not None and upserted_id is None),
+                      modified_count=int(doc is not None and upserted_id is None), upserted_id=upserted_id)
+
+    async def update_many(self, query: dict, update: dict):
+        found = self._find(query)
+        for doc in found:
+            self._apply_update(doc, update, inserting=False)
+        return Result(matched_count=len(found), modified_count=len(found))
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=False, sort=None):
+        doc, _ = self._update(query, update, upsert)
+        return project(doc, projection) if doc is not None else None
+
+    async def delete_one(self, query: dict):
+        found = self._find(query)
+        if found:
+            self.docs.remove(found[0])
+        return Result(deleted_count=len(found[:1]))
+
+    async def delete_many(self, query: dict):
+        found = self._find(query)
+        for doc in found:
+            self.docs.remove(doc)
+        return Result(deleted_count=len(found))
+
+    async def distinct(self, field: str, query=None):
+        values = []
+        for doc in self._find(query):
+            if field in doc and doc[field] not in values:
+                values.append(doc[field])
+        return values
+
+    async def bulk_write(self, ops, ordered=True):
+        upserted = matched = 0
+        for op in ops:
+            if isinstance(op, UpdateOne):
+                doc, upserted_id = self._update(op._filter, op._doc, op._upsert)
+                upserted += upserted_id is not None
+                matched += doc is not None and upserted_id is None
+            elif isinstance(op, ReplaceOne):
+                found = self._find(op._filter)
+                if found:
+                    replacement = copy.deepcopy(op._doc)
+                    replacement.setdefault("_id", found[0]["_id"])
+                    found[0].clear()
+                    found[0].update(replacement)
+                    matched += 1
+                elif op._upsert:
+                    self._insert({**_equality_fields(op._filter), **op._doc})
+                    upserted += 1
+            elif isinstance(op, DeleteOne):
+                await self.delete_one(op._filter)
+            else:
+                raise NotImplementedError(type(op))
+        return Result(upserted_count=upserted, matched_count=matched)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+def make_request(peer: str = "10.0.0.5", headers=None) -> Request:
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/api/verify-password",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": (peer, 50000),
+    })
+
+@pytest.fixture
+def trusted_proxies(monkeypatch):
+    import server
+    monkeypatch.setattr(server, "FORWARDED_ALLOW_IPS", {"127.0.0.1", "10.0.0.1", "10.0.0.2"})
+    return server
+
+def test_forwarded_for_from_an_untrusted_peer_is_ignored(trusted_proxies):
+    server = trusted_proxies
+    request = make_request("203.0.113.9", {"X-Forwarded-For": "198.51.100.1"})
+    assert server.client_address(request) == "203.0.113.9"
+
+def test_trusted_hops_are_walked_back_to_the_client(trusted_proxies):
+    server = trusted_proxies
+    # The client prepended a forged hop; the ingress chain appended the real one
+    request = make_request("10.0.0.1", {"X-Forwarded-For": "1.1.1.1, 198.51.100.7, 10.0.0.2"})
+    assert server.client_address(request) == "198.51.100.7"
+
+def test_trusted_peer_without_forwarding_is_the_client(trusted_proxies):
+    server = trusted_proxies
+    assert server.client_address(make_request("10.0.0.1")) == "10.0.0.1"
+
+def test_wildcard_trusts_every_hop(trusted_proxies, monkeypatch):
+    server = trusted_proxies
+    monkeypatch.setattr(server, "FORWARDED_ALLOW_IPS", {"*"})
+    request = make_request("172.16.0.3", {"X-Forwarded-For": "198.51.100.7, 172.16.0.2"})
+    assert server.client_address(request) == "198.51.100.7"
+
+def test_bucket_allows_a_burst_then_refills(monkeypatch):
+    import server
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    limiter = server.TokenBucketLimiter(capacity=3, refill_seconds=30.0, max_clients=10)
+
+    assert [limiter.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("a") == pytest.approx(30.0)
+    # Other clients have their own buckets
+    assert limiter.acquire("b") == 0.0
+
+    now[0] += 20.0
+    # Two thirds of a token back; the rejected attempt above cost nothing
+    assert limiter.acquire("a") == pytest.approx(10.0)
+    now[0] += 10.0
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("a") == pytest.approx(30.0)
+
+def test_limiter_forgets_the_least_recent_clients(monkeypatch):
+    import server
+    limiter = server.TokenBucketLimiter(capacity=1, refill_seconds=30.0, max_clients=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("c")
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("c") > 0
+
+def test_login_answers_429_with_retry_after(server_state, monkeypatch):
+    server = server_state
+    monkeypatch.setattr(server, "login_limiter", server.TokenBucketLimiter(1, 30.0, 10))
+    request = make_request("198.51.100.7")
+    data = server.PasswordVerify(password="wrong")
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.verify_password(data, request, server.DEFAULT_MOSQUE_ID))
+    assert raised.value.status_code == 401
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.verify_password(data, request, server.DEFAULT_MOSQUE_ID))
+    assert raised.value.status_code == 429
+    assert int(raised.value.headers["Retry-After"]) in (30, 31)
+
+    # The same client still gets its own attempts at another mosque
+    server._provisioned_mosques.add("al-hidayah")
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.verify_password(data, request, "al-hidayah"))
+    assert raised.value.status_code == 401
+
+def bearer(token: str) -> Request:
+    return make_request(headers={"Authorization": f"Bearer {token}"})
+
+def test_token_opens_write_endpoints_for_its_mosque():
+    import server
+    token = server.issue_admin_token("al-hidayah")["token"]
+    assert asyncio.run(server.require_admin(bearer(token), "al-hidayah")) == "al-hidayah"
+
+@pytest.mark.parametrize("claims,status,detail", [
+    ({"exp": -60}, 401, "Session expired"),
+    ({"scope": "display"}, 401, "Invalid session"),
+    ({"sub": "another-mosque"}, 403, "Session is for another mosque"),
+])
+def test_require_admin_rejects_bad_tokens(claims, status, detail):
+    import server
+    now = int(time.time())
+    payload = {"sub": "al-hidayah", "scope": "admin", "iat": now, "exp": now + 60}
+    payload.update({k: now + v if k == "exp" else v for k, v in claims.items()})
+    token = jwt.encode(payload, server.SESSION_SECRET, algorithm=server.SESSION_ALGORITHM)
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.require_admin(bearer(token), "al-hidayah"))
+    assert (raised.value.status_code, raised.value.detail) == (status, detail)
+
+def test_require_admin_rejects_foreign_signatures_and_missing_tokens():
+    import server
+    forged = jwt.encode({"sub": "al-hidayah", "scope": "admin", "exp": int(time.time()) + 60},
+                        "not-the-secret", algorithm=server.SESSION_ALGORITHM)
+    for request in (bearer(forged), make_request(), make_request(headers={"Authorization": "Basic abc"})):
+        with pytest.raises(HTTPException) as raised:
+            asyncio.run(server.require_admin(request, "al-hidayah"))
+        assert raised.value.status_code == 401
@@ -0,0 +1,42 @@
+from starlette.requests import Request
+
+from server import base_etag, content_etag, encoded_etag, not_modified_response
+
+def make_request(headers: dict) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/announcements",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    })
+
+def test_projected_list_etag_revalidates():
+    etag = content_etag("announcements", "default", True, None, 100, "text,id")
+    assert "," not in etag
+    response = not_modified_response(make_request({"If-None-Match": etag}), etag)
+    assert response is not None and response.status_code == 304
+
+def test_variants_get_distinct_etags():
+    assert content_etag("announcements", "default", True, None, 100, "text,id") != \
+        content_etag("announcements", "default", True, None, 100, "text")
+    assert content_etag("announcements", "default", True, None, 100, None) != \
+        content_etag("announcements", "default", False, None, 100, None)
+
+def test_each_coding_gets_its_own_validator():
+    etag = content_etag("settings", "default")
+    assert encoded_etag(etag, "identity") == etag
+    assert len({encoded_etag(etag, coding) for coding in ("identity", "gzip", "br")}) == 3
+    assert all(base_etag(encoded_etag(etag, coding)) == etag for coding in ("identity", "gzip", "br"))
+
+def test_not_modified_echoes_the_held_coding():
+    etag = content_etag("settings", "default")
+    held = encoded_etag(etag, "br")
+    response = not_modified_response(make_request({"If-None-Match": f'"other", W/{held}'}), etag, {"Vary": "Accept-Encoding"})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == held
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+def test_stale_coding_is_modified():
+    etag = content_etag("settings", "default")
+    stale = encoded_etag(content_etag("settings", "other-mosque"), "gzip")
+    assert not_modified_response(make_request({"If-None-Match": stale}), etag) is None
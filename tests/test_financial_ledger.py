@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+MOSQUE = "al-hidayah"
+
+def append(server, infaq: float, pengeluaran: float, entry_date: str, opening=None):
+    report = server.FinancialReportCreate(saldo_pekan_lalu=opening, infaq_pekan_ini=infaq, pengeluaran=pengeluaran)
+    return asyncio.run(server.append_ledger_entry(MOSQUE, report, entry_date))
+
+def rollup(server, period: str, key: str):
+    docs = [d for d in server.financial_rollups_collection.docs if d["_id"] == server.rollup_id(MOSQUE, period, key)]
+    return docs[0] if docs else None
+
+def test_balances_carry_over_between_entries(server_state):
+    server = server_state
+    first = append(server, 1000.0, 200.0, "2026-09-25", opening=500.0)
+    second = append(server, 300.0, 450.0, "2026-10-02")
+    third = append(server, 50.0, 0.0, "2026-10-09")
+
+    assert [e.seq for e in (first, second, third)] == [1, 2, 3]
+    assert (first.saldo_pekan_lalu, first.saldo_pekan_ini) == (500.0, 1300.0)
+    assert (second.saldo_pekan_lalu, second.saldo_pekan_ini) == (1300.0, 1150.0)
+    assert (third.saldo_pekan_lalu, third.saldo_pekan_ini) == (1150.0, 1200.0)
+
+    october = rollup(server, "month", "2026-10")
+    assert (october["infaq_total"], october["pengeluaran_total"], october["entries"]) == (350.0, 450.0, 2)
+    assert (october["opening_balance"], october["closing_balance"]) == (1300.0, 1200.0)
+    year = rollup(server, "year", "2026")
+    assert (year["entries"], year["opening_balance"], year["closing_balance"]) == (3, 500.0, 1200.0)
+
+    summary = asyncio.run(server.load_financial_summary(MOSQUE))
+    assert summary.balance == 1200.0 and summary.latest.id == third.id
+    assert summary.month.key == "2026-10" and summary.year.key == "2026"
+
+def test_append_retries_after_losing_the_seq_race(server_state, monkeypatch):
+    server = server_state
+    append(server, 100.0, 0.0, "2026-10-02")
+    collection = server.financial_reports_collection
+    insert_one = collection.insert_one
+
+    async def racing_insert(doc):
+        # Another worker appends seq 2 between our read and our insert
+        monkeypatch.setattr(collection, "insert_one", insert_one)
+        racer = server.FinancialReport(mosque_id=MOSQUE, seq=2, saldo_pekan_lalu=100.0, infaq_pekan_ini=40.0,
+                                       saldo_pekan_ini=140.0, entry_date="2026-10-02")
+        await insert_one(racer.model_dump())
+        return await insert_one(doc)
+
+    monkeypatch.setattr(collection, "insert_one", racing_insert)
+    entry = append(server, 10.0, 0.0, "2026-10-09")
+    assert entry.seq == 3
+    assert (entry.saldo_pekan_lalu, entry.saldo_pekan_ini) == (140.0, 150.0)
+    assert sorted(d["seq"] for d in collection.docs) == [1, 2, 3]
+
+def test_append_gives_up_when_the_ledger_stays_busy(server_state, monkeypatch):
+    server = server_state
+
+    async def always_taken(doc):
+        raise server.DuplicateKeyError("seq taken")
+
+    monkeypatch.setattr(server.financial_reports_collection, "insert_one", always_taken)
+    with pytest.raises(HTTPException) as raised:
+        append(server, 10.0, 0.0, "2026-10-09")
+    assert raised.value.status_code == 409
+
+def test_rollup_balances_follow_seq_not_arrival_order(server_state):
+    server = server_state
+    entries = [
+        server.FinancialReport(mosque_id=MOSQUE, seq=seq, saldo_pekan_lalu=opening, infaq_pekan_ini=infaq,
+                               saldo_pekan_ini=opening + infaq, entry_date="2026-10-02").model_dump()
+        for seq, opening, infaq in [(1, 0.0, 100.0), (2, 100.0, 50.0), (3, 150.0, 25.0)]
+    ]
+    for entry in (entries[1], entries[2], entries[0]):
+        asyncio.run(server.apply_rollups(entry))
+
+    october = rollup(server, "month", "2026-10")
+    assert (october["first_seq"], october["opening_balance"]) == (1, 0.0)
+    assert (october["last_seq"], october["closing_balance"]) == (3, 175.0)
+    assert (october["infaq_total"], october["entries"]) == (175.0, 3)
+
+def test_only_the_latest_entry_can_be_removed(server_state):
+    server = server_state
+    september = append(server, 100.0, 0.0, "2026-09-25")
+    first = append(server, 200.0, 0.0, "2026-10-02")
+    latest = append(server, 300.0, 0.0, "2026-10-09")
+
+    for report_id, status in [(first.id, 409), ("missing", 404)]:
+        with pytest.raises(HTTPException) as raised:
+            asyncio.run(server.remove_latest_ledger_entry(MOSQUE, report_id))
+        assert raised.value.status_code == status
+
+    asyncio.run(server.remove_latest_ledger_entry(MOSQUE, latest.id))
+    october = rollup(server, "month", "2026-10")
+    assert (october["entries"], october["infaq_total"], october["closing_balance"]) == (1, 200.0, 300.0)
+
+    # Removing the last entry of a month drops its rollup
+    asyncio.run(server.remove_latest_ledger_entry(MOSQUE, first.id))
+    asyncio.run(server.remove_latest_ledger_entry(MOSQUE, september.id))
+    assert rollup(server, "month", "2026-10") is None
+    assert rollup(server, "year", "2026") is None
+    assert asyncio.run(server.load_financial_summary(MOSQUE)).balance == 0.0
+
+def test_migration_numbers_reports_saved_before_the_ledger(server_state):
+    server = server_state
+    collection = server.financial_reports_collection
+    legacy = [
+        ("Utility Expenses", 3200.0, datetime(2025, 11, 14, tzinfo=timezone.utc)),
+        ("Monthly Donations", 25450.0, datetime(2025, 11, 7, tzinfo=timezone.utc)),
+        ("Zakat Collection", 18750.0, datetime(2025, 12, 1, tzinfo=timezone.utc)),
+    ]
+    for title, amount, created_at in legacy:
+        collection.docs.append({"_id": title, "id": title, "mosque_id": MOSQUE, "title": title,
+                                "amount": amount, "period": "November 2025", "created_at": created_at})
+
+    asyncio.run(server.migrate_financial_ledger())
+
+    by_seq = sorted(collection.docs, key=lambda doc: doc["seq"])
+    assert [doc["title"] for doc in by_seq] == ["Monthly Donations", "Utility Expenses", "Zakat Collection"]
+    assert [doc["entry_date"] for doc in by_seq] == ["2025-11-07", "2025-11-14", "2025-12-01"]
+    assert all(doc[field] == 0.0 for doc in by_seq for field in server.LEDGER_AMOUNT_FIELDS)
+    assert rollup(server, "month", "2025-11")["entries"] == 2
+    assert rollup(server, "year", "2025")["entries"] == 3
+
+    # The ledger carries on from the migrated entries
+    entry = append(server, 500.0, 100.0, "2026-01-02")
+    assert (entry.seq, entry.saldo_pekan_lalu, entry.saldo_pekan_ini) == (4, 0.0, 400.0)
+    assert asyncio.run(server.load_financial_summary(MOSQUE)).balance == 400.0
+
+    # Running again leaves numbered entries alone
+    asyncio.run(server.migrate_financial_ledger())
+    assert sorted(doc["seq"] for doc in collection.docs) == [1, 2, 3, 4]
@@ -0,0 +1,150 @@
+import asyncio
+from datetime import datetime, timezone
+
+from pymongo import ReplaceOne
+from starlette.requests import Request
+
+from server import (
+    ANNOUNCEMENT_SORT, Announcement, AnnouncementCreate, QuranVerse, QuranVerseCreate,
+    export_response, import_documents, iter_import_rows
+)
+
+def body_request(*chunks: bytes) -> Request:
+    """A request whose body arrives in the given chunks"""
+    messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        return messages.pop(0)
+
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": []}, receive)
+
+def parse(fmt: str, *chunks: bytes) -> list:
+    async def collect():
+        return [row async for row in iter_import_rows(body_request(*chunks), fmt)]
+    return asyncio.run(collect())
+
+class MemoryCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self._docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class MemoryCollection:
+    """Just the find and bulk_write surface the import and export paths use"""
+
+    def __init__(self):
+        self.docs = []
+
+    def find(self, query, projection=None):
+        matches = [dict(doc) for doc in self.docs if all(doc.get(k) == v for k, v in query.items())]
+        return MemoryCursor(matches)
+
+    async def bulk_write(self, ops, ordered=True):
+        upserted = matched = 0
+        for op in ops:
+            assert isinstance(op, ReplaceOne)
+            doc = op._doc
+            existing = [i for i, d in enumerate(self.docs) if all(d.get(k) == v for k, v in op._filter.items())]
+            if existing:
+                self.docs[existing[0]] = doc
+                matched += 1
+            else:
+                self.docs.append(doc)
+                upserted += 1
+        return type("Result", (), {"upserted_count": upserted, "matched_count": matched})()
+
+async def read_body(response) -> bytes:
+    return b"".join([chunk if isinstance(chunk, bytes) else chunk.encode() async for chunk in response.body_iterator])
+
+def test_csv_quoted_newlines_stay_in_one_record():
+    rows = parse("csv", b'text,priority\n"first line\nsecond line",2\nplain,1\n')
+    assert rows == [(1, {"text": "first line\nsecond line", "priority": "2"}), (2, {"text": "plain", "priority": "1"})]
+
+def test_csv_escaped_quotes_and_commas():
+    rows = parse("csv", b'text\n"say ""salam"", then, wait"\n')
+    assert rows == [(1, {"text": 'say "salam", then, wait'})]
+
+def test_byte_order_mark_is_dropped():
+    assert parse("csv", b"\xef\xbb\xbftext\nhello\n") == [(1, {"text": "hello"})]
+    assert parse("jsonl", b'\xef\xbb\xbf{"text": "hello"}\n') == [(1, {"text": "hello"})]
+
+def test_crlf_line_endings():
+    rows = parse("csv", b'text,priority\r\n"a\r\nb",3\r\nplain,1\r\n')
+    assert rows == [(1, {"text": "a\r\nb", "priority": "3"}), (2, {"text": "plain", "priority": "1"})]
+    assert parse("jsonl", b'{"text": "a"}\r\n{"text": "b"}\r\n') == [(1, {"text": "a"}), (2, {"text": "b"})]
+
+def test_chunks_split_inside_characters_and_records():
+    body = 'text\n"سلام\nعليكم"\n'.encode("utf-8")
+    chunks = [body[i:i + 3] for i in range(0, len(body), 3)]
+    assert parse("csv", *chunks) == [(1, {"text": "سلام\nعليكم"})]
+
+def test_unterminated_quote_is_reported():
+    rows = parse("csv", b'text\nok\n"never closed\nmore\n')
+    assert rows[0] == (1, {"text": "ok"})
+    row_number, error = rows[1]
+    assert row_number == 2 and isinstance(error, ValueError)
+    assert "Unterminated" in str(error)
+
+def test_jsonl_errors_are_per_row():
+    rows = parse("jsonl", b'{"text": "a"}\n\nnot json\n[1, 2]\n{"text": "b"}\n')
+    assert rows[0] == (1, {"text": "a"})
+    assert isinstance(rows[1][1], ValueError) and rows[1][0] == 2
+    assert isinstance(rows[2][1], ValueError) and rows[2][0] == 3
+    assert rows[3] == (4, {"text": "b"})
+
+def test_import_reports_invalid_rows_and_keeps_the_rest():
+    collection = MemoryCollection()
+    request = body_request(b'text,priority\nfine,2\n,3\nalso fine,x\n')
+    summary = asyncio.run(import_documents(request, "csv", AnnouncementCreate, Announcement, collection, "masjid"))
+    assert summary["inserted"] == 1 and summary["failed"] == 2
+    assert [error["row"] for error in summary["errors"]] == [2, 3]
+    assert collection.docs[0]["text"] == "fine" and collection.docs[0]["mosque_id"] == "masjid"
+
+def round_trip(fmt: str, model, create_model, docs: list, sort) -> MemoryCollection:
+    source = MemoryCollection()
+    source.docs = [model(**doc, mosque_id="masjid").model_dump() for doc in docs]
+    exported = asyncio.run(read_body(export_response(source, {"mosque_id": "masjid"}, sort, model, fmt, "export")))
+
+    target = MemoryCollection()
+    summary = asyncio.run(import_documents(body_request(exported), fmt, create_model, model, target, "masjid"))
+    assert summary["failed"] == 0, summary["errors"]
+    assert summary["inserted"] == len(docs)
+
+    # Importing the same export again only replaces what is there
+    summary = asyncio.run(import_documents(body_request(exported), fmt, create_model, model, target, "masjid"))
+    assert summary["updated"] == len(docs) and summary["inserted"] == 0
+    assert sorted(target.docs, key=lambda doc: doc["id"]) == sorted(source.docs, key=lambda doc: doc["id"])
+    return target
+
+def test_export_import_round_trip():
+    created_at = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+    announcements = [
+        {"text": 'Kajian "Tafsir", ba\'da Maghrib\nBring a notebook', "priority": 3, "created_at": created_at},
+        {"text": "Jumu'ah at 12:00", "priority": 1, "active": False, "created_at": created_at},
+    ]
+    verses = [{
+        "arabic": "إِنَّ مَعَ الْعُسْرِ يُسْرًا",
+        "translation": "Indeed, with hardship comes ease.",
+        "reference": "Surah Ash-Sharh 94:6",
+        "created_at": created_at,
+    }]
+    for fmt in ("jsonl", "csv"):
+        round_trip(fmt, Announcement, AnnouncementCreate, announcements, ANNOUNCEMENT_SORT)
+        round_trip(fmt, QuranVerse, QuranVerseCreate, verses, [("created_at", 1), ("id", 1)])
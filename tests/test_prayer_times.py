@@ -0,0 +1,120 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from server import compute_prayer_times_batch, format_prayer_times
+
+TOLERANCE_MINUTES = 2
+
+# name -> (latitude, longitude, UTC offset in hours)
+LOCATIONS = {
+    "Malang": (-7.9666, 112.6326, 7),
+    "Makkah": (21.4225, 39.8262, 3),
+    "Cairo": (30.0444, 31.2357, 2),
+    "Karachi": (24.8607, 67.0011, 5),
+    "Tehran": (35.6892, 51.3890, 3.5),
+    "New York": (40.7128, -74.0060, -5),
+    "London": (51.5074, -0.1278, 1),
+}
+
+# Fajr, sunrise, Dhuhr, Asr (Shafi), Maghrib and Isha from NOAA solar
+# calculations at each method's twilight angles, rounded to the minute
+REFERENCE_TIMES = [
+    ("ISNA", "New York", "2026-01-15", "05:57 07:18 12:05 14:34 16:53 18:14"),
+    ("ISNA", "New York", "2026-06-21", "02:45 04:25 11:58 15:58 19:30 21:11"),
+    ("ISNA", "Malang", "2026-01-15", "04:20 05:23 11:39 15:03 17:55 18:57"),
+    ("ISNA", "Malang", "2026-06-21", "04:39 05:42 11:31 14:52 17:21 18:23"),
+    ("MWL", "Malang", "2026-01-15", "04:07 05:23 11:39 15:03 17:55 19:06"),
+    ("MWL", "Malang", "2026-06-21", "04:26 05:42 11:31 14:52 17:21 18:32"),
+    ("MWL", "Cairo", "2026-01-15", "05:28 06:52 12:04 14:58 17:17 18:37"),
+    ("MWL", "Cairo", "2026-06-21", "03:18 04:55 11:57 15:32 18:59 20:30"),
+    ("EGYPTIAN", "Cairo", "2026-01-15", "05:20 06:52 12:04 14:58 17:17 18:39"),
+    ("EGYPTIAN", "Cairo", "2026-06-21", "03:08 04:55 11:57 15:32 18:59 20:33"),
+    ("EGYPTIAN", "Malang", "2026-01-15", "04:00 05:23 11:39 15:03 17:55 19:08"),
+    ("EGYPTIAN", "Malang", "2026-06-21", "04:20 05:42 11:31 14:52 17:21 18:34"),
+    ("KARACHI", "Karachi", "2026-01-15", "05:58 07:19 12:41 15:44 18:04 19:25"),
+    ("KARACHI", "Karachi", "2026-06-21", "04:14 05:43 12:34 15:55 19:24 20:54"),
+    ("KARACHI", "Makkah", "2026-01-15", "05:43 07:01 12:30 15:38 17:59 19:18"),
+    ("KARACHI", "Makkah", "2026-06-21", "04:14 05:40 12:22 15:42 19:05 20:31"),
+    ("MAKKAH", "Makkah", "2026-01-15", "05:41 07:01 12:30 15:38 17:59 19:29"),
+    ("MAKKAH", "Makkah", "2026-06-21", "04:11 05:40 12:22 15:42 19:05 20:35"),
+    ("MAKKAH", "Malang", "2026-01-15", "04:05 05:23 11:39 15:03 17:55 19:25"),
+    ("MAKKAH", "Malang", "2026-06-21", "04:24 05:42 11:31 14:52 17:21 18:51"),
+    ("TEHRAN", "Tehran", "2026-01-15", "05:45 07:14 12:14 14:55 17:34 18:24"),
+    ("TEHRAN", "Tehran", "2026-06-21", "03:02 04:49 12:06 15:55 19:45 20:44"),
+    ("TEHRAN", "Cairo", "2026-01-15", "05:29 06:52 12:04 14:58 17:36 18:22"),
+    ("TEHRAN", "Cairo", "2026-06-21", "03:19 04:55 11:57 15:32 19:19 20:12"),
+]
+
+# Asr when the shadow is twice the object's length
+HANAFI_ASR_TIMES = [
+    ("Malang", "2026-01-15", "16:08"),
+    ("Malang", "2026-06-21", "15:43"),
+    ("Karachi", "2026-01-15", "16:29"),
+    ("Karachi", "2026-06-21", "17:17"),
+    ("New York", "2026-01-15", "15:13"),
+    ("New York", "2026-06-21", "17:12"),
+]
+
+def minutes(clock: str) -> int:
+    hours, mins = clock.split(":")
+    return int(hours) * 60 + int(mins)
+
+def assert_close(actual: str, expected: str, label: str):
+    diff = abs(minutes(actual) - minutes(expected))
+    assert min(diff, 1440 - diff) <= TOLERANCE_MINUTES, f"{label}: {actual} != {expected}"
+
+def clock_times(day: str, place: str, method: str, asr_school: str = "SHAFI") -> dict:
+    latitude, longitude, offset = LOCATIONS[place]
+    times = compute_prayer_times_batch(date.fromisoformat(day), latitude, longitude, offset, method, asr_school)
+    return {name: str(format_prayer_times(value)) for name, value in times.items()}
+
+@pytest.mark.parametrize("method,place,day,expected", REFERENCE_TIMES)
+def test_matches_reference_times(method, place, day, expected):
+    times = clock_times(day, place, method)
+    for name, clock in zip(["fajr", "sunrise", "dhuhr", "asr", "maghrib", "isha"], expected.split()):
+        assert_close(times[name], clock, f"{method} {place} {day} {name}")
+
+@pytest.mark.parametrize("place,day,expected", HANAFI_ASR_TIMES)
+def test_hanafi_asr_matches_reference(place, day, expected):
+    assert_close(clock_times(day, place, "MWL", "HANAFI")["asr"], expected, f"{place} {day} asr")
+
+def test_asr_school_only_moves_asr():
+    shafi = clock_times("2026-03-20", "Malang", "MWL", "SHAFI")
+    hanafi = clock_times("2026-03-20", "Malang", "MWL", "HANAFI")
+    assert minutes(hanafi["asr"]) > minutes(shafi["asr"])
+    assert {k: v for k, v in shafi.items() if k != "asr"} == {k: v for k, v in hanafi.items() if k != "asr"}
+
+def test_makkah_isha_is_ninety_minutes_after_maghrib():
+    times = clock_times("2026-06-21", "Makkah", "MAKKAH")
+    assert minutes(times["isha"]) - minutes(times["maghrib"]) == 90
+
+def test_unknown_method_falls_back_to_isna():
+    assert clock_times("2026-01-15", "Malang", "UNKNOWN") == clock_times("2026-01-15", "Malang", "ISNA")
+
+def test_high_latitude_caps_twilight_at_night_portion():
+    # 18 degrees of twilight never ends in London around the June solstice
+    latitude, longitude, offset = LOCATIONS["London"]
+    times = compute_prayer_times_batch(date(2026, 6, 21), latitude, longitude, offset, "MWL")
+    assert not np.isnan(times["fajr"]) and not np.isnan(times["isha"])
+
+    night = (times["sunrise"] - times["sunset"]) % 24.0
+    assert times["sunrise"] - times["fajr"] == pytest.approx(18.0 / 60.0 * night)
+    assert times["isha"] - times["sunset"] == pytest.approx(17.0 / 60.0 * night)
+    clock = {name: str(format_prayer_times(value)) for name, value in times.items()}
+    assert (clock["fajr"], clock["isha"]) == ("02:31", "23:27")
+
+def test_batch_broadcasts_dates_against_locations():
+    days = np.arange(np.datetime64("2026-01-01"), np.datetime64("2026-01-08"))[:, None]
+    places = ["Malang", "Cairo", "New York"]
+    latitudes, longitudes, offsets = (np.array([LOCATIONS[p][i] for p in places]) for i in range(3))
+    methods = np.array(["MWL", "EGYPTIAN", "ISNA"])
+    table = compute_prayer_times_batch(days, latitudes, longitudes, offsets, methods)
+
+    assert table["fajr"].shape == (7, 3)
+    for row, day in enumerate(days[:, 0]):
+        for col, place in enumerate(places):
+            single = compute_prayer_times_batch(day, latitudes[col], longitudes[col], offsets[col], methods[col])
+            for name, values in table.items():
+                assert values[row, col] == pytest.approx(float(single[name]))
@@ -0,0 +1,85 @@
+import asyncio
+
+import bcrypt
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+def make_request(headers=None) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/settings",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    })
+
+def provision(server, mosque_id: str, password: str):
+    server.settings_collection.docs.append({
+        "mosque_id": mosque_id,
+        "mosque_name": f"Masjid {mosque_id}",
+        "admin_password": bcrypt.hashpw(password.encode(), bcrypt.gensalt(4)).decode(),
+    })
+
+def test_unprovisioned_mosque_is_not_found(server_state):
+    server = server_state
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.get_mosque_id(make_request(), "made-up"))
+    assert raised.value.status_code == 404
+
+def test_default_and_provisioned_mosques_resolve(server_state):
+    server = server_state
+    provision(server, "al-hidayah", "s3cret")
+    assert asyncio.run(server.get_mosque_id(make_request(), None)) == server.DEFAULT_MOSQUE_ID
+    assert asyncio.run(server.get_mosque_id(make_request({"X-Mosque-Id": "al-hidayah"}), None)) == "al-hidayah"
+
+def test_settings_of_unprovisioned_mosques_are_never_cached(server_state):
+    server = server_state
+    for i in range(50):
+        asyncio.run(server.load_settings_view(f"made-up-{i}", server.MosqueSettings))
+    assert server._settings_snapshots == {}
+
+def test_seeding_with_a_version_bump_replaces_cached_defaults(server_state):
+    server = server_state
+    mosque_id = server.DEFAULT_MOSQUE_ID
+    before = asyncio.run(server.load_settings_view(mosque_id, server.AuthSettings))
+    assert server.check_password("admin123", before.admin_password)
+
+    # What seed_data.py does: store the settings, then bump the shared counters
+    provision(server, mosque_id, "s3cret")
+    server.apply_content_versions({"epoch": "seed", "tenants": {mosque_id: {"settings": 1}}})
+
+    after = asyncio.run(server.load_settings_view(mosque_id, server.AuthSettings))
+    assert server.check_password("s3cret", after.admin_password)
+    assert not server.check_password("admin123", after.admin_password)
+
+def test_one_broken_mosque_does_not_stop_the_rollover(server_state, monkeypatch):
+    server = server_state
+    # Keep the year-ahead precompute out of this test
+    monkeypatch.setattr(server, "PRAYER_SCHEDULE_DAYS", 1)
+    malang = {"latitude": -7.9666, "longitude": 112.6326, "timezone": "Asia/Jakarta"}
+    server.settings_collection.docs += [
+        {"mosque_id": server.DEFAULT_MOSQUE_ID, **malang},
+        {"mosque_id": "bad-timezone", **malang, "latitude": -7.5, "timezone": "Mars/Olympus_Mons"},
+        {"mosque_id": "bad-times", **malang, "use_manual_times": True, "manual_prayer_times": {"fajr": "dawn"}},
+    ]
+
+    async def refresh():
+        tenants = await server.refresh_daily_records()
+        await asyncio.gather(*server._background_tasks)
+        return tenants
+
+    tenants = asyncio.run(refresh())
+    assert [t["mosque_id"] for t in tenants] == [server.DEFAULT_MOSQUE_ID]
+    assert len(server._daily_records) == 1
+
+@pytest.mark.parametrize("update,detail", [
+    ({"timezone": "Mars/Olympus_Mons"}, "Unknown timezone"),
+    ({"manual_prayer_times": {"fajr": "04:30", "isha": "7pm"}}, "isha"),
+    ({"manual_prayer_times": {"dhuhr": "24:00"}}, "dhuhr"),
+])
+def test_settings_reject_values_the_rollover_cannot_use(server_state, update, detail):
+    server = server_state
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.update_settings(server.MosqueSettingsUpdate(**update), server.DEFAULT_MOSQUE_ID))
+    assert raised.value.status_code == 400 and detail in raised.value.detail
+    assert server.settings_collection.docs == []